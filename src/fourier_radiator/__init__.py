@@ -10,6 +10,8 @@ from .opencl_env import OpenCLEnvironment
 from .compiler import KernelCompiler
 from .particle import ParticleProcessor
 from .data_manager import RadiationDataManager
+from .track_store import TrackStore
 
 __all__ = ["FourierRadiator", "RadiationConfig", "OpenCLEnvironment",
-              "KernelCompiler", "ParticleProcessor", "RadiationDataManager"]
+              "KernelCompiler", "ParticleProcessor", "RadiationDataManager",
+              "TrackStore"]
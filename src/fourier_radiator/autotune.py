@@ -0,0 +1,209 @@
+"""Per-device auto-tuning of the work-group size and omega blocking, with a JSON cache."""
+
+import copy
+import json
+import os
+import time
+
+import numpy as np
+
+try:
+    import pyopencl as cl
+except ImportError:
+    cl = None
+
+from .compiler import KernelCompiler, default_cache_dir
+from .data_manager import RadiationDataManager
+from .device_pool import DeviceWorker
+from .particle import ParticleProcessor
+
+WGS_CANDIDATES = (32, 64, 128, 256, 512, 1024)
+# kernel -> (编译期分块参数, 候选值)；其余 kernel 只调工作组大小
+BLOCK_CANDIDATES = {
+    'total': ('nodesPerItem', (1, 2, 4, 8)),
+    'total_recurrence': ('omegaBlock', (4, 8, 16, 32)),
+}
+
+
+def autotune_cache_file(Args):
+    if Args['autotuneCache'] is not None:
+        return Args['autotuneCache']
+    return os.path.join(Args['kernelCacheDir'] or default_cache_dir(), 'autotune.json')
+
+
+def device_key(env):
+    dev = env.get_context().devices[0]
+    return f"{dev.platform.name.strip()} | {dev.name.strip()} | {dev.driver_version}"
+
+
+def _bucket(n):
+    """不小于 n 的 2 的幂"""
+    return 1 << max(int(n) - 1, 0).bit_length()
+
+
+def tuning_key(config):
+    """
+    候选的工作组大小与分块参数取决于网格（nOmega 与方向数），键中包含两者向上取到 2 的幂的档位：
+    同一档内候选相同，小网格上的结果不会用到大得多的网格上
+    """
+    Args = config.get_args()
+    nOmega = Args['gridNodeNums'][0]
+    nDirections = Args['numGridNodes'] // nOmega
+    return (f"{Args['mode']}/{Args['dtype']}/{config.kernel_variant()}"
+            f"/{_bucket(nOmega)}x{_bucket(nDirections)}")
+
+
+class TuningCache:
+    """
+    JSON 文件 {device_key: {tuning_key: {'WGS': ..., 'nodesPerItem': ..., ...}}}；
+    写入时重新读取再合并，先写临时文件再 os.replace
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def _read(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def get(self, device, key):
+        return self._read().get(device, {}).get(key)
+
+    def put(self, device, key, entry):
+        data = self._read()
+        data.setdefault(device, {})[key] = entry
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            tmp = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp, 'w') as f:
+                json.dump(data, f, indent=1, sort_keys=True)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            print(f"[AutoTuner] Could not write tuning cache: {e}")
+
+
+class AutoTuner:
+    """
+    在当前设备上对 process_track 实际使用的 kernel 逐一测试工作组大小与分块参数的组合：
+    合成一条慢速螺旋轨迹（n_steps 步，每步相位不超过 0.5 弧度，所有网格节点都参与累加），
+    每个组合预热一次后取 repeat 次的最短时间。fixed 中的参数不参与调优
+    """
+
+    def __init__(self, config, env, src_path, fixed=None, n_steps=256, repeat=3):
+        self.env = env
+        self.src_path = src_path
+        self.fixed = dict(fixed or {})
+        self.n_steps = int(n_steps)
+        self.repeat = int(repeat)
+        self.results = []
+
+        # 调优用的配置副本：时间步与屏幕距离由网格决定，不影响调用方
+        self.config = copy.copy(config)
+        self.config.Args = Args = dict(config.get_args())
+        Args['timeStep'] = config.get_phase_dtype()(0.5 / (2 * np.pi * np.abs(Args['omega']).max()))
+        if Args['mode'] == 'near':
+            Args['L_screen'] = 10. * (np.abs(Args['radius']).max() + 1.)
+        self.variant = self.config.kernel_variant()
+
+    def _tracks(self):
+        Args = self.config.get_args()
+        t = np.arange(self.n_steps) * float(Args['timeStep'])
+        ux, uy = 0.1 * np.cos(t), 0.1 * np.sin(t)
+        uz = np.full_like(t, 0.1)
+        g = np.sqrt(1 + ux**2 + uy**2 + uz**2)
+        x, y, z = (np.cumsum(u / g) * Args['timeStep'] for u in (ux, uy, uz))
+        return [[x, y, z, ux, uy, uz, 1.0, 0]] * max(int(Args['batchSize']), 1)
+
+    def _work_items(self, block):
+        Args = self.config.get_args()
+        nOmega = Args['gridNodeNums'][0]
+        return Args['numGridNodes'] // nOmega * -(-nOmega // block)
+
+    def _wgs_candidates(self, program, n_items):
+        device = self.env.get_context().devices[0]
+        kernel = cl.Kernel(program, self.variant)
+        limit = min(device.max_work_group_size,
+                    kernel.get_work_group_info(cl.kernel_work_group_info.WORK_GROUP_SIZE, device))
+        itemsize = np.dtype(self.config.get_dtype()).itemsize
+        if self.variant in ('total_tiled', 'total_comps_tiled'):
+            # 两块 local memory：位置 WGS 个、速度 WGS+1 个 4 分量向量
+            limit = min(limit, device.local_mem_size // (8 * itemsize) - 1)
+        elif self.variant == 'total_direction':
+            # 推迟时间 WGS 个、振幅 WGS 个 4 分量向量；工作组不超过一个方向上的频率数
+            limit = min(limit, device.local_mem_size // (5 * itemsize))
+            n_items = self.config.get_args()['gridNodeNums'][0]
+
+        if 'WGS' in self.fixed:
+            return [int(self.fixed['WGS'])]
+        # 工作组不小于 work-item 总数时 compute_wgs 结果都相同，只保留最小的一个
+        wgs = []
+        for size in WGS_CANDIDATES:
+            if size <= limit:
+                wgs.append(size)
+                if size >= n_items:
+                    break
+        return wgs or [int(limit)]
+
+    def _block_candidates(self):
+        if self.variant not in BLOCK_CANDIDATES:
+            return None, [None]
+        name, values = BLOCK_CANDIDATES[self.variant]
+        if name in self.fixed:
+            return name, [int(self.fixed[name])]
+        # 块不小于 nOmega 时结果都相同，只保留最小的一个
+        nOmega = self.config.get_args()['gridNodeNums'][0]
+        blocks = [v for v in values if v < nOmega]
+        blocks += [v for v in values if v >= nOmega][:1]
+        return name, blocks
+
+    def _build(self, name, block):
+        Args = self.config.get_args()
+        omega_block = block if name == 'omegaBlock' else Args['omegaBlock']
+        nodes_per_item = block if name == 'nodesPerItem' else 1
+        compiler = KernelCompiler(Args['mode'], Args['dtype'], self.env.get_context(), self.src_path,
+                                  omega_block=omega_block, nodes_per_item=nodes_per_item,
+                                  cache_dir=Args['kernelCacheDir'], use_cache=Args['kernelCache'],
+                                  cache_size=Args['kernelCacheSize'])
+        processor = ParticleProcessor(self.config, self.env, compiler.program,
+                                      compiler.omega_block, compiler.nodes_per_item)
+        return DeviceWorker(self.config, self.env, compiler, processor,
+                            RadiationDataManager(self.config, self.env))
+
+    def _time(self, worker, tracks):
+        weights = np.ones(len(tracks))
+        worker.prepare(worker.dtype(0), np.uint32(1), None)
+        worker.process(tracks, weights, 1, None)  # 预热
+        worker.finish()
+        best = np.inf
+        for _ in range(self.repeat):
+            t0 = time.perf_counter()
+            worker.process(tracks, weights, 1, None)
+            worker.finish()
+            best = min(best, time.perf_counter() - t0)
+        return best
+
+    def run(self):
+        """返回最快的参数 {'WGS': ..., <分块参数>: ..., 'seconds': ..., ...}，全部结果在 self.results"""
+        tracks = self._tracks()
+        name, blocks = self._block_candidates()
+        saved_wgs = self.env.WGS
+        self.results = []
+        try:
+            for block in blocks:
+                worker = self._build(name, block)
+                n_items = self._work_items(block or 1)
+                for wgs in self._wgs_candidates(worker.compiler.program, n_items):
+                    self.env.WGS = wgs
+                    params = {'WGS': wgs} if name is None else {'WGS': wgs, name: block}
+                    self.results.append(dict(params, seconds=self._time(worker, tracks)))
+                worker.data_mgr.get_data()['radiation'].clear()
+        finally:
+            self.env.WGS = saved_wgs
+
+        best = min(self.results, key=lambda r: r['seconds'])
+        Args = self.config.get_args()
+        return dict(best, grid=list(Args['gridNodeNums']), steps=self.n_steps,
+                    tuned=time.strftime('%Y-%m-%dT%H:%M:%S'))
@@ -0,0 +1,73 @@
+"""Per-rank checkpoints of partial spectra for resumable runs."""
+
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+
+
+class Checkpoint:
+    """
+    每个 rank 一个文件 {path}/rank{rank:05d}.npz，保存：
+        spectrum_<key>  设备布局 (nSnaps, nPhi, nTheta, nOmega) 的部分谱（各设备已求和）
+        total_weight    已处理轨迹的权重和
+        processed       已处理轨迹在 particleTracks[:Np] 中的下标
+        signature       计算参数（JSON），恢复时必须一致
+    写入先到临时文件再 os.replace，中途被杀掉也不会留下半个文件
+    """
+
+    def __init__(self, path, rank, size, signature):
+        self.path = Path(path)
+        self.rank = rank
+        self.size = size
+        self.signature = json.dumps(signature, sort_keys=True)
+        self._absorbed = []  # load() 读入的文件
+
+    def _file(self, rank):
+        return self.path / f'rank{rank:05d}.npz'
+
+    def save(self, spectra, total_weight, processed):
+        self.path.mkdir(parents=True, exist_ok=True)
+        target = self._file(self.rank)
+        tmp = target.with_name(target.name + f'.{os.getpid()}.tmp')
+        with open(tmp, 'wb') as f:
+            np.savez(f, total_weight=np.double(total_weight),
+                     processed=np.asarray(processed, dtype=np.int64),
+                     signature=np.array(self.signature),
+                     **{f'spectrum_{key}': arr for key, arr in spectra.items()})
+        os.replace(tmp, target)
+
+        # 恢复时并入本文件的其他 rank 的文件（rank 数变化时）已经包含在内，删除以免重复计入
+        for file in self._absorbed:
+            if file != target:
+                file.unlink(missing_ok=True)
+        self._absorbed = []
+
+    def load(self, own_only=False):
+        """
+        读入本 rank 负责的文件：own_only 时只有自己的，否则为编号 % size == rank 的全部
+        （所以可以用不同的 rank 数恢复）。返回 (spectra, total_weight, processed)，没有文件时返回 None
+        """
+        if own_only:
+            files = [self._file(self.rank)]
+        else:
+            files = [f for f in sorted(self.path.glob('rank*.npz'))
+                     if int(f.stem[4:]) % self.size == self.rank]
+        files = [f for f in files if f.exists()]
+        if not files:
+            return None
+
+        spectra, total_weight, processed = {}, 0., []
+        for file in files:
+            with np.load(file) as data:
+                if str(data['signature']) != self.signature:
+                    raise ValueError(f"Checkpoint {file} was written with different parameters")
+                for name in data.files:
+                    if name.startswith('spectrum_'):
+                        key = name[len('spectrum_'):]
+                        spectra[key] = spectra[key] + data[name] if key in spectra else data[name]
+                total_weight += float(data['total_weight'])
+                processed.append(data['processed'])
+        self._absorbed = files
+        return spectra, total_weight, np.concatenate(processed)
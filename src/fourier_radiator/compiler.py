@@ -1,27 +1,195 @@
+import hashlib
+import os
+import struct
+import weakref
+from collections import OrderedDict
+
 from mako.template import Template
-import pyopencl as cl
+
+try:
+    import pyopencl as cl
+except ImportError:
+    cl = None
+
+# 进程内缓存，多个 FourierRadiator 实例共享：
+# (源码哈希, context) -> Program，弱引用，不让 Program 及其 context 比使用它的实例活得更久；
+# 源码哈希 -> 二进制（新建的 context 也能直接用），只保留最近用到的 BINARY_CACHE_SIZE 个
+_program_cache = weakref.WeakValueDictionary()
+_binary_cache = OrderedDict()
+BINARY_CACHE_SIZE = 32
+
+# 缓存命中统计：memory / disk 命中与重新编译的次数
+cache_stats = {'memory': 0, 'disk': 0, 'build': 0}
+
+
+def default_cache_dir():
+    return os.environ.get('FOURIER_RADIATOR_CACHE',
+                          os.path.join(os.path.expanduser('~'), '.cache', 'fourier_radiator'))
+
+
+def prune_cache_dir(cache_dir, max_bytes, keep=()):
+    """
+    磁盘缓存超过 max_bytes 时按最近使用时间（mtime，读取时更新）删除最旧的二进制，
+    keep 中的文件（刚写入的）不删
+    """
+    try:
+        entries = []
+        for entry in os.scandir(cache_dir):
+            if entry.name.endswith('.bin') and entry.is_file():
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+    except OSError:
+        return
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        if path in keep:
+            continue
+        try:
+            os.remove(path)
+        except OSError:
+            continue  # 另一个进程已经删除
+        total -= size
+
 
 class KernelCompiler:
-    def __init__(self, mode, dtype_str, ctx, src_path):
+    def __init__(self, mode, dtype_str, ctx, src_path, omega_block=8, renorm_interval=16,
+                 build_options=(), cache_dir=None, use_cache=True, nodes_per_item=1,
+                 cache_size=256 * 2**20):
         self.mode = mode
         self.dtype_str = dtype_str
         self.ctx = ctx
         self.src_path = src_path
+        self.omega_block = int(omega_block)          # 每个 work-item 处理的连续 omega 个数
+        self.renorm_interval = int(renorm_interval)  # 相位递推的重新归一化间隔
+        self.nodes_per_item = int(nodes_per_item)    # total_block 中每个 work-item 的 omega 个数
+        self.build_options = list(build_options)
+        self.cache_dir = cache_dir or default_cache_dir()
+        self.use_cache = use_cache
+        self.cache_size = cache_size  # 磁盘缓存的字节数上限
+        self.cache_status = None  # 'memory' / 'disk' / 'build'
         self.program = self._build_kernel()
 
+    def _render(self):
+        kernel_file = "kernel_farfield.cl" if self.mode == 'far' else "kernel_nearfield.cl"
+        # 'mixed'：振幅与累加用 float，相位用 double
+        my_dtype = 'float' if self.dtype_str == 'mixed' else self.dtype_str
+        return Template(filename=self.src_path + kernel_file).render(
+            my_dtype=my_dtype,
+            phase_dtype='double' if self.dtype_str == 'mixed' else my_dtype,
+            f_native='',  # 可扩展，比如使用 native_sqrt 等 OpenCL native 函数
+            omega_block=self.omega_block,
+            renorm_interval=self.renorm_interval,
+            nodes_per_item=self.nodes_per_item
+        )
+
+    def _cache_key(self, src):
+        # 渲染后的源码已包含 my_dtype / f_native 等模板参数，再加上编译选项与设备信息
+        h = hashlib.sha256()
+        h.update(src.encode())
+        h.update(repr((self.dtype_str, '', self.build_options)).encode())
+        for dev in self.ctx.devices:
+            h.update(repr((dev.platform.name, dev.platform.version, dev.name,
+                           dev.version, dev.driver_version)).encode())
+        return h.hexdigest()
+
     def _build_kernel(self):
         if self.ctx is None:
             return None
 
-        kernel_file = "kernel_farfield.cl" if self.mode == 'far' else "kernel_nearfield.cl"
-        kernel_path = self.src_path + kernel_file
-
         try:
-            src = Template(filename=kernel_path).render(
-                my_dtype=self.dtype_str,
-                f_native=''  # 可扩展，比如使用 native_sqrt 等 OpenCL native 函数
-            )
-            return cl.Program(self.ctx, src).build()
+            src = self._render()
+            if not self.use_cache:
+                self.cache_status = 'build'
+                return cl.Program(self.ctx, src).build(options=self.build_options)
+
+            key = self._cache_key(src)
+            mem_key = (key, self.ctx.int_ptr)
+
+            # -------- 1. 进程内缓存（同一个 context 上仍在使用的 Program） --------
+            program = _program_cache.get(mem_key)
+            if program is not None:
+                self.cache_status = 'memory'
+            else:
+                # -------- 2. 内存或磁盘上的二进制，3. 都没有则编译并写盘 --------
+                if key in _binary_cache:
+                    _binary_cache.move_to_end(key)
+                    program = self._from_binaries(_binary_cache[key])
+                    self.cache_status = 'memory'
+                if program is None:
+                    program = self._load_binary(key)
+                    self.cache_status = 'disk'
+                if program is None:
+                    self.cache_status = 'build'
+                    program = cl.Program(self.ctx, src).build(options=self.build_options)
+                    self._save_binary(key, program)
+                _program_cache[mem_key] = program
+
+            cache_stats[self.cache_status] += 1
+            return program
         except Exception as e:
             print(f"[KernelCompiler] Kernel compilation failed: {e}")
             raise
+
+    def _cache_path(self, key):
+        return os.path.join(self.cache_dir, key + '.bin')
+
+    def _load_binary(self, key):
+        path = self._cache_path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            # 格式：设备个数、各二进制长度（uint64），然后依次是各二进制
+            n, = struct.unpack_from('<Q', data)
+            sizes = struct.unpack_from(f'<{n}Q', data, 8)
+            offset = 8 * (n + 1)
+            binaries = []
+            for size in sizes:
+                binaries.append(data[offset:offset + size])
+                offset += size
+        except Exception:
+            return None
+
+        program = self._from_binaries(binaries)
+        if program is not None:
+            _remember(key, binaries)
+            try:
+                os.utime(path)  # 记录使用时间，清理时先删最久未用的
+            except OSError:
+                pass
+        return program
+
+    def _from_binaries(self, binaries):
+        try:
+            return cl.Program(self.ctx, self.ctx.devices, binaries).build(options=self.build_options)
+        except Exception:
+            # 文件损坏或驱动不再接受旧的二进制：重新编译并覆盖
+            return None
+
+    def _save_binary(self, key, program):
+        binaries = [bytes(b) for b in program.get_info(cl.program_info.BINARIES)]
+        _remember(key, binaries)
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            # 先写临时文件再改名，多个进程同时写入也不会读到半个文件
+            tmp = f"{self._cache_path(key)}.{os.getpid()}.tmp"
+            with open(tmp, 'wb') as f:
+                f.write(struct.pack(f'<{len(binaries) + 1}Q', len(binaries),
+                                    *(len(b) for b in binaries)))
+                for b in binaries:
+                    f.write(b)
+            os.replace(tmp, self._cache_path(key))
+        except OSError as e:
+            print(f"[KernelCompiler] Could not write kernel cache: {e}")
+            return
+        prune_cache_dir(self.cache_dir, self.cache_size, keep=(self._cache_path(key),))
+
+
+def _remember(key, binaries):
+    _binary_cache[key] = binaries
+    _binary_cache.move_to_end(key)
+    while len(_binary_cache) > BINARY_CACHE_SIZE:
+        _binary_cache.popitem(last=False)
@@ -1,17 +1,200 @@
+import copy
+
 import numpy as np
 
+KERNEL_VARIANTS = ('localTiling', 'phaseRecurrence', 'directionMajor', 'preparedTrack', 'nufft')
+FAR_FIELD_ONLY = ('localTiling', 'directionMajor', 'preparedTrack', 'nufft')
+
+# Args['components'] -> Data['radiation'] 中额外的分量键
+COMPONENT_KEYS = {
+    'cartesian': ('x', 'y', 'z'),
+    'spheric': ('r', 'theta', 'phi'),
+}
+
+# Args['coherent'] 时 Data['radiation'] 中额外的复场键（各粒子振幅之和的实部、虚部），
+# 在所有设备与 rank 上求和后才平方，结果见 finalize_coherent
+FIELD_KEYS = ('field_x_re', 'field_x_im', 'field_y_re', 'field_y_im', 'field_z_re', 'field_z_im')
+
+# Args['fetchLayout'] 的可选值：'grid' 为 (nSnaps, nOmega, nTheta, nPhi) double，
+# 'device' 为设备上的 (nSnaps, nPhi, nTheta, nOmega)，保持设备精度、不转置
+FETCH_LAYOUTS = ('grid', 'device')
+
+# Args['reductions'] 的可选项（reductions.py）：对角度积分的 dI/dω、对 ω 积分的角分布、总能量、峰值
+REDUCTIONS = ('spectrum', 'angular', 'energy', 'peak')
+
+# 自动调优的参数（autotune.py），调用方给定时保持不变
+TUNABLE = ('WGS', 'nodesPerItem', 'omegaBlock')
+
+# gridDecomposition 的可选轴 -> gridNodeNums 中的下标
+GRID_AXES = {'omega': 0, 'theta': 1, 'radius': 1, 'phi': 2}
+
+def trapezoid_weights(axis):
+    """梯形公式在（可以不等距、递减的）网格节点上的权重；只有一个节点时为 1"""
+    axis = np.asarray(axis, dtype=np.double)
+    if axis.size < 2:
+        return np.ones(axis.size)
+    d = np.abs(np.diff(axis)) / 2
+    weights = np.zeros(axis.size)
+    weights[:-1] += d
+    weights[1:] += d
+    return weights
+
 class RadiationConfig:
     def __init__(self, Args):
         self.Args = Args.copy()
+        # 调用方显式给定的值不参与自动调优
+        self.fixed = {key for key in TUNABLE if self.Args.get(key) is not None}
         self.Args.setdefault('mode', 'far')
         self.Args.setdefault('dtype', 'float')
 
         self.dtype = np.double if self.Args['dtype'] == 'double' else np.single
+        # 'mixed'：推迟时间与相位（位置、时间、频率、方向）用 double，振幅与累加用 float
+        self.phase_dtype = np.double if self.Args['dtype'] in ('double', 'mixed') else np.single
         self.Args.setdefault('Features', [])
+        self.Args.setdefault('batchSize', 1)  # 每次 kernel 调用打包的轨迹数
+        self.Args.setdefault('omegaBlock', 8)  # phaseRecurrence 中每个 work-item 的 omega 个数
+        self.Args.setdefault('WGS', None)           # 工作组大小，None 时用调优结果或 256
+        self.Args.setdefault('nodesPerItem', None)  # total 中每个 work-item 的 omega 个数，None 时用调优结果或 1
+        self.Args.setdefault('autotune', 'cache')   # 'cache' 使用已有的调优结果；True 缺少时调优；False 不使用
+        self.Args.setdefault('autotuneCache', None)  # 调优结果的 JSON 文件，None 时放在 kernel 缓存目录
+        self.Args.setdefault('nufftEps', 1e-12 if self.Args['dtype'] == 'double' else 1e-6)
+        self.Args.setdefault('cpuThreads', None)  # NumPy 后端的线程数，None 为 CPU 核数
+        self.Args.setdefault('cpuChunkMB', 64)    # NumPy 后端每个分块的临时内存上限
+        self.Args.setdefault('asyncTransfer', False)  # 轨迹上传与 kernel 重叠（流水线）
+        self.Args.setdefault('pipelineDepth', 2)      # 流水线暂存槽个数
+        self.Args.setdefault('components', None)      # None / 'cartesian' / 'spheric'
+        self.Args.setdefault('decimationTolerance', None)  # 抽取轨迹上每步相位的上限（弧度），None 关闭
+        self.Args.setdefault('decimationLevels', 6)        # 最多抽取 2**decimationLevels 倍
+        self.Args.setdefault('coherent', False)      # 同时累加各粒子的复场，得到相干谱 Data['radiation']['coherent']
+        self.Args.setdefault('trackUpsample', 1)    # preparedTrack：每步细分的子步数（三次 Hermite 插值）
+        self.Args.setdefault('trackSmoothing', 0)   # preparedTrack：速度的 [1 2 1]/4 平滑次数
+        self.Args.setdefault('gridDecomposition', None)  # MPI 下按该网格轴划分给各 rank，None 时划分粒子
+        self.Args.setdefault('gridTiles', None)            # 网格分块数，None 时按设备显存自动决定（放得下则不分块）
+        self.Args.setdefault('deviceMemoryFraction', 0.5)  # 自动分块时谱与轨迹缓冲可用的显存比例
+        self.Args.setdefault('tileOutput', None)           # 分块结果写入的目录（每个键一个 .npy），None 时留在内存
+        self.Args.setdefault('fetchLayout', 'grid')   # 回传结果的布局，见 FETCH_LAYOUTS
+        self.Args.setdefault('pinnedFetch', False)    # 回传经过复用的 page-locked 暂存缓冲
+        self.Args.setdefault('reductions', ())        # 回传前在设备上计算的积分与峰值，结果在 Data['reduced']
+        self.Args.setdefault('fetchSpectrum', True)   # False 时只回传 reductions，不回传整个网格
+        self.Args.setdefault('profiling', False)      # 记录各阶段计时，结果在 FourierRadiator.profile
+        self.Args.setdefault('kernelCache', True)     # 缓存编译好的 kernel 二进制
+        self.Args.setdefault('kernelCacheDir', None)  # None 时用 $FOURIER_RADIATOR_CACHE 或 ~/.cache/fourier_radiator
+        self.Args.setdefault('kernelCacheSize', 256 * 2**20)  # 磁盘缓存的字节数上限，超出时删除最久未用的二进制
 
+        self._check_features()
         self._setup_grid()
         self._generate_angular_grid()
 
+    def _check_features(self):
+        features = self.Args['Features']
+
+        # 互斥的计算方式（kernel 变体或 NUFFT 引擎），只支持逐轨迹调用
+        variants = [f for f in KERNEL_VARIANTS if f in features]
+        if len(variants) > 1:
+            raise ValueError(f"Features {variants} are mutually exclusive")
+        if variants and self.Args['batchSize'] > 1:
+            raise ValueError(f"'{variants[0]}' cannot be combined with batchSize > 1")
+
+        for feature in variants:
+            if feature in FAR_FIELD_ONLY and self.Args['mode'] != 'far':
+                raise ValueError(f"'{feature}' is only available for far-field calculation")
+
+        if 'phaseRecurrence' in features:
+            if 'logGrid' in features or 'wavelengthGrid' in features:
+                raise ValueError("'phaseRecurrence' requires a linear omega grid")
+
+        # 设备池（ctx='all' 或设备列表）给每个设备编译 kernel，NUFFT 引擎不使用设备
+        ctx = self.Args.get('ctx')
+        if (isinstance(ctx, str) and ctx.lower() == 'all') or isinstance(ctx, (list, tuple)):
+            if 'nufft' in features:
+                raise ValueError("'nufft' cannot be combined with a device pool (ctx='all' or a device list)")
+
+        # 网格分解：theta 只属于远场，radius 只属于近场
+        axis = self.Args['gridDecomposition']
+        if axis is not None:
+            valid = ('omega', 'theta', 'phi') if self.Args['mode'] == 'far' else ('omega', 'radius', 'phi')
+            if axis not in valid:
+                raise ValueError(f"gridDecomposition must be None, {', '.join(map(repr, valid))}")
+
+        # 轨迹预处理的选项只用于 total_prepared
+        if int(self.Args['trackUpsample']) < 1 or int(self.Args['trackSmoothing']) < 0:
+            raise ValueError("'trackUpsample' must be >= 1 and 'trackSmoothing' >= 0")
+        if (self.Args['trackUpsample'] != 1 or self.Args['trackSmoothing'] != 0) \
+                and 'preparedTrack' not in features:
+            raise ValueError("'trackUpsample' and 'trackSmoothing' require Features=['preparedTrack']")
+
+        if self.Args['autotune'] not in (True, False, 'cache'):
+            raise ValueError("autotune must be True, False or 'cache'")
+        for key in TUNABLE:
+            if self.Args[key] is not None and int(self.Args[key]) < 1:
+                raise ValueError(f"'{key}' must be None or a positive integer")
+
+        # omega 分块只有直接求和的 total kernel（逐轨迹调用）
+        if self.Args['nodesPerItem'] is not None and int(self.Args['nodesPerItem']) > 1:
+            if variants or self.Args['batchSize'] > 1 or self.Args['components'] is not None \
+                    or self.Args['decimationTolerance'] is not None or self.Args['dtype'] == 'mixed':
+                raise ValueError("nodesPerItem > 1 cannot be combined with kernel variants, batchSize > 1, "
+                                 "components, decimationTolerance or dtype='mixed'")
+
+        if self.Args['gridTiles'] is not None and int(self.Args['gridTiles']) < 1:
+            raise ValueError("'gridTiles' must be None or a positive integer")
+        if not 0 < self.Args['deviceMemoryFraction'] <= 1:
+            raise ValueError("'deviceMemoryFraction' must be in (0, 1]")
+        if self.Args['kernelCacheSize'] < 0:
+            raise ValueError("'kernelCacheSize' must be >= 0")
+
+        # 混合精度只有 total_mixed kernel（直接求和、逐轨迹调用）
+        if self.Args['dtype'] == 'mixed':
+            if variants or self.Args['batchSize'] > 1 or self.Args['components'] is not None \
+                    or self.Args['decimationTolerance'] is not None or self.Args['asyncTransfer']:
+                raise ValueError("dtype='mixed' cannot be combined with kernel variants, batchSize > 1, "
+                                 "components, decimationTolerance or asyncTransfer")
+
+        # 多分辨率抽取替换 total kernel，只用于远场、逐轨迹调用
+        if self.Args['decimationTolerance'] is not None:
+            if self.Args['mode'] != 'far':
+                raise ValueError("'decimationTolerance' is only available for far-field calculation")
+            if variants or self.Args['batchSize'] > 1 or self.Args['components'] is not None:
+                raise ValueError("'decimationTolerance' cannot be combined with kernel variants, "
+                                 "batchSize > 1 or components")
+            if not 0 < self.Args['decimationTolerance'] < np.pi:
+                raise ValueError("'decimationTolerance' must be in (0, pi)")
+
+        # 分量由融合 kernel total_comps（localTiling 时为 total_comps_tiled）计算，
+        # 只支持直接求和、逐轨迹调用
+        components = self.Args['components']
+        if components is not None:
+            if components not in COMPONENT_KEYS:
+                raise ValueError(f"components must be None, {' or '.join(map(repr, COMPONENT_KEYS))}")
+            other = [f for f in variants if f != 'localTiling']
+            if other or self.Args['batchSize'] > 1:
+                raise ValueError("'components' cannot be combined with "
+                                 f"{other[0] if other else 'batchSize > 1'}")
+            if components == 'spheric' and self.Args['mode'] != 'far':
+                raise ValueError("Spheric components are only available for far-field calculation")
+
+        # 相干模式由 total_coherent kernel（直接求和、逐轨迹调用）累加复场
+        if self.Args['coherent']:
+            if variants or self.Args['batchSize'] > 1 or components is not None \
+                    or self.Args['decimationTolerance'] is not None or self.Args['dtype'] == 'mixed':
+                raise ValueError("'coherent' cannot be combined with kernel variants, batchSize > 1, "
+                                 "components, decimationTolerance or dtype='mixed'")
+            if self.Args['nodesPerItem'] is not None and int(self.Args['nodesPerItem']) > 1:
+                raise ValueError("'coherent' cannot be combined with nodesPerItem > 1")
+
+        if self.Args['fetchLayout'] not in FETCH_LAYOUTS:
+            raise ValueError(f"fetchLayout must be {' or '.join(map(repr, FETCH_LAYOUTS))}")
+        reductions = self.Args['reductions']
+        reductions = (reductions,) if isinstance(reductions, str) else tuple(reductions)
+        if any(name not in REDUCTIONS for name in reductions):
+            raise ValueError(f"reductions must be a subset of {REDUCTIONS}")
+        self.Args['reductions'] = reductions
+        if not self.Args['fetchSpectrum']:
+            if not reductions:
+                raise ValueError("fetchSpectrum=False requires reductions")
+            if self.Args['coherent']:
+                raise ValueError("'coherent' requires fetchSpectrum=True")
+
     def _setup_grid(self):
         self.Args['gridNodeNums'] = self.Args['grid'][-1]
         self.Args['numGridNodes'] = int(np.prod(self.Args['gridNodeNums']))
@@ -28,8 +211,10 @@ class RadiationConfig:
                 d_log_w = np.log(omega_max / omega_min) / (No - 1)
                 omega = omega_min * np.exp(d_log_w * np.arange(No))
 
-        self.Args['omega'] = omega.astype(self.dtype)
+        self.Args['omega'] = omega.astype(self.phase_dtype)
+        self.Args['dOmega'] = (omega_max - omega_min) / (No - 1) if No > 1 else 0.
         self.Args['dw'] = np.abs(omega[1:] - omega[:-1]) if No > 1 else np.array([1.], dtype=self.dtype)
+        self.Args['omegaWeights'] = trapezoid_weights(omega)
 
     def _generate_angular_grid(self):
         if self.Args['mode'] == 'far':
@@ -40,8 +225,10 @@ class RadiationConfig:
             theta = np.r_[theta_min:theta_max:Nt*1j]
             phi = phi_min + (phi_max - phi_min) / Np * np.arange(Np)
 
-            self.Args['theta'] = theta.astype(self.dtype)
-            self.Args['phi'] = phi.astype(self.dtype)
+            self.Args['theta'] = theta.astype(self.phase_dtype)
+            self.Args['phi'] = phi.astype(self.phase_dtype)
+            # 立体角的求积权重 sinθ dθ dφ
+            self.Args['polarWeights'] = trapezoid_weights(theta) * np.sin(theta)
         else:
             Nr, Np = self.Args['gridNodeNums'][1:]
             r_min, r_max = self.Args['grid'][1]
@@ -50,11 +237,86 @@ class RadiationConfig:
             radius = np.r_[r_min:r_max:Nr*1j]
             phi = phi_min + (phi_max - phi_min) / Np * np.arange(Np)
 
-            self.Args['radius'] = radius.astype(self.dtype)
-            self.Args['phi'] = phi.astype(self.dtype)
+            self.Args['radius'] = radius.astype(self.phase_dtype)
+            self.Args['phi'] = phi.astype(self.phase_dtype)
+            # 屏幕面积的求积权重 r dr dφ
+            self.Args['polarWeights'] = trapezoid_weights(radius) * radius
+
+        # φ 网格不含终点，按矩形公式
+        self.Args['phiWeights'] = np.full(Np, (phi_max - phi_min) / Np)
+
+    def split_grid(self, axis, n_parts):
+        """把 axis 方向的网格节点尽量均匀地分成 n_parts 段，返回 [(start, stop), ...]"""
+        n = self.Args['gridNodeNums'][GRID_AXES[axis]]
+        bounds = np.linspace(0, n, n_parts + 1).round().astype(int)
+        return list(zip(bounds[:-1], bounds[1:]))
+
+    def restrict_grid(self, axis, start, stop):
+        """
+        返回只包含 axis 方向 [start, stop) 节点的子配置，其余参数相同。
+        网格轴直接从本配置切片（不重新生成），所以 logGrid/wavelengthGrid 等也保持一致
+        """
+        index = GRID_AXES[axis]
+        sub = copy.copy(self)
+        sub.Args = self.Args.copy()
+
+        # 求积权重按整个网格计算，切片后各段的积分之和等于整个网格的积分
+        keys = {0: ('omega', 'wavelengths', 'omegaWeights'), 1: ('theta', 'radius', 'polarWeights'),
+                2: ('phi', 'phiWeights')}[index]
+        for key in keys:
+            if key in sub.Args:
+                sub.Args[key] = sub.Args[key][start:stop]
+        if index == 0 and stop - start > 1:
+            sub.Args['dw'] = self.Args['dw'][start:stop - 1]
+
+        nodes = list(self.Args['gridNodeNums'])
+        nodes[index] = stop - start
+        sub.Args['gridNodeNums'] = tuple(nodes)
+        sub.Args['numGridNodes'] = int(np.prod(nodes))
+        sub.Args['gridSlice'] = (axis, start, stop)
+        return sub
+
+    def radiation_keys(self):
+        """Data['radiation'] 中在设备上累加的键"""
+        keys = ('total',) + COMPONENT_KEYS.get(self.Args['components'], ())
+        if self.Args['coherent']:
+            keys += FIELD_KEYS
+        return keys
+
+    def result_axis(self, axis):
+        """网格轴 axis（GRID_AXES 的键）在回传结果数组中的下标，取决于 fetchLayout"""
+        if self.Args['fetchLayout'] == 'device':
+            return 3 - GRID_AXES[axis]
+        return 1 + GRID_AXES[axis]
 
     def get_args(self):
         return self.Args
 
     def get_dtype(self):
         return self.dtype
+
+    def get_phase_dtype(self):
+        return self.phase_dtype
+
+    def kernel_variant(self):
+        """process_track 使用的 kernel（自动调优结果按设备与这个名字保存）"""
+        features = self.Args['Features']
+        if self.Args['coherent']:
+            return 'total_coherent'
+        if self.Args['dtype'] == 'mixed':
+            return 'total_mixed'
+        if self.Args['decimationTolerance'] is not None:
+            return 'total_band'
+        if self.Args['components'] is not None:
+            return 'total_comps_tiled' if 'localTiling' in features else 'total_comps'
+        if self.Args['batchSize'] > 1:
+            return 'total_batch'
+        if 'phaseRecurrence' in features:
+            return 'total_recurrence'
+        if 'localTiling' in features:
+            return 'total_tiled'
+        if 'directionMajor' in features:
+            return 'total_direction'
+        if 'preparedTrack' in features:
+            return 'total_prepared'
+        return 'total'
@@ -1,32 +1,55 @@
 import numpy as np
 
+try:
+    import pyopencl as cl
+except ImportError:
+    cl = None
+
+from .reductions import direction_weights
+
 class RadiationDataManager:
     def __init__(self, config, opencl_env):
         self.config = config
         self.env = opencl_env
         self.Args = config.get_args()
         self.dtype = config.get_dtype()
+        self.phase_dtype = config.get_phase_dtype()  # 频率与方向轴（相位计算）的精度
         self.queue = self.env.get_queue()
+        # NUFFT 引擎与 NumPy 后端在主机上计算，所有缓冲区都放在主机内存
+        self.on_host = 'nufft' in self.Args['Features'] or self.env.get_context() is None
 
         self.Data = {}
+        self._staging = {}  # pinnedFetch：每个键一块复用的 page-locked 主机缓冲
         self._init_grid_axes()
         self._init_radiation_buffer()
 
-    def _init_grid_axes(self):
-        if self.env.get_platform_name() == "None":
-            return
+    def _to_device(self, array, dtype):
+        if self.on_host:
+            return np.ascontiguousarray(array, dtype=dtype)
+        return self.env.to_device(array, dtype)
 
-        self.Data['omega'] = self.env.to_device(2 * np.pi * self.Args['omega'], self.dtype)
+    def _zeros(self, shape, dtype):
+        if self.on_host:
+            return np.zeros(shape, dtype=dtype)
+        return self.env.zeros(shape, dtype=dtype)
+
+    def _init_grid_axes(self):
+        self.Data['omega'] = self._to_device(2 * np.pi * self.Args['omega'], self.phase_dtype)
 
         if self.Args['mode'] == 'far':
-            self.Data['sinTheta'] = self.env.to_device(np.sin(self.Args['theta']), self.dtype)
-            self.Data['cosTheta'] = self.env.to_device(np.cos(self.Args['theta']), self.dtype)
-            self.Data['sinPhi'] = self.env.to_device(np.sin(self.Args['phi']), self.dtype)
-            self.Data['cosPhi'] = self.env.to_device(np.cos(self.Args['phi']), self.dtype)
+            self.Data['sinTheta'] = self._to_device(np.sin(self.Args['theta']), self.phase_dtype)
+            self.Data['cosTheta'] = self._to_device(np.cos(self.Args['theta']), self.phase_dtype)
+            self.Data['sinPhi'] = self._to_device(np.sin(self.Args['phi']), self.phase_dtype)
+            self.Data['cosPhi'] = self._to_device(np.cos(self.Args['phi']), self.phase_dtype)
         else:
-            self.Data['radius'] = self.env.to_device(self.Args['radius'], self.dtype)
-            self.Data['sinPhi'] = self.env.to_device(np.sin(self.Args['phi']), self.dtype)
-            self.Data['cosPhi'] = self.env.to_device(np.cos(self.Args['phi']), self.dtype)
+            self.Data['radius'] = self._to_device(self.Args['radius'], self.phase_dtype)
+            self.Data['sinPhi'] = self._to_device(np.sin(self.Args['phi']), self.phase_dtype)
+            self.Data['cosPhi'] = self._to_device(np.cos(self.Args['phi']), self.phase_dtype)
+
+        # reductions 的求积权重（方向按设备顺序 (iPhi, iTheta)）
+        if self.Args['reductions'] and not self.on_host:
+            self.Data['omegaWeights'] = self._to_device(self.Args['omegaWeights'], self.dtype)
+            self.Data['dirWeights'] = self._to_device(direction_weights(self.Args).ravel(), self.dtype)
 
     def _init_radiation_buffer(self):
         self.Data['radiation'] = {}
@@ -35,21 +58,74 @@ class RadiationDataManager:
         shape = (nSnaps,) + tuple(self.Args['gridNodeNums'][::-1])
 
         exp_factor = self.dtype(-0.5) * (2 * np.pi * self.Args['omega'] * sigma_particle) ** 2
-        self.Data['FormFactor'] = self.env.to_device(np.exp(exp_factor), self.dtype)
-        self.Data['radiation']['total'] = self.env.zeros(shape, dtype=self.dtype)
+        self.Data['FormFactor'] = self._to_device(np.exp(exp_factor), self.dtype)
+
+        # 分量与复场与 total 同布局，fetch_results 与 MPI 归约按键遍历，无需另外处理
+        for key in self.config.radiation_keys():
+            self.Data['radiation'][key] = self._zeros(shape, dtype=self.dtype)
+
+    def fetch_results(self, out=None):
+        """
+        谱拷回主机，布局由 Args['fetchLayout'] 决定：
+            'grid'    (nSnaps, nOmega, nTheta, nPhi) double，设备缓冲拷出后一次转置写入结果
+            'device'  设备上的 (nSnaps, nPhi, nTheta, nOmega) 与设备精度，直接拷入结果
+        out 为 {key: 预分配的主机数组}（布局、类型同上，C 连续），有的键直接写入其中。
+        pinnedFetch 时设备缓冲先拷到复用的 page-locked 暂存缓冲；fetchSpectrum=False 时不回传
+        """
+        out = out or {}
+        radiation = self.Data['radiation']
+        if not self.Args['fetchSpectrum']:
+            radiation.clear()
+            return
+
+        grid = self.Args['fetchLayout'] == 'grid'
+        for key in radiation:
+            arr = radiation[key]
+            shape = arr.shape[:1] + arr.shape[:0:-1] if grid else arr.shape
+            dtype = np.dtype(np.double if grid else arr.dtype)
+            dest = out.get(key)
+            if dest is None and self.on_host and not grid:
+                continue  # 主机端后端的结果已经是设备布局
+            if dest is None:
+                dest = np.empty(shape, dtype=dtype)
+            elif dest.shape != shape or dest.dtype != dtype or not dest.flags.c_contiguous:
+                raise ValueError(f"out['{key}'] must be a C-contiguous {dtype} array of shape {shape}")
+
+            if self.on_host:
+                host = arr
+            elif not grid and not self.Args['pinnedFetch']:
+                host = dest  # 布局与类型都不变，直接拷入结果
+            else:
+                host = self._stage(key, arr) if self.Args['pinnedFetch'] else np.empty(arr.shape, arr.dtype)
+            if not self.on_host:
+                event = cl.enqueue_copy(self.queue, host, arr.data)
+                if self.env.profiler is not None:
+                    self.env.profiler.event('fetch', event, key, nbytes=host.nbytes)
+
+            if host is not dest:
+                # 逐个快照转置，工作集小一些
+                for iSnap in range(shape[0]):
+                    np.copyto(dest[iSnap], host[iSnap].swapaxes(-1, -3) if grid else host[iSnap])
+            radiation[key] = dest
 
-    def fetch_results(self):
-        for key in self.Data['radiation']:
-            arr = self.Data['radiation'][key].get()
-            arr = arr.swapaxes(-1, -3)  # 调整轴顺序
-            self.Data['radiation'][key] = np.ascontiguousarray(arr, dtype=np.double)
+    def _stage(self, key, arr):
+        # 按键复用的 page-locked 暂存缓冲，形状或类型变化时重新分配
+        staged = self._staging.get(key)
+        if staged is None or staged[1].shape != arr.shape or staged[1].dtype != arr.dtype:
+            flags = cl.mem_flags.READ_WRITE | cl.mem_flags.ALLOC_HOST_PTR
+            buf = cl.Buffer(self.env.get_context(), flags, max(arr.nbytes, 1))
+            # 保持映射，拷贝直接写入这块主机内存（与 TrackPipeline 的上传缓冲相同）
+            host, _ = cl.enqueue_map_buffer(self.queue, buf, cl.map_flags.READ | cl.map_flags.WRITE,
+                                            0, arr.shape, arr.dtype)
+            staged = self._staging[key] = (buf, host)
+        return staged[1]
 
     def get_snap_iterations(self, it_range, nSnaps):
         snap_iterations = np.ascontiguousarray(
             np.linspace(*it_range, nSnaps + 1, dtype=np.uint32)[1:]
         )
         
-        return self.env.to_device(snap_iterations, np.uint32)
+        return self._to_device(snap_iterations, np.uint32)
 
     def get_data(self):
         return self.Data
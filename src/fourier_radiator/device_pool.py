@@ -0,0 +1,207 @@
+"""Per-device workers and dynamic track scheduling over several OpenCL devices."""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from .config import FIELD_KEYS
+from .particle import ParticleProcessor
+from .pipeline import TrackPipeline
+from .reductions import host_reduce
+from .load_balance import track_costs
+
+
+class DeviceWorker:
+    """
+    一个设备上的完整计算链：OpenCL 环境、编译好的 kernel、粒子处理器与谱缓冲。
+    单设备时 FourierRadiator 只有一个 worker，设备池中每个设备一个
+    """
+
+    def __init__(self, config, env, compiler, processor, data_mgr):
+        self.Args = config.get_args()
+        self.dtype = config.get_dtype()
+        self.env = env
+        self.compiler = compiler
+        self.processor = processor
+        self.data_mgr = data_mgr
+        self.Data = data_mgr.get_data()
+        self.snap_iterations = None
+        self.pipeline = None  # asyncTransfer 的上传流水线，第一次使用时建立，之后复用
+
+    @property
+    def name(self):
+        return self.env.get_device_name()
+
+    def prepare(self, sigma_particle, nSnaps, it_range):
+        self.data_mgr.prepare_radiation(sigma_particle=sigma_particle, nSnaps=nSnaps)
+        self.Data = self.data_mgr.get_data()
+        self.snap_iterations = None
+        if it_range is not None:
+            self.snap_iterations = self.data_mgr.get_snap_iterations(it_range, nSnaps)
+
+    def process(self, particleTracks, weights, nSnaps, it_range, progress=None):
+        """把 particleTracks（权重已归一化为 weights）累加进本设备的谱；progress(n) 汇报进度"""
+        progress = progress or (lambda n: None)
+
+        # 主机端后端（NumPy/NUFFT）没有批量接口，逐条处理
+        batch_size = max(int(self.Args['batchSize']), 1)
+        if batch_size > 1 and hasattr(self.processor, 'process_batch'):
+            for i in range(0, len(particleTracks), batch_size):
+                batch = self.processor.tracks_to_device(
+                    particleTracks[i:i + batch_size], weights[i:i + batch_size], nSnaps, it_range)
+                self.processor.process_batch(batch, self.Data, self.snap_iterations, nSnaps)
+                progress(min(batch_size, len(particleTracks) - i))
+        elif self.Args['asyncTransfer'] and isinstance(self.processor, ParticleProcessor):
+            self._process_pipelined(particleTracks, weights, nSnaps, it_range, progress)
+        elif isinstance(self.processor, ParticleProcessor) or self.env.profiler is None:
+            for i in range(len(particleTracks)):
+                device_track = self.processor.track_to_device(particleTracks[i])
+                device_track[6] = self.dtype(weights[i])
+                self.processor.process_track(device_track, self.Data, self.snap_iterations, nSnaps, it_range)
+                progress(1)
+        else:
+            self._process_host_profiled(particleTracks, weights, nSnaps, it_range, progress)
+
+    def _process_host_profiled(self, particleTracks, weights, nSnaps, it_range, progress):
+        # 主机端后端没有 OpenCL 事件：类型转换与计算都按主机时间记录
+        profiler = self.env.profiler
+        for i in range(len(particleTracks)):
+            with profiler.timer('cast', 'track_to_host'):
+                device_track = self.processor.track_to_device(particleTracks[i])
+            device_track[6] = self.dtype(weights[i])
+            n_steps = len(device_track[0])
+            if it_range is not None:
+                n_steps = min(n_steps, it_range[-1]) - int(device_track[7])
+            with profiler.timer('kernel', type(self.processor).__name__,
+                                work=self.Args['numGridNodes'] * max(n_steps, 0)):
+                self.processor.process_track(device_track, self.Data, self.snap_iterations, nSnaps, it_range)
+            progress(1)
+
+    def _process_pipelined(self, particleTracks, weights, nSnaps, it_range, progress):
+        # 轨迹 i+1 的转换与上传在传输队列上进行，同时计算队列执行轨迹 i 的 kernel
+        if self.pipeline is None:
+            self.pipeline = TrackPipeline(self.env, self.dtype, self.Args['pipelineDepth'])
+        pipeline = self.pipeline
+
+        for i in range(len(particleTracks)):
+            track = particleTracks[i]
+            snaps = None
+            if it_range is None:
+                snaps = np.linspace(0, len(track[0]), nSnaps + 1, dtype=np.uint32)[1:]
+
+            slot, device_track, device_snaps, events = pipeline.upload(track, weights[i], snaps)
+            snap_iterations = device_snaps if it_range is None else self.snap_iterations
+            event = self.processor.process_track(device_track, self.Data, snap_iterations,
+                                                 nSnaps, it_range, wait_for=events)
+            self.env.get_queue().flush()
+            pipeline.release(slot, event)
+            progress(1)
+
+        pipeline.finish()
+
+    def reduce(self):
+        """Args['reductions']：在设备上（主机端后端在主机上）对各谱键积分、求峰值，结果在 Data['reduced']"""
+        names = self.Args['reductions']
+        keys = [key for key in self.Data['radiation'] if key not in FIELD_KEYS]
+        if isinstance(self.processor, ParticleProcessor):
+            self.Data['reduced'] = {key: self.processor.reduce_spectrum(self.Data, key, names) for key in keys}
+        else:
+            self.Data['reduced'] = {key: host_reduce(self.Data['radiation'][key], self.Args, names)
+                                    for key in keys}
+
+    def fetch(self, out=None):
+        """归约（如果有）之后把谱拷回主机，见 RadiationDataManager.fetch_results"""
+        if self.Args['reductions']:
+            self.reduce()
+        self.data_mgr.fetch_results(out)
+
+    def finish(self):
+        if self.env.get_queue() is not None:
+            self.env.get_queue().finish()
+
+    def release_buffers(self):
+        """释放上传流水线、轨迹缓冲池与快照缓存"""
+        if self.pipeline is not None:
+            self.pipeline.release_buffers()
+            self.pipeline = None
+        if hasattr(self.processor, 'release_buffers'):
+            self.processor.release_buffers()
+
+
+class DevicePool:
+    """
+    每个设备一个线程，从共享的轨迹序列中按块领取任务（guided self-scheduling）：
+    第一块只有 unit 条轨迹用于测速，之后每块的计算量为
+    剩余量 * (本设备吞吐 / 总吞吐) / 2，所以快的设备领得多，结尾的块逐渐变小
+    """
+
+    def __init__(self, workers):
+        self.workers = workers
+        self.stats = []
+
+    def process(self, particleTracks, weights, nSnaps, it_range, unit=1, progress=None):
+        costs = track_costs(particleTracks, it_range)
+        self._bounds = np.concatenate([[0.], np.cumsum(costs)])
+        self._next = 0
+        self._unit = max(int(unit), 1)
+        self._lock = threading.Lock()
+        self._done = [0.] * len(self.workers)      # 每个设备完成的步数
+        self._elapsed = [0.] * len(self.workers)   # 以及所用时间
+        self._counts = [0] * len(self.workers)
+
+        lock = threading.Lock()
+
+        def report(n):
+            if progress is not None:
+                with lock:
+                    progress(n)
+
+        def run(w):
+            worker = self.workers[w]
+            while True:
+                chunk = self._take(w)
+                if chunk is None:
+                    break
+                start, stop = chunk
+                t0 = time.perf_counter()
+                worker.process(particleTracks[start:stop], weights[start:stop], nSnaps, it_range, report)
+                worker.finish()
+                with self._lock:
+                    self._done[w] += self._bounds[stop] - self._bounds[start]
+                    self._elapsed[w] += time.perf_counter() - t0
+                    self._counts[w] += stop - start
+
+        with ThreadPoolExecutor(max_workers=len(self.workers)) as executor:
+            # result() 把线程中的异常抛回调用方
+            for future in [executor.submit(run, w) for w in range(len(self.workers))]:
+                future.result()
+
+        self.stats = [{'device': worker.name, 'tracks': self._counts[w], 'steps': self._done[w],
+                       'seconds': self._elapsed[w]} for w, worker in enumerate(self.workers)]
+
+    def _take(self, w):
+        with self._lock:
+            n_tracks = self._bounds.size - 1
+            start = self._next
+            if start >= n_tracks:
+                return None
+
+            rates = [done / elapsed if elapsed > 0 else None
+                     for done, elapsed in zip(self._done, self._elapsed)]
+            if rates[w] is None:
+                stop = start + self._unit
+            else:
+                # 还没测出吞吐的设备按已知设备的平均值计
+                known = [rate for rate in rates if rate is not None]
+                total = sum(rate if rate is not None else np.mean(known) for rate in rates)
+                remaining = self._bounds[-1] - self._bounds[start]
+                target = self._bounds[start] + 0.5 * remaining * rates[w] / total
+                stop = int(np.searchsorted(self._bounds, target, side='right')) - 1
+                # 取 unit（批大小）的整数倍，至少一个 unit
+                stop = start + max(int(np.ceil((stop - start) / self._unit)), 1) * self._unit
+
+            stop = min(stop, n_tracks)
+            self._next = stop
+            return start, stop
@@ -108,6 +108,1702 @@ __kernel void total(
   }
 }
 
+__kernel void total_coherent(
+  __global ${my_dtype} *spectrum,
+  __global ${my_dtype} *fieldXRe,
+  __global ${my_dtype} *fieldXIm,
+  __global ${my_dtype} *fieldYRe,
+  __global ${my_dtype} *fieldYIm,
+  __global ${my_dtype} *fieldZRe,
+  __global ${my_dtype} *fieldZIm,
+  __global ${my_dtype} *x,
+  __global ${my_dtype} *y,
+  __global ${my_dtype} *z,
+  __global ${my_dtype} *ux,
+  __global ${my_dtype} *uy,
+  __global ${my_dtype} *uz,
+           ${my_dtype} wp,
+                  uint itStart,
+                  uint itEnd,
+                  uint nSteps,
+  __global ${my_dtype} *omega,
+  __global ${my_dtype} *sinTheta,
+  __global ${my_dtype} *cosTheta,
+  __global ${my_dtype} *sinPhi,
+  __global ${my_dtype} *cosPhi,
+                  uint nOmega,
+                  uint nTheta,
+                  uint nPhi,
+           ${my_dtype} dt,
+                  uint nSnaps,
+  __global        uint *itSnaps,
+  __global ${my_dtype} *FormFactor)
+{
+  // total plus the complex field vector of the particle, scaled by
+  // sqrt(wp) dt and the form factor of a particle of size sigma_particle
+  // like the *_complex kernels, accumulated for the coherent spectrum
+  uint gti = (uint) get_global_id(0);
+  uint nTotal = nTheta*nPhi*nOmega;
+
+  if (gti < nTotal)
+  {
+    uint iPhi = gti / (nOmega * nTheta);
+    uint iTheta = (gti - iPhi*nOmega*nTheta) / nOmega;
+    uint iOmega = gti - iPhi*nOmega*nTheta - iTheta*nOmega;
+
+    ${my_dtype} omegaLocal = omega[iOmega];
+    ${my_dtype}3 nVec = (${my_dtype}3) { sinTheta[iTheta]*cosPhi[iPhi],
+                                         sinTheta[iTheta]*sinPhi[iPhi],
+                                         cosTheta[iTheta] };
+
+    ${my_dtype}3 xLocal, uLocal, uNextLocal, aLocal, amplitude;
+    ${my_dtype} time, phase, dPhase, sinPhase, cosPhase, c1, c2, gammaInv;
+
+    ${my_dtype} dtInv = (${my_dtype})1. / dt;
+    ${my_dtype} wpdt2 =  wp * dt * dt;
+    ${my_dtype} wpdtField = ${f_native}sqrt(wp) * dt;
+    ${my_dtype} FormFactorLocal = FormFactor[iOmega];
+    ${my_dtype} fieldFactor;
+    ${my_dtype} phasePrev = (${my_dtype}) 0.;
+    ${my_dtype}3 spectrLocalRe = (${my_dtype}3) {0., 0., 0.};
+    ${my_dtype}3 spectrLocalIm = (${my_dtype}3) {0., 0., 0.};
+
+    uint iSnap, it_glob;
+    for (iSnap=0; iSnap<nSnaps; iSnap++)
+    {
+      if (itStart < itSnaps[iSnap]) break;
+    }
+
+    for (uint it=0; it<itEnd-1; it++)
+    {
+      it_glob = itStart + it;
+
+      if (it<nSteps-1)
+      {
+        time = (${my_dtype})it_glob * dt;
+        xLocal = (${my_dtype}3) {x[it], y[it], z[it]};
+
+        phase = omegaLocal * (time - dot(xLocal, nVec)) ;
+        dPhase = fabs(phase - phasePrev);
+        phasePrev = phase;
+
+        if (dPhase < (${my_dtype})M_PI)
+        {
+          uLocal = (${my_dtype}3) {ux[it], uy[it], uz[it]};
+          uNextLocal = (${my_dtype}3) {ux[it+1], uy[it+1], uz[it+1]};
+
+          gammaInv = ${f_native}rsqrt( (${my_dtype})1. + dot(uLocal, uLocal) );
+          uLocal *= gammaInv;
+          gammaInv = ${f_native}rsqrt( (${my_dtype})1. + dot(uNextLocal, uNextLocal) );
+          uNextLocal *= gammaInv;
+
+          aLocal = (uNextLocal - uLocal) * dtInv;
+          uLocal = (${my_dtype})0.5 * (uNextLocal + uLocal);
+
+          c1 = dot(aLocal, nVec);
+          c2 = (${my_dtype})1. - dot(uLocal, nVec);
+
+          c2 =  (${my_dtype})1. / c2;
+          c1 = c1*c2*c2;
+
+          sinPhase = ${f_native}sin(phase);
+          cosPhase = ${f_native}cos(phase);
+
+          amplitude = c1*(nVec - uLocal) - c2*aLocal;
+          spectrLocalRe += amplitude * cosPhase;
+          spectrLocalIm += amplitude * sinPhase;
+        }
+      }
+
+      if (iSnap<nSnaps && it_glob+2 == itSnaps[iSnap])
+      {
+        spectrum[gti + nTotal*iSnap] +=  wpdt2 * (
+          dot(spectrLocalRe, spectrLocalRe) +
+          dot(spectrLocalIm, spectrLocalIm) );
+
+        // fields are linear in the amplitude: they are summed over particles
+        // (and ranks) and squared only at the end
+        fieldFactor = wpdtField * FormFactorLocal;
+        fieldXRe[gti + nTotal*iSnap] += fieldFactor * spectrLocalRe.s0;
+        fieldXIm[gti + nTotal*iSnap] += fieldFactor * spectrLocalIm.s0;
+        fieldYRe[gti + nTotal*iSnap] += fieldFactor * spectrLocalRe.s1;
+        fieldYIm[gti + nTotal*iSnap] += fieldFactor * spectrLocalIm.s1;
+        fieldZRe[gti + nTotal*iSnap] += fieldFactor * spectrLocalRe.s2;
+        fieldZIm[gti + nTotal*iSnap] += fieldFactor * spectrLocalIm.s2;
+        iSnap += 1;
+      }
+    }
+  }
+}
+
+__kernel void total_block(
+  __global ${my_dtype} *spectrum,
+  __global ${my_dtype} *x,
+  __global ${my_dtype} *y,
+  __global ${my_dtype} *z,
+  __global ${my_dtype} *ux,
+  __global ${my_dtype} *uy,
+  __global ${my_dtype} *uz,
+           ${my_dtype} wp,
+                  uint itStart,
+                  uint itEnd,
+                  uint nSteps,
+  __global ${my_dtype} *omega,
+  __global ${my_dtype} *sinTheta,
+  __global ${my_dtype} *cosTheta,
+  __global ${my_dtype} *sinPhi,
+  __global ${my_dtype} *cosPhi,
+                  uint nOmega,
+                  uint nTheta,
+                  uint nPhi,
+           ${my_dtype} dt,
+                  uint nSnaps,
+  __global        uint *itSnaps)
+{
+  // same sums as total, but each work-item handles ${nodes_per_item} consecutive
+  // omegas of one direction: the trajectory is read and the amplitude is
+  // computed once per step for the whole block
+  uint gti = (uint) get_global_id(0);
+  uint nBlocks = (nOmega + ${nodes_per_item} - 1) / ${nodes_per_item};
+  uint nTotal = nTheta*nPhi*nOmega;
+
+  if (gti < nBlocks*nTheta*nPhi)
+  {
+    uint iPhi = gti / (nBlocks * nTheta);
+    uint iTheta = (gti - iPhi*nBlocks*nTheta) / nBlocks;
+    uint iBlock = gti - iPhi*nBlocks*nTheta - iTheta*nBlocks;
+
+    uint iOmega0 = iBlock * ${nodes_per_item};
+    uint nOmegaBlock = min((uint)${nodes_per_item}, nOmega - iOmega0);
+    uint gti0 = iOmega0 + nOmega*(iTheta + nTheta*iPhi);
+
+    ${my_dtype}3 nVec = (${my_dtype}3) { sinTheta[iTheta]*cosPhi[iPhi],
+                                         sinTheta[iTheta]*sinPhi[iPhi],
+                                         cosTheta[iTheta] };
+
+    ${my_dtype} omegaLocal[${nodes_per_item}];
+    ${my_dtype} phasePrev[${nodes_per_item}];
+    ${my_dtype}3 spectrLocalRe[${nodes_per_item}];
+    ${my_dtype}3 spectrLocalIm[${nodes_per_item}];
+
+    for (uint j=0; j<${nodes_per_item}; j++)
+    {
+      omegaLocal[j] = (j < nOmegaBlock) ? omega[iOmega0 + j] : omega[iOmega0];
+      phasePrev[j] = (${my_dtype}) 0.;
+      spectrLocalRe[j] = (${my_dtype}3) {0., 0., 0.};
+      spectrLocalIm[j] = (${my_dtype}3) {0., 0., 0.};
+    }
+
+    ${my_dtype}3 xLocal, uLocal, uNextLocal, aLocal, amplitude;
+    ${my_dtype} time, phi, phase, dPhase, sinPhase, cosPhase, c1, c2, gammaInv;
+    int haveAmplitude;
+
+    ${my_dtype} dtInv = (${my_dtype})1. / dt;
+    ${my_dtype} wpdt2 =  wp * dt * dt;
+
+    uint iSnap, it_glob;
+    for (iSnap=0; iSnap<nSnaps; iSnap++)
+    {
+      if (itStart < itSnaps[iSnap]) break;
+    }
+
+    for (uint it=0; it<itEnd-1; it++)
+    {
+      it_glob = itStart + it;
+
+      if (it<nSteps-1)
+      {
+        time = (${my_dtype})it_glob * dt;
+        xLocal = (${my_dtype}3) {x[it], y[it], z[it]};
+        phi = time - dot(xLocal, nVec);
+        haveAmplitude = 0;
+
+        for (uint j=0; j<${nodes_per_item}; j++)
+        {
+          phase = omegaLocal[j] * phi;
+          dPhase = fabs(phase - phasePrev[j]);
+          phasePrev[j] = phase;
+
+          if (j < nOmegaBlock && dPhase < (${my_dtype})M_PI)
+          {
+            // the amplitude does not depend on omega
+            if (!haveAmplitude)
+            {
+              uLocal = (${my_dtype}3) {ux[it], uy[it], uz[it]};
+              uNextLocal = (${my_dtype}3) {ux[it+1], uy[it+1], uz[it+1]};
+
+              gammaInv = ${f_native}rsqrt( (${my_dtype})1. + dot(uLocal, uLocal) );
+              uLocal *= gammaInv;
+              gammaInv = ${f_native}rsqrt( (${my_dtype})1. + dot(uNextLocal, uNextLocal) );
+              uNextLocal *= gammaInv;
+
+              aLocal = (uNextLocal - uLocal) * dtInv;
+              uLocal = (${my_dtype})0.5 * (uNextLocal + uLocal);
+
+              c1 = dot(aLocal, nVec);
+              c2 = (${my_dtype})1. - dot(uLocal, nVec);
+
+              c2 =  (${my_dtype})1. / c2;
+              c1 = c1*c2*c2;
+
+              amplitude = c1*(nVec - uLocal) - c2*aLocal;
+              haveAmplitude = 1;
+            }
+
+            sinPhase = ${f_native}sin(phase);
+            cosPhase = ${f_native}cos(phase);
+
+            spectrLocalRe[j] += amplitude * cosPhase;
+            spectrLocalIm[j] += amplitude * sinPhase;
+          }
+        }
+      }
+
+      if (iSnap<nSnaps && it_glob+2 == itSnaps[iSnap])
+      {
+        for (uint j=0; j<nOmegaBlock; j++)
+        {
+          spectrum[gti0 + j + nTotal*iSnap] +=  wpdt2 * (
+            dot(spectrLocalRe[j], spectrLocalRe[j]) +
+            dot(spectrLocalIm[j], spectrLocalIm[j]) );
+        }
+        iSnap += 1;
+      }
+    }
+  }
+}
+
+__kernel void total_tiled(
+  __global ${my_dtype} *spectrum,
+  __global ${my_dtype} *x,
+  __global ${my_dtype} *y,
+  __global ${my_dtype} *z,
+  __global ${my_dtype} *ux,
+  __global ${my_dtype} *uy,
+  __global ${my_dtype} *uz,
+           ${my_dtype} wp,
+                  uint itStart,
+                  uint itEnd,
+                  uint nSteps,
+  __global ${my_dtype} *omega,
+  __global ${my_dtype} *sinTheta,
+  __global ${my_dtype} *cosTheta,
+  __global ${my_dtype} *sinPhi,
+  __global ${my_dtype} *cosPhi,
+                  uint nOmega,
+                  uint nTheta,
+                  uint nPhi,
+           ${my_dtype} dt,
+                  uint nSnaps,
+  __global        uint *itSnaps,
+  __local  ${my_dtype}3 *xTile,
+  __local  ${my_dtype}3 *uTile)
+{
+  // trajectory chunks of get_local_size(0) steps are loaded cooperatively
+  // into local memory: xTile holds positions, uTile holds the normalized
+  // velocities (one extra entry for the step it+1)
+  uint gti = (uint) get_global_id(0);
+  uint lid = (uint) get_local_id(0);
+  uint tileSize = (uint) get_local_size(0);
+  uint nTotal = nTheta*nPhi*nOmega;
+
+  // work-items past the grid still take part in loading and barriers
+  bool active = gti < nTotal;
+  uint gtiNode = active ? gti : 0;
+
+  uint iPhi = gtiNode / (nOmega * nTheta);
+  uint iTheta = (gtiNode - iPhi*nOmega*nTheta) / nOmega;
+  uint iOmega = gtiNode - iPhi*nOmega*nTheta - iTheta*nOmega;
+
+  ${my_dtype} omegaLocal = omega[iOmega];
+  ${my_dtype}3 nVec = (${my_dtype}3) { sinTheta[iTheta]*cosPhi[iPhi],
+                                       sinTheta[iTheta]*sinPhi[iPhi],
+                                       cosTheta[iTheta] };
+
+  ${my_dtype}3 xLocal, uLocal, uNextLocal, aLocal, amplitude;
+  ${my_dtype} time, phase, dPhase, sinPhase, cosPhase, c1, c2, gammaInv;
+
+  ${my_dtype} dtInv = (${my_dtype})1. / dt;
+  ${my_dtype} wpdt2 =  wp * dt * dt;
+  ${my_dtype} phasePrev = (${my_dtype}) 0.;
+  ${my_dtype}3 spectrLocalRe = (${my_dtype}3) {0., 0., 0.};
+  ${my_dtype}3 spectrLocalIm = (${my_dtype}3) {0., 0., 0.};
+
+  uint iSnap, it, it_glob, itLoad, nTile;
+  for (iSnap=0; iSnap<nSnaps; iSnap++)
+  {
+    if (itStart < itSnaps[iSnap]) break;
+  }
+
+  for (uint itTile=0; itTile<itEnd-1; itTile+=tileSize)
+  {
+    barrier(CLK_LOCAL_MEM_FENCE);
+
+    itLoad = itTile + lid;
+    if (itLoad < nSteps)
+    {
+      xTile[lid] = (${my_dtype}3) {x[itLoad], y[itLoad], z[itLoad]};
+      uLocal = (${my_dtype}3) {ux[itLoad], uy[itLoad], uz[itLoad]};
+      gammaInv = ${f_native}rsqrt( (${my_dtype})1. + dot(uLocal, uLocal) );
+      uTile[lid] = uLocal * gammaInv;
+    }
+
+    itLoad = itTile + tileSize;
+    if (lid == 0 && itLoad < nSteps)
+    {
+      uLocal = (${my_dtype}3) {ux[itLoad], uy[itLoad], uz[itLoad]};
+      gammaInv = ${f_native}rsqrt( (${my_dtype})1. + dot(uLocal, uLocal) );
+      uTile[tileSize] = uLocal * gammaInv;
+    }
+
+    barrier(CLK_LOCAL_MEM_FENCE);
+
+    if (active)
+    {
+      nTile = min(tileSize, itEnd - 1 - itTile);
+      for (uint j=0; j<nTile; j++)
+      {
+        it = itTile + j;
+        it_glob = itStart + it;
+
+        if (it<nSteps-1)
+        {
+          time = (${my_dtype})it_glob * dt;
+          xLocal = xTile[j];
+
+          phase = omegaLocal * (time - dot(xLocal, nVec)) ;
+          dPhase = fabs(phase - phasePrev);
+          phasePrev = phase;
+
+          if (dPhase < (${my_dtype})M_PI)
+          {
+            uLocal = uTile[j];
+            uNextLocal = uTile[j+1];
+
+            aLocal = (uNextLocal - uLocal) * dtInv;
+            uLocal = (${my_dtype})0.5 * (uNextLocal + uLocal);
+
+            c1 = dot(aLocal, nVec);
+            c2 = (${my_dtype})1. - dot(uLocal, nVec);
+
+            c2 =  (${my_dtype})1. / c2;
+            c1 = c1*c2*c2;
+
+            sinPhase = ${f_native}sin(phase);
+            cosPhase = ${f_native}cos(phase);
+
+            amplitude = c1*(nVec - uLocal) - c2*aLocal;
+
+            spectrLocalRe += amplitude * cosPhase;
+            spectrLocalIm += amplitude * sinPhase;
+          }
+        }
+
+        if (iSnap<nSnaps && it_glob+2 == itSnaps[iSnap])
+        {
+          spectrum[gti + nTotal*iSnap] +=  wpdt2 * (
+            dot(spectrLocalRe, spectrLocalRe) +
+            dot(spectrLocalIm, spectrLocalIm) );
+          iSnap += 1;
+        }
+      }
+    }
+  }
+}
+
+__kernel void total_direction(
+  __global ${my_dtype} *spectrum,
+  __global ${my_dtype} *x,
+  __global ${my_dtype} *y,
+  __global ${my_dtype} *z,
+  __global ${my_dtype} *ux,
+  __global ${my_dtype} *uy,
+  __global ${my_dtype} *uz,
+           ${my_dtype} wp,
+                  uint itStart,
+                  uint itEnd,
+                  uint nSteps,
+  __global ${my_dtype} *omega,
+  __global ${my_dtype} *sinTheta,
+  __global ${my_dtype} *cosTheta,
+  __global ${my_dtype} *sinPhi,
+  __global ${my_dtype} *cosPhi,
+                  uint nOmega,
+                  uint nTheta,
+                  uint nPhi,
+           ${my_dtype} dt,
+                  uint nSnaps,
+  __global        uint *itSnaps,
+  __local  ${my_dtype} *phiTile,
+  __local  ${my_dtype}3 *ampTile)
+{
+  // direction-major layout: each work-group owns one direction and a chunk
+  // of get_local_size(0) omegas (one per work-item). For every chunk of
+  // steps the work-items first compute one step each of the direction-only
+  // terms (retarded time and amplitude) into local memory, then every
+  // work-item accumulates its own omega over the whole chunk
+  uint lid = (uint) get_local_id(0);
+  uint tileSize = (uint) get_local_size(0);
+  uint nChunks = (nOmega + tileSize - 1) / tileSize;
+  uint iDir = (uint) get_group_id(0) / nChunks;
+  uint iOmega = ((uint) get_group_id(0) - iDir*nChunks) * tileSize + lid;
+  uint iPhi = iDir / nTheta;
+  uint iTheta = iDir - iPhi*nTheta;
+  uint nTotal = nTheta*nPhi*nOmega;
+
+  // work-items past the omega axis still take part in the tile and barriers
+  bool active = iOmega < nOmega;
+  uint gti = (active ? iOmega : 0) + nOmega*iDir;
+
+  ${my_dtype} omegaLocal = omega[active ? iOmega : 0];
+  ${my_dtype}3 nVec = (${my_dtype}3) { sinTheta[iTheta]*cosPhi[iPhi],
+                                       sinTheta[iTheta]*sinPhi[iPhi],
+                                       cosTheta[iTheta] };
+
+  ${my_dtype}3 xLocal, uLocal, uNextLocal, aLocal;
+  ${my_dtype} time, phase, dPhase, sinPhase, cosPhase, c1, c2, gammaInv;
+
+  ${my_dtype} dtInv = (${my_dtype})1. / dt;
+  ${my_dtype} wpdt2 =  wp * dt * dt;
+  ${my_dtype} phasePrev = (${my_dtype}) 0.;
+  ${my_dtype}3 spectrLocalRe = (${my_dtype}3) {0., 0., 0.};
+  ${my_dtype}3 spectrLocalIm = (${my_dtype}3) {0., 0., 0.};
+
+  uint iSnap, it, it_glob, itLoad, nTile;
+  for (iSnap=0; iSnap<nSnaps; iSnap++)
+  {
+    if (itStart < itSnaps[iSnap]) break;
+  }
+
+  for (uint itTile=0; itTile<itEnd-1; itTile+=tileSize)
+  {
+    barrier(CLK_LOCAL_MEM_FENCE);
+
+    itLoad = itTile + lid;
+    if (itLoad < nSteps-1)
+    {
+      time = (${my_dtype})(itStart + itLoad) * dt;
+      xLocal = (${my_dtype}3) {x[itLoad], y[itLoad], z[itLoad]};
+      phiTile[lid] = time - dot(xLocal, nVec);
+
+      uLocal = (${my_dtype}3) {ux[itLoad], uy[itLoad], uz[itLoad]};
+      uNextLocal = (${my_dtype}3) {ux[itLoad+1], uy[itLoad+1], uz[itLoad+1]};
+
+      gammaInv = ${f_native}rsqrt( (${my_dtype})1. + dot(uLocal, uLocal) );
+      uLocal *= gammaInv;
+      gammaInv = ${f_native}rsqrt( (${my_dtype})1. + dot(uNextLocal, uNextLocal) );
+      uNextLocal *= gammaInv;
+
+      aLocal = (uNextLocal - uLocal) * dtInv;
+      uLocal = (${my_dtype})0.5 * (uNextLocal + uLocal);
+
+      c1 = dot(aLocal, nVec);
+      c2 = (${my_dtype})1. - dot(uLocal, nVec);
+
+      c2 =  (${my_dtype})1. / c2;
+      c1 = c1*c2*c2;
+
+      ampTile[lid] = c1*(nVec - uLocal) - c2*aLocal;
+    }
+
+    barrier(CLK_LOCAL_MEM_FENCE);
+
+    if (active)
+    {
+      nTile = min(tileSize, itEnd - 1 - itTile);
+      for (uint j=0; j<nTile; j++)
+      {
+        it = itTile + j;
+        it_glob = itStart + it;
+
+        if (it<nSteps-1)
+        {
+          phase = omegaLocal * phiTile[j];
+          dPhase = fabs(phase - phasePrev);
+          phasePrev = phase;
+
+          if (dPhase < (${my_dtype})M_PI)
+          {
+            sinPhase = ${f_native}sin(phase);
+            cosPhase = ${f_native}cos(phase);
+
+            spectrLocalRe += ampTile[j] * cosPhase;
+            spectrLocalIm += ampTile[j] * sinPhase;
+          }
+        }
+
+        if (iSnap<nSnaps && it_glob+2 == itSnaps[iSnap])
+        {
+          spectrum[gti + nTotal*iSnap] +=  wpdt2 * (
+            dot(spectrLocalRe, spectrLocalRe) +
+            dot(spectrLocalIm, spectrLocalIm) );
+          iSnap += 1;
+        }
+      }
+    }
+  }
+}
+
+__kernel void total_recurrence(
+  __global ${my_dtype} *spectrum,
+  __global ${my_dtype} *x,
+  __global ${my_dtype} *y,
+  __global ${my_dtype} *z,
+  __global ${my_dtype} *ux,
+  __global ${my_dtype} *uy,
+  __global ${my_dtype} *uz,
+           ${my_dtype} wp,
+                  uint itStart,
+                  uint itEnd,
+                  uint nSteps,
+  __global ${my_dtype} *omega,
+  __global ${my_dtype} *sinTheta,
+  __global ${my_dtype} *cosTheta,
+  __global ${my_dtype} *sinPhi,
+  __global ${my_dtype} *cosPhi,
+                  uint nOmega,
+                  uint nTheta,
+                  uint nPhi,
+           ${my_dtype} dt,
+                  uint nSnaps,
+  __global        uint *itSnaps,
+           ${my_dtype} dOmega)
+{
+  // each work-item handles a run of ${omega_block} consecutive omegas of one
+  // direction; on a linear grid exp(i*omega_j*phi) is obtained from
+  // exp(i*omega_0*phi) by repeated rotation with exp(i*dOmega*phi)
+  uint gti = (uint) get_global_id(0);
+  uint nBlocks = (nOmega + ${omega_block} - 1) / ${omega_block};
+  uint nTotal = nTheta*nPhi*nOmega;
+
+  if (gti < nBlocks*nTheta*nPhi)
+  {
+    uint iPhi = gti / (nBlocks * nTheta);
+    uint iTheta = (gti - iPhi*nBlocks*nTheta) / nBlocks;
+    uint iBlock = gti - iPhi*nBlocks*nTheta - iTheta*nBlocks;
+
+    uint iOmega0 = iBlock * ${omega_block};
+    uint nOmegaBlock = min((uint)${omega_block}, nOmega - iOmega0);
+    uint gti0 = iOmega0 + nOmega*(iTheta + nTheta*iPhi);
+
+    ${my_dtype}3 nVec = (${my_dtype}3) { sinTheta[iTheta]*cosPhi[iPhi],
+                                         sinTheta[iTheta]*sinPhi[iPhi],
+                                         cosTheta[iTheta] };
+
+    ${my_dtype} omegaLocal[${omega_block}];
+    ${my_dtype}3 spectrLocalRe[${omega_block}];
+    ${my_dtype}3 spectrLocalIm[${omega_block}];
+
+    for (uint j=0; j<${omega_block}; j++)
+    {
+      omegaLocal[j] = (j < nOmegaBlock) ? omega[iOmega0 + j] : omega[iOmega0];
+      spectrLocalRe[j] = (${my_dtype}3) {0., 0., 0.};
+      spectrLocalIm[j] = (${my_dtype}3) {0., 0., 0.};
+    }
+
+    ${my_dtype}3 xLocal, uLocal, uNextLocal, aLocal, amplitude;
+    ${my_dtype} time, phi, dPhi, c1, c2, gammaInv;
+    ${my_dtype} cosPhase, sinPhase, cosStep, sinStep, cosTmp, norm;
+
+    ${my_dtype} dtInv = (${my_dtype})1. / dt;
+    ${my_dtype} wpdt2 =  wp * dt * dt;
+    ${my_dtype} phiPrev = (${my_dtype}) 0.;
+
+    uint iSnap, it_glob;
+    for (iSnap=0; iSnap<nSnaps; iSnap++)
+    {
+      if (itStart < itSnaps[iSnap]) break;
+    }
+
+    for (uint it=0; it<itEnd-1; it++)
+    {
+      it_glob = itStart + it;
+
+      if (it<nSteps-1)
+      {
+        time = (${my_dtype})it_glob * dt;
+        xLocal = (${my_dtype}3) {x[it], y[it], z[it]};
+
+        // retarded time; the phase of omega_j is omega_j * phi
+        phi = time - dot(xLocal, nVec);
+        dPhi = fabs(phi - phiPrev);
+        phiPrev = phi;
+
+        if (fmin(omegaLocal[0], omegaLocal[nOmegaBlock-1]) * dPhi < (${my_dtype})M_PI)
+        {
+          uLocal = (${my_dtype}3) {ux[it], uy[it], uz[it]};
+          uNextLocal = (${my_dtype}3) {ux[it+1], uy[it+1], uz[it+1]};
+
+          gammaInv = ${f_native}rsqrt( (${my_dtype})1. + dot(uLocal, uLocal) );
+          uLocal *= gammaInv;
+          gammaInv = ${f_native}rsqrt( (${my_dtype})1. + dot(uNextLocal, uNextLocal) );
+          uNextLocal *= gammaInv;
+
+          aLocal = (uNextLocal - uLocal) * dtInv;
+          uLocal = (${my_dtype})0.5 * (uNextLocal + uLocal);
+
+          c1 = dot(aLocal, nVec);
+          c2 = (${my_dtype})1. - dot(uLocal, nVec);
+
+          c2 =  (${my_dtype})1. / c2;
+          c1 = c1*c2*c2;
+
+          amplitude = c1*(nVec - uLocal) - c2*aLocal;
+
+          sinPhase = ${f_native}sin(omegaLocal[0] * phi);
+          cosPhase = ${f_native}cos(omegaLocal[0] * phi);
+          sinStep = ${f_native}sin(dOmega * phi);
+          cosStep = ${f_native}cos(dOmega * phi);
+
+          for (uint j=0; j<${omega_block}; j++)
+          {
+            if (j < nOmegaBlock && omegaLocal[j] * dPhi < (${my_dtype})M_PI)
+            {
+              spectrLocalRe[j] += amplitude * cosPhase;
+              spectrLocalIm[j] += amplitude * sinPhase;
+            }
+
+            cosTmp = cosPhase*cosStep - sinPhase*sinStep;
+            sinPhase = sinPhase*cosStep + cosPhase*sinStep;
+            cosPhase = cosTmp;
+
+            // pull the rotated factor back to the unit circle
+            if ((j+1) % ${renorm_interval} == 0)
+            {
+              norm = (${my_dtype})1.5 - (${my_dtype})0.5 * (cosPhase*cosPhase + sinPhase*sinPhase);
+              cosPhase *= norm;
+              sinPhase *= norm;
+            }
+          }
+        }
+      }
+
+      if (iSnap<nSnaps && it_glob+2 == itSnaps[iSnap])
+      {
+        for (uint j=0; j<nOmegaBlock; j++)
+        {
+          spectrum[gti0 + j + nTotal*iSnap] +=  wpdt2 * (
+            dot(spectrLocalRe[j], spectrLocalRe[j]) +
+            dot(spectrLocalIm[j], spectrLocalIm[j]) );
+        }
+        iSnap += 1;
+      }
+    }
+  }
+}
+
+__kernel void total_batch(
+  __global ${my_dtype} *spectrum,
+  __global ${my_dtype} *x,
+  __global ${my_dtype} *y,
+  __global ${my_dtype} *z,
+  __global ${my_dtype} *ux,
+  __global ${my_dtype} *uy,
+  __global ${my_dtype} *uz,
+  __global        uint *trackOffset,
+  __global        uint *trackSteps,
+  __global        uint *trackItStart,
+  __global        uint *trackItEnd,
+  __global ${my_dtype} *trackWeight,
+                  uint nTracks,
+  __global ${my_dtype} *omega,
+  __global ${my_dtype} *sinTheta,
+  __global ${my_dtype} *cosTheta,
+  __global ${my_dtype} *sinPhi,
+  __global ${my_dtype} *cosPhi,
+                  uint nOmega,
+                  uint nTheta,
+                  uint nPhi,
+           ${my_dtype} dt,
+                  uint nSnaps,
+  __global        uint *itSnaps,
+                  uint snapStride)
+{
+  uint gti = (uint) get_global_id(0);
+  uint nTotal = nTheta*nPhi*nOmega;
+
+  if (gti < nTotal)
+  {
+    uint iPhi = gti / (nOmega * nTheta);
+    uint iTheta = (gti - iPhi*nOmega*nTheta) / nOmega;
+    uint iOmega = gti - iPhi*nOmega*nTheta - iTheta*nOmega;
+
+    ${my_dtype} omegaLocal = omega[iOmega];
+    ${my_dtype}3 nVec = (${my_dtype}3) { sinTheta[iTheta]*cosPhi[iPhi],
+                                         sinTheta[iTheta]*sinPhi[iPhi],
+                                         cosTheta[iTheta] };
+
+    ${my_dtype}3 xLocal, uLocal, uNextLocal, aLocal, amplitude;
+    ${my_dtype} time, phase, dPhase, sinPhase, cosPhase, c1, c2, gammaInv;
+
+    ${my_dtype} dtInv = (${my_dtype})1. / dt;
+
+    for (uint iTrack=0; iTrack<nTracks; iTrack++)
+    {
+      uint offset = trackOffset[iTrack];
+      uint nSteps = trackSteps[iTrack];
+      uint itStart = trackItStart[iTrack];
+      uint itEnd = trackItEnd[iTrack];
+      __global uint *itSnapsTrack = itSnaps + iTrack*snapStride;
+
+      ${my_dtype} wpdt2 =  trackWeight[iTrack] * dt * dt;
+      ${my_dtype} phasePrev = (${my_dtype}) 0.;
+      ${my_dtype}3 spectrLocalRe = (${my_dtype}3) {0., 0., 0.};
+      ${my_dtype}3 spectrLocalIm = (${my_dtype}3) {0., 0., 0.};
+
+      uint iSnap, it_glob, itTr;
+      for (iSnap=0; iSnap<nSnaps; iSnap++)
+      {
+        if (itStart < itSnapsTrack[iSnap]) break;
+      }
+
+      for (uint it=0; it<itEnd-1; it++)
+      {
+        it_glob = itStart + it;
+
+        if (it<nSteps-1)
+        {
+          itTr = offset + it;
+          time = (${my_dtype})it_glob * dt;
+          xLocal = (${my_dtype}3) {x[itTr], y[itTr], z[itTr]};
+
+          phase = omegaLocal * (time - dot(xLocal, nVec)) ;
+          dPhase = fabs(phase - phasePrev);
+          phasePrev = phase;
+
+          if (dPhase < (${my_dtype})M_PI)
+          {
+            uLocal = (${my_dtype}3) {ux[itTr], uy[itTr], uz[itTr]};
+            uNextLocal = (${my_dtype}3) {ux[itTr+1], uy[itTr+1], uz[itTr+1]};
+
+            gammaInv = ${f_native}rsqrt( (${my_dtype})1. + dot(uLocal, uLocal) );
+            uLocal *= gammaInv;
+            gammaInv = ${f_native}rsqrt( (${my_dtype})1. + dot(uNextLocal, uNextLocal) );
+            uNextLocal *= gammaInv;
+
+            aLocal = (uNextLocal - uLocal) * dtInv;
+            uLocal = (${my_dtype})0.5 * (uNextLocal + uLocal);
+
+            c1 = dot(aLocal, nVec);
+            c2 = (${my_dtype})1. - dot(uLocal, nVec);
+
+            c2 =  (${my_dtype})1. / c2;
+            c1 = c1*c2*c2;
+
+            sinPhase = ${f_native}sin(phase);
+            cosPhase = ${f_native}cos(phase);
+
+            amplitude = c1*(nVec - uLocal) - c2*aLocal;
+            spectrLocalRe += amplitude * cosPhase;
+            spectrLocalIm += amplitude * sinPhase;
+          }
+        }
+
+        if (iSnap<nSnaps && it_glob+2 == itSnapsTrack[iSnap])
+        {
+          spectrum[gti + nTotal*iSnap] +=  wpdt2 * (
+            dot(spectrLocalRe, spectrLocalRe) +
+            dot(spectrLocalIm, spectrLocalIm) );
+          iSnap += 1;
+        }
+      }
+    }
+  }
+}
+
+__kernel void total_comps(
+  __global ${my_dtype} *spectrum,
+  __global ${my_dtype} *spectrum1,
+  __global ${my_dtype} *spectrum2,
+  __global ${my_dtype} *spectrum3,
+  __global ${my_dtype} *x,
+  __global ${my_dtype} *y,
+  __global ${my_dtype} *z,
+  __global ${my_dtype} *ux,
+  __global ${my_dtype} *uy,
+  __global ${my_dtype} *uz,
+           ${my_dtype} wp,
+                  uint itStart,
+                  uint itEnd,
+                  uint nSteps,
+  __global ${my_dtype} *omega,
+  __global ${my_dtype} *sinTheta,
+  __global ${my_dtype} *cosTheta,
+  __global ${my_dtype} *sinPhi,
+  __global ${my_dtype} *cosPhi,
+                  uint nOmega,
+                  uint nTheta,
+                  uint nPhi,
+           ${my_dtype} dt,
+                  uint nSnaps,
+  __global        uint *itSnaps,
+                  uint spheric)
+{
+  // total 与三个分量在同一个时间循环里累加；
+  // 球坐标分量只是每个方向上的正交旋转，快照时再把笛卡尔振幅投影到 (n, theta, phi)
+  uint gti = (uint) get_global_id(0);
+  uint nTotal = nTheta*nPhi*nOmega;
+
+  if (gti < nTotal)
+  {
+    uint iPhi = gti / (nOmega * nTheta);
+    uint iTheta = (gti - iPhi*nOmega*nTheta) / nOmega;
+    uint iOmega = gti - iPhi*nOmega*nTheta - iTheta*nOmega;
+
+    ${my_dtype} omegaLocal = omega[iOmega];
+    ${my_dtype}3 nVec = (${my_dtype}3) { sinTheta[iTheta]*cosPhi[iPhi],
+                                         sinTheta[iTheta]*sinPhi[iPhi],
+                                         cosTheta[iTheta] };
+    ${my_dtype}3 thVec = (${my_dtype}3) { cosTheta[iTheta]*cosPhi[iPhi],
+                                          cosTheta[iTheta]*sinPhi[iPhi],
+                                         -sinTheta[iTheta] };
+    ${my_dtype}3 phVec = (${my_dtype}3) { -sinPhi[iPhi], cosPhi[iPhi], 0.0};
+
+    ${my_dtype}3 xLocal, uLocal, uNextLocal, aLocal, amplitude, compRe, compIm;
+    ${my_dtype} time, phase, dPhase, sinPhase, cosPhase, c1, c2, gammaInv;
+
+    ${my_dtype} dtInv = (${my_dtype})1. / dt;
+    ${my_dtype} wpdt2 =  wp * dt * dt;
+    ${my_dtype} phasePrev = (${my_dtype}) 0.;
+    ${my_dtype}3 spectrLocalRe = (${my_dtype}3) {0., 0., 0.};
+    ${my_dtype}3 spectrLocalIm = (${my_dtype}3) {0., 0., 0.};
+
+    uint iSnap, it_glob;
+    for (iSnap=0; iSnap<nSnaps; iSnap++)
+    {
+      if (itStart < itSnaps[iSnap]) break;
+    }
+
+    for (uint it=0; it<itEnd-1; it++)
+    {
+      it_glob = itStart + it;
+
+      if (it<nSteps-1)
+      {
+        time = (${my_dtype})it_glob * dt;
+        xLocal = (${my_dtype}3) {x[it], y[it], z[it]};
+
+        phase = omegaLocal * (time - dot(xLocal, nVec)) ;
+        dPhase = fabs(phase - phasePrev);
+        phasePrev = phase;
+
+        if (dPhase < (${my_dtype})M_PI)
+        {
+          uLocal = (${my_dtype}3) {ux[it], uy[it], uz[it]};
+          uNextLocal = (${my_dtype}3) {ux[it+1], uy[it+1], uz[it+1]};
+
+          gammaInv = ${f_native}rsqrt( (${my_dtype})1. + dot(uLocal, uLocal) );
+          uLocal *= gammaInv;
+          gammaInv = ${f_native}rsqrt( (${my_dtype})1. + dot(uNextLocal, uNextLocal) );
+          uNextLocal *= gammaInv;
+
+          aLocal = (uNextLocal - uLocal) * dtInv;
+          uLocal = (${my_dtype})0.5 * (uNextLocal + uLocal);
+
+          c1 = dot(aLocal, nVec);
+          c2 = (${my_dtype})1. - dot(uLocal, nVec);
+
+          c2 =  (${my_dtype})1. / c2;
+          c1 = c1*c2*c2;
+
+          sinPhase = ${f_native}sin(phase);
+          cosPhase = ${f_native}cos(phase);
+
+          amplitude = c1*(nVec - uLocal) - c2*aLocal;
+          spectrLocalRe += amplitude * cosPhase;
+          spectrLocalIm += amplitude * sinPhase;
+        }
+      }
+
+      if (iSnap < nSnaps && it_glob+2 == itSnaps[iSnap])
+      {
+        compRe = spectrLocalRe;
+        compIm = spectrLocalIm;
+        if (spheric)
+        {
+          compRe = (${my_dtype}3) { dot(nVec, spectrLocalRe), dot(thVec, spectrLocalRe), dot(phVec, spectrLocalRe) };
+          compIm = (${my_dtype}3) { dot(nVec, spectrLocalIm), dot(thVec, spectrLocalIm), dot(phVec, spectrLocalIm) };
+        }
+
+        spectrum[gti + nTotal*iSnap] +=  wpdt2 * (
+          dot(spectrLocalRe, spectrLocalRe) +
+          dot(spectrLocalIm, spectrLocalIm) );
+
+        spectrum1[gti + nTotal*iSnap] +=  wpdt2 *
+          (compRe.s0*compRe.s0 + compIm.s0*compIm.s0);
+
+        spectrum2[gti + nTotal*iSnap] +=  wpdt2 *
+          (compRe.s1*compRe.s1 + compIm.s1*compIm.s1);
+
+        spectrum3[gti + nTotal*iSnap] +=  wpdt2 *
+          (compRe.s2*compRe.s2 + compIm.s2*compIm.s2);
+        iSnap += 1;
+      }
+    }
+  }
+}
+
+__kernel void total_comps_tiled(
+  __global ${my_dtype} *spectrum,
+  __global ${my_dtype} *spectrum1,
+  __global ${my_dtype} *spectrum2,
+  __global ${my_dtype} *spectrum3,
+  __global ${my_dtype} *x,
+  __global ${my_dtype} *y,
+  __global ${my_dtype} *z,
+  __global ${my_dtype} *ux,
+  __global ${my_dtype} *uy,
+  __global ${my_dtype} *uz,
+           ${my_dtype} wp,
+                  uint itStart,
+                  uint itEnd,
+                  uint nSteps,
+  __global ${my_dtype} *omega,
+  __global ${my_dtype} *sinTheta,
+  __global ${my_dtype} *cosTheta,
+  __global ${my_dtype} *sinPhi,
+  __global ${my_dtype} *cosPhi,
+                  uint nOmega,
+                  uint nTheta,
+                  uint nPhi,
+           ${my_dtype} dt,
+                  uint nSnaps,
+  __global        uint *itSnaps,
+                  uint spheric,
+  __local  ${my_dtype}3 *xTile,
+  __local  ${my_dtype}3 *uTile)
+{
+  // total_comps with the trajectory tiles of total_tiled: chunks of
+  // get_local_size(0) steps are loaded cooperatively into local memory,
+  // total and the three components accumulate in the same time loop
+  uint gti = (uint) get_global_id(0);
+  uint lid = (uint) get_local_id(0);
+  uint tileSize = (uint) get_local_size(0);
+  uint nTotal = nTheta*nPhi*nOmega;
+
+  // work-items past the grid still take part in loading and barriers
+  bool active = gti < nTotal;
+  uint gtiNode = active ? gti : 0;
+
+  uint iPhi = gtiNode / (nOmega * nTheta);
+  uint iTheta = (gtiNode - iPhi*nOmega*nTheta) / nOmega;
+  uint iOmega = gtiNode - iPhi*nOmega*nTheta - iTheta*nOmega;
+
+  ${my_dtype} omegaLocal = omega[iOmega];
+  ${my_dtype}3 nVec = (${my_dtype}3) { sinTheta[iTheta]*cosPhi[iPhi],
+                                       sinTheta[iTheta]*sinPhi[iPhi],
+                                       cosTheta[iTheta] };
+  ${my_dtype}3 thVec = (${my_dtype}3) { cosTheta[iTheta]*cosPhi[iPhi],
+                                        cosTheta[iTheta]*sinPhi[iPhi],
+                                       -sinTheta[iTheta] };
+  ${my_dtype}3 phVec = (${my_dtype}3) { -sinPhi[iPhi], cosPhi[iPhi], 0.0};
+
+  ${my_dtype}3 xLocal, uLocal, uNextLocal, aLocal, amplitude, compRe, compIm;
+  ${my_dtype} time, phase, dPhase, sinPhase, cosPhase, c1, c2, gammaInv;
+
+  ${my_dtype} dtInv = (${my_dtype})1. / dt;
+  ${my_dtype} wpdt2 =  wp * dt * dt;
+  ${my_dtype} phasePrev = (${my_dtype}) 0.;
+  ${my_dtype}3 spectrLocalRe = (${my_dtype}3) {0., 0., 0.};
+  ${my_dtype}3 spectrLocalIm = (${my_dtype}3) {0., 0., 0.};
+
+  uint iSnap, it, it_glob, itLoad, nTile;
+  for (iSnap=0; iSnap<nSnaps; iSnap++)
+  {
+    if (itStart < itSnaps[iSnap]) break;
+  }
+
+  for (uint itTile=0; itTile<itEnd-1; itTile+=tileSize)
+  {
+    barrier(CLK_LOCAL_MEM_FENCE);
+
+    itLoad = itTile + lid;
+    if (itLoad < nSteps)
+    {
+      xTile[lid] = (${my_dtype}3) {x[itLoad], y[itLoad], z[itLoad]};
+      uLocal = (${my_dtype}3) {ux[itLoad], uy[itLoad], uz[itLoad]};
+      gammaInv = ${f_native}rsqrt( (${my_dtype})1. + dot(uLocal, uLocal) );
+      uTile[lid] = uLocal * gammaInv;
+    }
+
+    itLoad = itTile + tileSize;
+    if (lid == 0 && itLoad < nSteps)
+    {
+      uLocal = (${my_dtype}3) {ux[itLoad], uy[itLoad], uz[itLoad]};
+      gammaInv = ${f_native}rsqrt( (${my_dtype})1. + dot(uLocal, uLocal) );
+      uTile[tileSize] = uLocal * gammaInv;
+    }
+
+    barrier(CLK_LOCAL_MEM_FENCE);
+
+    if (active)
+    {
+      nTile = min(tileSize, itEnd - 1 - itTile);
+      for (uint j=0; j<nTile; j++)
+      {
+        it = itTile + j;
+        it_glob = itStart + it;
+
+        if (it<nSteps-1)
+        {
+          time = (${my_dtype})it_glob * dt;
+          xLocal = xTile[j];
+
+          phase = omegaLocal * (time - dot(xLocal, nVec)) ;
+          dPhase = fabs(phase - phasePrev);
+          phasePrev = phase;
+
+          if (dPhase < (${my_dtype})M_PI)
+          {
+            uLocal = uTile[j];
+            uNextLocal = uTile[j+1];
+
+            aLocal = (uNextLocal - uLocal) * dtInv;
+            uLocal = (${my_dtype})0.5 * (uNextLocal + uLocal);
+
+            c1 = dot(aLocal, nVec);
+            c2 = (${my_dtype})1. - dot(uLocal, nVec);
+
+            c2 =  (${my_dtype})1. / c2;
+            c1 = c1*c2*c2;
+
+            sinPhase = ${f_native}sin(phase);
+            cosPhase = ${f_native}cos(phase);
+
+            amplitude = c1*(nVec - uLocal) - c2*aLocal;
+
+            spectrLocalRe += amplitude * cosPhase;
+            spectrLocalIm += amplitude * sinPhase;
+          }
+        }
+
+        if (iSnap<nSnaps && it_glob+2 == itSnaps[iSnap])
+        {
+          compRe = spectrLocalRe;
+          compIm = spectrLocalIm;
+          if (spheric)
+          {
+            compRe = (${my_dtype}3) { dot(nVec, spectrLocalRe), dot(thVec, spectrLocalRe), dot(phVec, spectrLocalRe) };
+            compIm = (${my_dtype}3) { dot(nVec, spectrLocalIm), dot(thVec, spectrLocalIm), dot(phVec, spectrLocalIm) };
+          }
+
+          spectrum[gti + nTotal*iSnap] +=  wpdt2 * (
+            dot(spectrLocalRe, spectrLocalRe) +
+            dot(spectrLocalIm, spectrLocalIm) );
+
+          spectrum1[gti + nTotal*iSnap] +=  wpdt2 *
+            (compRe.s0*compRe.s0 + compIm.s0*compIm.s0);
+
+          spectrum2[gti + nTotal*iSnap] +=  wpdt2 *
+            (compRe.s1*compRe.s1 + compIm.s1*compIm.s1);
+
+          spectrum3[gti + nTotal*iSnap] +=  wpdt2 *
+            (compRe.s2*compRe.s2 + compIm.s2*compIm.s2);
+          iSnap += 1;
+        }
+      }
+    }
+  }
+}
+
+__kernel void track_beta(
+  __global ${my_dtype} *ux,
+  __global ${my_dtype} *uy,
+  __global ${my_dtype} *uz,
+  __global ${my_dtype}4 *beta,
+                  uint nSteps)
+{
+  // normalized velocity of every sample, computed once per track
+  uint it = (uint) get_global_id(0);
+
+  if (it < nSteps)
+  {
+    ${my_dtype}3 uLocal = (${my_dtype}3) {ux[it], uy[it], uz[it]};
+    ${my_dtype} gammaInv = ${f_native}rsqrt( (${my_dtype})1. + dot(uLocal, uLocal) );
+    uLocal *= gammaInv;
+    beta[it] = (${my_dtype}4) {uLocal.x, uLocal.y, uLocal.z, (${my_dtype})0.};
+  }
+}
+
+__kernel void smooth_beta(
+  __global ${my_dtype}4 *beta,
+  __global ${my_dtype}4 *betaOut,
+                  uint nSteps)
+{
+  // one pass of the binomial [1 2 1]/4 filter; the end points are kept
+  uint it = (uint) get_global_id(0);
+
+  if (it < nSteps)
+  {
+    if (it == 0 || it == nSteps-1)
+      betaOut[it] = beta[it];
+    else
+      betaOut[it] = (${my_dtype})0.25 * (beta[it-1] + beta[it+1]) + (${my_dtype})0.5 * beta[it];
+  }
+}
+
+__kernel void prepare_track(
+  __global ${my_dtype} *x,
+  __global ${my_dtype} *y,
+  __global ${my_dtype} *z,
+  __global ${my_dtype}4 *beta,
+  __global ${my_dtype}4 *xt,
+  __global ${my_dtype}4 *betaMid,
+  __global ${my_dtype}4 *betaDot,
+                  uint itStart,
+                  uint nSteps,
+                  uint upsample,
+           ${my_dtype} dt)
+{
+  // per-step arrays for total_prepared: every step of the track is split
+  // into `upsample` sub-steps. Inside a step, position and velocity are
+  // cubic Hermite interpolants: x with slopes beta (known exactly), beta
+  // with central-difference slopes. Each sub-step gets the position and
+  // time at its start, the mean of the velocities at its ends and their
+  // difference quotient. With upsample = 1 the interpolants reduce to the
+  // end points and the values are exactly the ones total computes for
+  // every grid node
+  uint k = (uint) get_global_id(0);
+
+  if (k < (nSteps-1)*upsample)
+  {
+    uint it = k / upsample;
+    uint s = k - it*upsample;
+    ${my_dtype} dtInv = (${my_dtype})1. / dt;
+    ${my_dtype} dtSub = dt / (${my_dtype})upsample;
+
+    ${my_dtype}3 x0 = (${my_dtype}3) {x[it], y[it], z[it]};
+    ${my_dtype}3 x1 = (${my_dtype}3) {x[it+1], y[it+1], z[it+1]};
+    ${my_dtype}3 b0 = beta[it].xyz;
+    ${my_dtype}3 b1 = beta[it+1].xyz;
+
+    // slopes of beta at the two ends (times dt), one-sided at the track ends
+    ${my_dtype}3 d0 = (it > 0) ? (${my_dtype})0.5 * (b1 - beta[it-1].xyz) : b1 - b0;
+    ${my_dtype}3 d1 = (it+2 < nSteps) ? (${my_dtype})0.5 * (beta[it+2].xyz - b0) : b1 - b0;
+
+    ${my_dtype} t0 = (${my_dtype})s / (${my_dtype})upsample;
+    ${my_dtype} t1 = (${my_dtype})(s+1) / (${my_dtype})upsample;
+
+    // Hermite basis h00, h10, h01, h11 at t0 and t1
+    ${my_dtype}4 h0 = (${my_dtype}4) { (${my_dtype})2.*t0*t0*t0 - (${my_dtype})3.*t0*t0 + (${my_dtype})1.,
+                                       t0*t0*t0 - (${my_dtype})2.*t0*t0 + t0,
+                                       -(${my_dtype})2.*t0*t0*t0 + (${my_dtype})3.*t0*t0,
+                                       t0*t0*t0 - t0*t0 };
+    ${my_dtype}4 h1 = (${my_dtype}4) { (${my_dtype})2.*t1*t1*t1 - (${my_dtype})3.*t1*t1 + (${my_dtype})1.,
+                                       t1*t1*t1 - (${my_dtype})2.*t1*t1 + t1,
+                                       -(${my_dtype})2.*t1*t1*t1 + (${my_dtype})3.*t1*t1,
+                                       t1*t1*t1 - t1*t1 };
+
+    ${my_dtype}3 xLocal = h0.x*x0 + h0.y*dt*b0 + h0.z*x1 + h0.w*dt*b1;
+    ${my_dtype}3 uLocal = h0.x*b0 + h0.y*d0 + h0.z*b1 + h0.w*d1;
+    ${my_dtype}3 uNextLocal = h1.x*b0 + h1.y*d0 + h1.z*b1 + h1.w*d1;
+    ${my_dtype} time = (${my_dtype})(itStart*upsample + k) * dtSub;
+
+    ${my_dtype}3 aLocal = (uNextLocal - uLocal) * ((${my_dtype})upsample * dtInv);
+    uLocal = (${my_dtype})0.5 * (uNextLocal + uLocal);
+
+    xt[k] = (${my_dtype}4) {xLocal.x, xLocal.y, xLocal.z, time};
+    betaMid[k] = (${my_dtype}4) {uLocal.x, uLocal.y, uLocal.z, (${my_dtype})0.};
+    betaDot[k] = (${my_dtype}4) {aLocal.x, aLocal.y, aLocal.z, (${my_dtype})0.};
+  }
+}
+
+__kernel void total_prepared(
+  __global ${my_dtype} *spectrum,
+  __global ${my_dtype}4 *xt,
+  __global ${my_dtype}4 *betaMid,
+  __global ${my_dtype}4 *betaDot,
+           ${my_dtype} wp,
+                  uint itStart,
+                  uint itEnd,
+                  uint nSteps,
+  __global ${my_dtype} *omega,
+  __global ${my_dtype} *sinTheta,
+  __global ${my_dtype} *cosTheta,
+  __global ${my_dtype} *sinPhi,
+  __global ${my_dtype} *cosPhi,
+                  uint nOmega,
+                  uint nTheta,
+                  uint nPhi,
+           ${my_dtype} dt,
+                  uint nSnaps,
+  __global        uint *itSnaps,
+                  uint upsample)
+{
+  // total on the arrays of prepare_track: time, position, velocity and
+  // acceleration are read instead of recomputed for every grid node.
+  // dt is the sub-step; itStart, itEnd, nSteps and itSnaps count the
+  // original steps
+  uint gti = (uint) get_global_id(0);
+  uint nTotal = nTheta*nPhi*nOmega;
+
+  if (gti < nTotal)
+  {
+    uint iPhi = gti / (nOmega * nTheta);
+    uint iTheta = (gti - iPhi*nOmega*nTheta) / nOmega;
+    uint iOmega = gti - iPhi*nOmega*nTheta - iTheta*nOmega;
+
+    ${my_dtype} omegaLocal = omega[iOmega];
+    ${my_dtype}3 nVec = (${my_dtype}3) { sinTheta[iTheta]*cosPhi[iPhi],
+                                         sinTheta[iTheta]*sinPhi[iPhi],
+                                         cosTheta[iTheta] };
+
+    ${my_dtype}4 xtLocal;
+    ${my_dtype}3 uLocal, aLocal, amplitude;
+    ${my_dtype} phase, dPhase, sinPhase, cosPhase, c1, c2;
+
+    ${my_dtype} wpdt2 =  wp * dt * dt;
+    ${my_dtype} phasePrev = (${my_dtype}) 0.;
+    ${my_dtype}3 spectrLocalRe = (${my_dtype}3) {0., 0., 0.};
+    ${my_dtype}3 spectrLocalIm = (${my_dtype}3) {0., 0., 0.};
+
+    uint iSnap, it;
+    for (iSnap=0; iSnap<nSnaps; iSnap++)
+    {
+      if (itStart < itSnaps[iSnap]) break;
+    }
+
+    for (uint k=0; k<(itEnd-1)*upsample; k++)
+    {
+      if (k<(nSteps-1)*upsample)
+      {
+        xtLocal = xt[k];
+
+        phase = omegaLocal * (xtLocal.w - dot(xtLocal.xyz, nVec)) ;
+        dPhase = fabs(phase - phasePrev);
+        phasePrev = phase;
+
+        if (dPhase < (${my_dtype})M_PI)
+        {
+          uLocal = betaMid[k].xyz;
+          aLocal = betaDot[k].xyz;
+
+          c1 = dot(aLocal, nVec);
+          c2 = (${my_dtype})1. - dot(uLocal, nVec);
+
+          c2 =  (${my_dtype})1. / c2;
+          c1 = c1*c2*c2;
+
+          sinPhase = ${f_native}sin(phase);
+          cosPhase = ${f_native}cos(phase);
+
+          amplitude = c1*(nVec - uLocal) - c2*aLocal;
+          spectrLocalRe += amplitude * cosPhase;
+          spectrLocalIm += amplitude * sinPhase;
+        }
+      }
+
+      // snapshots are taken at the end of an original step
+      it = k / upsample;
+      if (k - it*upsample == upsample-1 && iSnap<nSnaps && itStart+it+2 == itSnaps[iSnap])
+      {
+        spectrum[gti + nTotal*iSnap] +=  wpdt2 * (
+          dot(spectrLocalRe, spectrLocalRe) +
+          dot(spectrLocalIm, spectrLocalIm) );
+        iSnap += 1;
+      }
+    }
+  }
+}
+
+__kernel void decimate(
+  __global ${my_dtype} *x,
+  __global ${my_dtype} *y,
+  __global ${my_dtype} *z,
+  __global ${my_dtype} *ux,
+  __global ${my_dtype} *uy,
+  __global ${my_dtype} *uz,
+  __global ${my_dtype} *xOut,
+  __global ${my_dtype} *yOut,
+  __global ${my_dtype} *zOut,
+  __global ${my_dtype} *uxOut,
+  __global ${my_dtype} *uyOut,
+  __global ${my_dtype} *uzOut,
+                  uint nOut)
+{
+  // 轨迹金字塔的下一层：每隔一步取一个点
+  uint j = (uint) get_global_id(0);
+
+  if (j < nOut)
+  {
+    xOut[j] = x[2*j];
+    yOut[j] = y[2*j];
+    zOut[j] = z[2*j];
+    uxOut[j] = ux[2*j];
+    uyOut[j] = uy[2*j];
+    uzOut[j] = uz[2*j];
+  }
+}
+
+__kernel void phase_step_bound(
+  __global ${my_dtype} *bound,
+  __global ${my_dtype} *x,
+  __global ${my_dtype} *y,
+  __global ${my_dtype} *z,
+                  uint nCoarse,
+                  uint stride,
+                  uint itStart,
+           ${my_dtype} dt,
+  __global ${my_dtype} *sinTheta,
+  __global ${my_dtype} *cosTheta,
+  __global ${my_dtype} *sinPhi,
+  __global ${my_dtype} *cosPhi,
+                  uint nTheta,
+                  uint nPhi)
+{
+  // 每个方向上相邻（抽取后）步之间推迟时间 t - n.x 的最大变化，乘以 omega 即每步相位
+  uint gti = (uint) get_global_id(0);
+
+  if (gti < nTheta*nPhi)
+  {
+    uint iPhi = gti / nTheta;
+    uint iTheta = gti - iPhi*nTheta;
+
+    ${my_dtype}3 nVec = (${my_dtype}3) { sinTheta[iTheta]*cosPhi[iPhi],
+                                         sinTheta[iTheta]*sinPhi[iPhi],
+                                         cosTheta[iTheta] };
+
+    ${my_dtype} psi, psiPrev, maxStep = (${my_dtype}) 0.;
+    psiPrev = (${my_dtype})itStart * dt - dot((${my_dtype}3) {x[0], y[0], z[0]}, nVec);
+
+    for (uint j=1; j<nCoarse; j++)
+    {
+      psi = (${my_dtype})(itStart + j*stride) * dt - dot((${my_dtype}3) {x[j], y[j], z[j]}, nVec);
+      maxStep = fmax(maxStep, fabs(psi - psiPrev));
+      psiPrev = psi;
+    }
+    bound[gti] = maxStep;
+  }
+}
+
+void band_step_coarse(
+  ${my_dtype}3 xLocal,
+  ${my_dtype}3 xNextLocal,
+  ${my_dtype}3 uLocal,
+  ${my_dtype}3 uNextLocal,
+  ${my_dtype} time,
+  ${my_dtype} timeNext,
+  ${my_dtype} dt,
+  uint stride,
+  ${my_dtype} omegaLocal,
+  ${my_dtype}3 nVec,
+  ${my_dtype} *phasePrev,
+  ${my_dtype}3 *spectrLocalRe,
+  ${my_dtype}3 *spectrLocalIm)
+{
+  // 振幅 c1*(n-beta) - c2*a 恰好是 V = (n (n.beta) - beta) / (1 - n.beta) 的时间导数，
+  // 粗步上直接用 V 的增量（速度振荡未被分辨时也精确），相位取 stride 个细步
+  // 左端点相位的平均位置，误差只由每个粗步内的相位变化控制
+  ${my_dtype}3 vLocal, vNextLocal, amplitude;
+  ${my_dtype} phase, phaseNext, dPhase, gammaInv;
+
+  phase = omegaLocal * (time - dot(xLocal, nVec));
+  phaseNext = omegaLocal * (timeNext - dot(xNextLocal, nVec));
+  phase += (phaseNext - phase) * (${my_dtype})(stride - 1) / (${my_dtype})(2 * stride);
+  dPhase = fabs(phase - *phasePrev);
+  *phasePrev = phase;
+
+  if (dPhase < (${my_dtype})M_PI)
+  {
+    gammaInv = ${f_native}rsqrt( (${my_dtype})1. + dot(uLocal, uLocal) );
+    uLocal *= gammaInv;
+    gammaInv = ${f_native}rsqrt( (${my_dtype})1. + dot(uNextLocal, uNextLocal) );
+    uNextLocal *= gammaInv;
+
+    vLocal = (nVec * dot(nVec, uLocal) - uLocal) / ((${my_dtype})1. - dot(nVec, uLocal));
+    vNextLocal = (nVec * dot(nVec, uNextLocal) - uNextLocal) / ((${my_dtype})1. - dot(nVec, uNextLocal));
+
+    amplitude = (vNextLocal - vLocal) / dt;
+    *spectrLocalRe += amplitude * ${f_native}cos(phase);
+    *spectrLocalIm += amplitude * ${f_native}sin(phase);
+  }
+}
+
+void band_step(
+  ${my_dtype}3 xLocal,
+  ${my_dtype}3 uLocal,
+  ${my_dtype}3 uNextLocal,
+  ${my_dtype} time,
+  ${my_dtype} dtInv,
+  ${my_dtype} omegaLocal,
+  ${my_dtype}3 nVec,
+  ${my_dtype} *phasePrev,
+  ${my_dtype}3 *spectrLocalRe,
+  ${my_dtype}3 *spectrLocalIm)
+{
+  // 与 total 相同的单步累加
+  ${my_dtype}3 aLocal, amplitude;
+  ${my_dtype} phase, dPhase, c1, c2, gammaInv;
+
+  phase = omegaLocal * (time - dot(xLocal, nVec)) ;
+  dPhase = fabs(phase - *phasePrev);
+  *phasePrev = phase;
+
+  if (dPhase < (${my_dtype})M_PI)
+  {
+    gammaInv = ${f_native}rsqrt( (${my_dtype})1. + dot(uLocal, uLocal) );
+    uLocal *= gammaInv;
+    gammaInv = ${f_native}rsqrt( (${my_dtype})1. + dot(uNextLocal, uNextLocal) );
+    uNextLocal *= gammaInv;
+
+    aLocal = (uNextLocal - uLocal) * dtInv;
+    uLocal = (${my_dtype})0.5 * (uNextLocal + uLocal);
+
+    c1 = dot(aLocal, nVec);
+    c2 = (${my_dtype})1. - dot(uLocal, nVec);
+
+    c2 =  (${my_dtype})1. / c2;
+    c1 = c1*c2*c2;
+
+    amplitude = c1*(nVec - uLocal) - c2*aLocal;
+    *spectrLocalRe += amplitude * ${f_native}cos(phase);
+    *spectrLocalIm += amplitude * ${f_native}sin(phase);
+  }
+}
+
+__kernel void total_band(
+  __global ${my_dtype} *spectrum,
+  __global ${my_dtype} *xc,
+  __global ${my_dtype} *yc,
+  __global ${my_dtype} *zc,
+  __global ${my_dtype} *uxc,
+  __global ${my_dtype} *uyc,
+  __global ${my_dtype} *uzc,
+  __global ${my_dtype} *x,
+  __global ${my_dtype} *y,
+  __global ${my_dtype} *z,
+  __global ${my_dtype} *ux,
+  __global ${my_dtype} *uy,
+  __global ${my_dtype} *uz,
+           ${my_dtype} wp,
+                  uint itStart,
+                  uint itEnd,
+                  uint nSteps,
+  __global ${my_dtype} *omega,
+  __global ${my_dtype} *sinTheta,
+  __global ${my_dtype} *cosTheta,
+  __global ${my_dtype} *sinPhi,
+  __global ${my_dtype} *cosPhi,
+                  uint nOmega,
+                  uint nTheta,
+                  uint nPhi,
+           ${my_dtype} dt,
+                  uint nSnaps,
+  __global        uint *itSnaps,
+                  uint iOmega0,
+                  uint nOmegaBand,
+                  uint stride)
+{
+  // 频段 [iOmega0, iOmega0+nOmegaBand) 在抽取 stride 倍的轨迹 (xc..uzc) 上求和，
+  // 快照附近与不足一个粗步的尾部用原始轨迹 (x..uz) 逐步处理，
+  // 因此快照包含的步与 total 完全相同；stride = 1 时结果与 total 相同
+  uint gti = (uint) get_global_id(0);
+  uint nBand = nTheta*nPhi*nOmegaBand;
+  uint nTotal = nTheta*nPhi*nOmega;
+
+  if (gti < nBand)
+  {
+    uint iPhi = gti / (nOmegaBand * nTheta);
+    uint iTheta = (gti - iPhi*nOmegaBand*nTheta) / nOmegaBand;
+    uint iOmega = iOmega0 + gti - iPhi*nOmegaBand*nTheta - iTheta*nOmegaBand;
+    uint iGrid = iOmega + nOmega*(iTheta + nTheta*iPhi);
+
+    ${my_dtype} omegaLocal = omega[iOmega];
+    ${my_dtype}3 nVec = (${my_dtype}3) { sinTheta[iTheta]*cosPhi[iPhi],
+                                         sinTheta[iTheta]*sinPhi[iPhi],
+                                         cosTheta[iTheta] };
+
+    ${my_dtype} dtInv = (${my_dtype})1. / dt;
+    ${my_dtype} wpdt2 =  wp * dt * dt;
+    ${my_dtype} phasePrev = (${my_dtype}) 0.;
+    ${my_dtype}3 spectrLocalRe = (${my_dtype}3) {0., 0., 0.};
+    ${my_dtype}3 spectrLocalIm = (${my_dtype}3) {0., 0., 0.};
+
+    uint iSnap;
+    for (iSnap=0; iSnap<nSnaps; iSnap++)
+    {
+      if (itStart < itSnaps[iSnap]) break;
+    }
+    // 与 total 一致：itSnaps = itStart+1 的快照永远不会写出，其后的也不会
+    if (iSnap < nSnaps && itSnaps[iSnap] < itStart + 2) iSnap = nSnaps;
+
+    uint nFine = (itEnd > nSteps ? nSteps : itEnd);
+    nFine = nFine > 0 ? nFine - 1 : 0;
+    uint nCoarse = stride > 1 ? nFine / stride : 0;
+
+    uint it = 0, itNext, limit;
+    while (it < nFine)
+    {
+      while (iSnap < nSnaps && itSnaps[iSnap] < itStart + it + 2)
+      {
+        spectrum[iGrid + nTotal*iSnap] +=  wpdt2 * (
+          dot(spectrLocalRe, spectrLocalRe) +
+          dot(spectrLocalIm, spectrLocalIm) );
+        iSnap += 1;
+      }
+
+      // 粗步不能跨过下一个快照：快照附近与尾部按原始步长处理，直到重新对齐
+      limit = iSnap < nSnaps ? itSnaps[iSnap] - 1 - itStart : nFine;
+      limit = limit < nCoarse*stride ? limit : nCoarse*stride;
+      itNext = (it % stride == 0 && it + stride <= limit) ? it + stride : it + 1;
+
+      if (itNext > it + 1)
+      {
+        uint j = it / stride;
+        band_step_coarse((${my_dtype}3) {xc[j], yc[j], zc[j]},
+                         (${my_dtype}3) {xc[j+1], yc[j+1], zc[j+1]},
+                         (${my_dtype}3) {uxc[j], uyc[j], uzc[j]},
+                         (${my_dtype}3) {uxc[j+1], uyc[j+1], uzc[j+1]},
+                         (${my_dtype})(itStart + it) * dt, (${my_dtype})(itStart + it + stride) * dt,
+                         dt, stride, omegaLocal, nVec, &phasePrev, &spectrLocalRe, &spectrLocalIm);
+      }
+      else
+      {
+        band_step((${my_dtype}3) {x[it], y[it], z[it]},
+                  (${my_dtype}3) {ux[it], uy[it], uz[it]},
+                  (${my_dtype}3) {ux[it+1], uy[it+1], uz[it+1]},
+                  (${my_dtype})(itStart + it) * dt, dtInv,
+                  omegaLocal, nVec, &phasePrev, &spectrLocalRe, &spectrLocalIm);
+      }
+      it = itNext;
+    }
+
+    while (iSnap < nSnaps && itSnaps[iSnap] <= itStart + itEnd)
+    {
+      spectrum[iGrid + nTotal*iSnap] +=  wpdt2 * (
+        dot(spectrLocalRe, spectrLocalRe) +
+        dot(spectrLocalIm, spectrLocalIm) );
+      iSnap += 1;
+    }
+  }
+}
+
+__kernel void total_mixed(
+  __global ${my_dtype} *spectrum,
+  __global ${phase_dtype} *x,
+  __global ${phase_dtype} *y,
+  __global ${phase_dtype} *z,
+  __global ${my_dtype} *ux,
+  __global ${my_dtype} *uy,
+  __global ${my_dtype} *uz,
+           ${my_dtype} wp,
+                  uint itStart,
+                  uint itEnd,
+                  uint nSteps,
+  __global ${phase_dtype} *omega,
+  __global ${phase_dtype} *sinTheta,
+  __global ${phase_dtype} *cosTheta,
+  __global ${phase_dtype} *sinPhi,
+  __global ${phase_dtype} *cosPhi,
+                  uint nOmega,
+                  uint nTheta,
+                  uint nPhi,
+           ${phase_dtype} dt,
+                  uint nSnaps,
+  __global        uint *itSnaps)
+{
+  // 混合精度：推迟时间与相位用 ${phase_dtype}，并在转换前约化到 [-pi, pi]；
+  // 振幅与累加用 ${my_dtype}，累加采用 Kahan 补偿求和
+  uint gti = (uint) get_global_id(0);
+  uint nTotal = nTheta*nPhi*nOmega;
+
+  if (gti < nTotal)
+  {
+    uint iPhi = gti / (nOmega * nTheta);
+    uint iTheta = (gti - iPhi*nOmega*nTheta) / nOmega;
+    uint iOmega = gti - iPhi*nOmega*nTheta - iTheta*nOmega;
+
+    ${phase_dtype} omegaLocal = omega[iOmega];
+    ${phase_dtype}3 nVecPhase = (${phase_dtype}3) { sinTheta[iTheta]*cosPhi[iPhi],
+                                                    sinTheta[iTheta]*sinPhi[iPhi],
+                                                    cosTheta[iTheta] };
+    ${my_dtype}3 nVec = convert_${my_dtype}3(nVecPhase);
+
+    ${phase_dtype}3 xLocal, uPhase, uNextPhase;
+    ${phase_dtype} time, phase, dPhase;
+    ${my_dtype}3 uLocal, uNextLocal, aLocal, amplitude, yRe, yIm, tRe, tIm;
+    ${my_dtype} phaseReduced, sinPhase, cosPhase, c1, c2, gammaInv;
+
+    ${my_dtype} dtInv = (${my_dtype})(1. / dt);
+    ${my_dtype} wpdt2 =  wp * (${my_dtype})(dt * dt);
+    ${phase_dtype} phasePrev = (${phase_dtype}) 0.;
+    ${my_dtype}3 spectrLocalRe = (${my_dtype}3) {0., 0., 0.};
+    ${my_dtype}3 spectrLocalIm = (${my_dtype}3) {0., 0., 0.};
+    ${my_dtype}3 compRe = (${my_dtype}3) {0., 0., 0.};
+    ${my_dtype}3 compIm = (${my_dtype}3) {0., 0., 0.};
+
+    uint iSnap, it_glob;
+    for (iSnap=0; iSnap<nSnaps; iSnap++)
+    {
+      if (itStart < itSnaps[iSnap]) break;
+    }
+
+    for (uint it=0; it<itEnd-1; it++)
+    {
+      it_glob = itStart + it;
+
+      if (it<nSteps-1)
+      {
+        time = (${phase_dtype})it_glob * dt;
+        xLocal = (${phase_dtype}3) {x[it], y[it], z[it]};
+
+        phase = omegaLocal * (time - dot(xLocal, nVecPhase)) ;
+        dPhase = fabs(phase - phasePrev);
+        phasePrev = phase;
+
+        if (dPhase < (${phase_dtype})M_PI)
+        {
+          uLocal = (${my_dtype}3) {ux[it], uy[it], uz[it]};
+          uNextLocal = (${my_dtype}3) {ux[it+1], uy[it+1], uz[it+1]};
+
+          gammaInv = ${f_native}rsqrt( (${my_dtype})1. + dot(uLocal, uLocal) );
+          uLocal *= gammaInv;
+          gammaInv = ${f_native}rsqrt( (${my_dtype})1. + dot(uNextLocal, uNextLocal) );
+          uNextLocal *= gammaInv;
+
+          aLocal = (uNextLocal - uLocal) * dtInv;
+          uLocal = (${my_dtype})0.5 * (uNextLocal + uLocal);
+
+          // 多普勒因子 1 - n.beta 即推迟时间的导数，相对论粒子上抵消严重，同样用 ${phase_dtype}
+          uPhase = convert_${phase_dtype}3((${my_dtype}3) {ux[it], uy[it], uz[it]});
+          uPhase *= rsqrt( (${phase_dtype})1. + dot(uPhase, uPhase) );
+          uNextPhase = convert_${phase_dtype}3((${my_dtype}3) {ux[it+1], uy[it+1], uz[it+1]});
+          uNextPhase *= rsqrt( (${phase_dtype})1. + dot(uNextPhase, uNextPhase) );
+
+          c1 = dot(aLocal, nVec);
+          c2 = (${my_dtype})( (${phase_dtype})1. /
+            ((${phase_dtype})1. - (${phase_dtype})0.5 * dot(uPhase + uNextPhase, nVecPhase)) );
+          c1 = c1*c2*c2;
+
+          phaseReduced = (${my_dtype})(phase - (${phase_dtype})(2*M_PI) * rint(phase * (${phase_dtype})(0.5*M_1_PI)));
+          sinPhase = ${f_native}sin(phaseReduced);
+          cosPhase = ${f_native}cos(phaseReduced);
+
+          amplitude = c1*(nVec - uLocal) - c2*aLocal;
+
+          yRe = amplitude * cosPhase - compRe;
+          tRe = spectrLocalRe + yRe;
+          compRe = (tRe - spectrLocalRe) - yRe;
+          spectrLocalRe = tRe;
+
+          yIm = amplitude * sinPhase - compIm;
+          tIm = spectrLocalIm + yIm;
+          compIm = (tIm - spectrLocalIm) - yIm;
+          spectrLocalIm = tIm;
+        }
+      }
+
+      if (iSnap < nSnaps && it_glob+2 == itSnaps[iSnap])
+      {
+        spectrum[gti + nTotal*iSnap] +=  wpdt2 * (
+          dot(spectrLocalRe, spectrLocalRe) +
+          dot(spectrLocalIm, spectrLocalIm) );
+        iSnap += 1;
+      }
+    }
+  }
+}
+
 __kernel void cartesian_comps(
   __global ${my_dtype} *spectrum1,
   __global ${my_dtype} *spectrum2,
@@ -593,3 +2289,72 @@ __kernel void spheric_comps_complex(
     }
   }
 }
+
+// Reductions of a spectrum (nSnaps, nDirs, nOmega) before it is fetched.
+// reduce_directions: partial sums over chunks of dirChunk directions,
+//   result (nSnaps, nChunks, nOmega); the host adds the chunks
+__kernel void reduce_directions(
+  __global ${my_dtype} *spectrum,
+  __global ${my_dtype} *dirWeights,
+  __global ${my_dtype} *result,
+                  uint nOmega,
+                  uint nDirs,
+                  uint dirChunk,
+                  uint nChunks,
+                  uint nSnaps)
+{
+  uint gti = (uint) get_global_id(0);
+
+  if (gti < nOmega*nChunks*nSnaps)
+  {
+    uint iSnap = gti / (nOmega*nChunks);
+    uint iChunk = (gti - iSnap*nOmega*nChunks) / nOmega;
+    uint iOmega = gti - iSnap*nOmega*nChunks - iChunk*nOmega;
+
+    uint iDirStart = iChunk * dirChunk;
+    uint iDirEnd = min(iDirStart + dirChunk, nDirs);
+    ${my_dtype} acc = (${my_dtype}) 0.;
+
+    for (uint iDir=iDirStart; iDir<iDirEnd; iDir++)
+    {
+      acc += dirWeights[iDir] * spectrum[(iSnap*nDirs + iDir)*nOmega + iOmega];
+    }
+    result[gti] = acc;
+  }
+}
+
+// reduce_omega: integral over omega and the maximum over omega (first one
+//   on ties) with its index, per snapshot and direction, result (nSnaps, nDirs)
+__kernel void reduce_omega(
+  __global ${my_dtype} *spectrum,
+  __global ${my_dtype} *omegaWeights,
+  __global ${my_dtype} *angular,
+  __global ${my_dtype} *peakValue,
+  __global        uint *peakIndex,
+                  uint nOmega,
+                  uint nDirs,
+                  uint nSnaps)
+{
+  uint gti = (uint) get_global_id(0);
+
+  if (gti < nDirs*nSnaps)
+  {
+    __global ${my_dtype} *spectrumDir = spectrum + gti*nOmega;
+    ${my_dtype} acc = (${my_dtype}) 0.;
+    ${my_dtype} value = spectrumDir[0];
+    uint index = 0;
+
+    for (uint iOmega=0; iOmega<nOmega; iOmega++)
+    {
+      acc += omegaWeights[iOmega] * spectrumDir[iOmega];
+      if (spectrumDir[iOmega] > value)
+      {
+        value = spectrumDir[iOmega];
+        index = iOmega;
+      }
+    }
+    angular[gti] = acc;
+    peakValue[gti] = value;
+    peakIndex[gti] = index;
+  }
+}
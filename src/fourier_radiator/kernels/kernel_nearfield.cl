@@ -103,6 +103,751 @@ __kernel void total(
   }
 }
 
+__kernel void total_coherent(
+  __global ${my_dtype} *spectrum,
+  __global ${my_dtype} *fieldXRe,
+  __global ${my_dtype} *fieldXIm,
+  __global ${my_dtype} *fieldYRe,
+  __global ${my_dtype} *fieldYIm,
+  __global ${my_dtype} *fieldZRe,
+  __global ${my_dtype} *fieldZIm,
+  __global ${my_dtype} *x,
+  __global ${my_dtype} *y,
+  __global ${my_dtype} *z,
+  __global ${my_dtype} *ux,
+  __global ${my_dtype} *uy,
+  __global ${my_dtype} *uz,
+           ${my_dtype} wp,
+                  uint itStart,
+                  uint itEnd,
+                  uint nSteps,
+  __global ${my_dtype} *omega,
+  __global ${my_dtype} *radius,
+  __global ${my_dtype} *sinPhi,
+  __global ${my_dtype} *cosPhi,
+           ${my_dtype} distanceToScreen,
+                  uint nOmega,
+                  uint nRadius,
+                  uint nPhi,
+           ${my_dtype} dt,
+                  uint nSnaps,
+  __global        uint *itSnaps,
+  __global ${my_dtype} *FormFactor)
+{
+  // total plus the complex field vector of the particle, scaled by
+  // sqrt(wp) dt and the form factor of a particle of size sigma_particle
+  // like the *_complex kernels, accumulated for the coherent spectrum
+  uint gti = (uint) get_global_id(0);
+  uint nTotal = nRadius*nPhi*nOmega;
+
+  if (gti < nTotal)
+   {
+    uint iPhi = gti / (nOmega * nRadius);
+    uint iRadius = (gti - iPhi*nOmega*nRadius) / nOmega;
+    uint iOmega = gti - iPhi*nOmega*nRadius - iRadius*nOmega;
+
+    ${my_dtype} omegaLocal = omega[iOmega];
+
+    ${my_dtype}3 coordOnScreen = (${my_dtype}3) { radius[iRadius]*cosPhi[iPhi],
+                                                  radius[iRadius]*sinPhi[iPhi],
+                                                  distanceToScreen };
+
+    ${my_dtype}3 xLocal, uLocal, rVec, nVec, c1, c2;
+    ${my_dtype} time, phase, dPhase, sinPhase, cosPhase, rLocal, rInv, gammaInv;
+
+    ${my_dtype} wpdt2 =  wp * dt * dt;
+    ${my_dtype} wpdtField = ${f_native}sqrt(wp) * dt;
+    ${my_dtype} FormFactorLocal = FormFactor[iOmega];
+    ${my_dtype} fieldFactor;
+    ${my_dtype} phasePrev = (${my_dtype}) 0.;
+    ${my_dtype}3 spectrLocalRe = (${my_dtype}3) {0., 0., 0.};
+    ${my_dtype}3 spectrLocalIm = (${my_dtype}3) {0., 0., 0.};
+
+    uint iSnap, it_glob;
+    for (iSnap=0; iSnap<nSnaps; iSnap++)
+    {
+      if (itStart < itSnaps[iSnap]) break;
+    }
+
+    for (uint it=0; it<itEnd-1; it++)
+    {
+      it_glob = itStart + it;
+
+      if (it<nSteps-1)
+      {
+        time = (${my_dtype})it_glob * dt;
+        xLocal = (${my_dtype}3) {x[it], y[it], z[it]};
+
+        rVec = coordOnScreen - xLocal;
+        rLocal = ${f_native}sqrt( dot(rVec, rVec) );
+
+        phase = omegaLocal * (time + rLocal) ;
+        dPhase = fabs(phase - phasePrev);
+        phasePrev = phase;
+
+        if ( dPhase < (${my_dtype})M_PI )
+        {
+          rInv = (${my_dtype})1. / rLocal;
+          nVec = rInv * rVec;
+
+          uLocal = (${my_dtype}3) {ux[it], uy[it], uz[it]};
+
+          gammaInv = ${f_native}rsqrt( (${my_dtype})1. + dot(uLocal, uLocal) );
+          uLocal *= gammaInv;
+
+          sinPhase = ${f_native}sin(phase);
+          cosPhase = ${f_native}cos(phase);
+
+          c1 = omegaLocal * rInv * (uLocal - nVec);
+          c2 = rInv * rInv * nVec;
+
+          spectrLocalRe += -c1*sinPhase + c2*cosPhase;
+          spectrLocalIm +=  c1*cosPhase + c2*sinPhase;
+        }
+      }
+
+      if (iSnap<nSnaps && it_glob+2 == itSnaps[iSnap])
+      {
+        spectrum[gti + nTotal*iSnap] +=  wpdt2 * (
+          dot(spectrLocalRe, spectrLocalRe) +
+          dot(spectrLocalIm, spectrLocalIm) );
+
+        // fields are linear in the amplitude: they are summed over particles
+        // (and ranks) and squared only at the end
+        fieldFactor = wpdtField * FormFactorLocal;
+        fieldXRe[gti + nTotal*iSnap] += fieldFactor * spectrLocalRe.s0;
+        fieldXIm[gti + nTotal*iSnap] += fieldFactor * spectrLocalIm.s0;
+        fieldYRe[gti + nTotal*iSnap] += fieldFactor * spectrLocalRe.s1;
+        fieldYIm[gti + nTotal*iSnap] += fieldFactor * spectrLocalIm.s1;
+        fieldZRe[gti + nTotal*iSnap] += fieldFactor * spectrLocalRe.s2;
+        fieldZIm[gti + nTotal*iSnap] += fieldFactor * spectrLocalIm.s2;
+        iSnap += 1;
+      }
+    }
+  }
+}
+
+__kernel void total_block(
+  __global ${my_dtype} *spectrum,
+  __global ${my_dtype} *x,
+  __global ${my_dtype} *y,
+  __global ${my_dtype} *z,
+  __global ${my_dtype} *ux,
+  __global ${my_dtype} *uy,
+  __global ${my_dtype} *uz,
+           ${my_dtype} wp,
+                  uint itStart,
+                  uint itEnd,
+                  uint nSteps,
+  __global ${my_dtype} *omega,
+  __global ${my_dtype} *radius,
+  __global ${my_dtype} *sinPhi,
+  __global ${my_dtype} *cosPhi,
+           ${my_dtype} distanceToScreen,
+                  uint nOmega,
+                  uint nRadius,
+                  uint nPhi,
+           ${my_dtype} dt,
+                  uint nSnaps,
+  __global        uint *itSnaps )
+{
+  // same sums as total, but each work-item handles ${nodes_per_item} consecutive
+  // omegas of one screen point: the distance, direction and velocity are
+  // computed once per step for the whole block
+  uint gti = (uint) get_global_id(0);
+  uint nBlocks = (nOmega + ${nodes_per_item} - 1) / ${nodes_per_item};
+  uint nTotal = nRadius*nPhi*nOmega;
+
+  if (gti < nBlocks*nRadius*nPhi)
+  {
+    uint iPhi = gti / (nBlocks * nRadius);
+    uint iRadius = (gti - iPhi*nBlocks*nRadius) / nBlocks;
+    uint iBlock = gti - iPhi*nBlocks*nRadius - iRadius*nBlocks;
+
+    uint iOmega0 = iBlock * ${nodes_per_item};
+    uint nOmegaBlock = min((uint)${nodes_per_item}, nOmega - iOmega0);
+    uint gti0 = iOmega0 + nOmega*(iRadius + nRadius*iPhi);
+
+    ${my_dtype}3 coordOnScreen = (${my_dtype}3) { radius[iRadius]*cosPhi[iPhi],
+                                                  radius[iRadius]*sinPhi[iPhi],
+                                                  distanceToScreen };
+
+    ${my_dtype} omegaLocal[${nodes_per_item}];
+    ${my_dtype} phasePrev[${nodes_per_item}];
+    ${my_dtype}3 spectrLocalRe[${nodes_per_item}];
+    ${my_dtype}3 spectrLocalIm[${nodes_per_item}];
+
+    for (uint j=0; j<${nodes_per_item}; j++)
+    {
+      omegaLocal[j] = (j < nOmegaBlock) ? omega[iOmega0 + j] : omega[iOmega0];
+      phasePrev[j] = (${my_dtype}) 0.;
+      spectrLocalRe[j] = (${my_dtype}3) {0., 0., 0.};
+      spectrLocalIm[j] = (${my_dtype}3) {0., 0., 0.};
+    }
+
+    ${my_dtype}3 xLocal, uLocal, rVec, nVec, uMinusN, c1, c2;
+    ${my_dtype} time, phase, dPhase, sinPhase, cosPhase, rLocal, rInv, gammaInv;
+    int haveAmplitude;
+
+    ${my_dtype} wpdt2 =  wp * dt * dt;
+
+    uint iSnap, it_glob;
+    for (iSnap=0; iSnap<nSnaps; iSnap++)
+    {
+      if (itStart < itSnaps[iSnap]) break;
+    }
+
+    for (uint it=0; it<itEnd-1; it++)
+    {
+      it_glob = itStart + it;
+
+      if (it<nSteps-1)
+      {
+        time = (${my_dtype})it_glob * dt;
+        xLocal = (${my_dtype}3) {x[it], y[it], z[it]};
+
+        rVec = coordOnScreen - xLocal;
+        rLocal = ${f_native}sqrt( dot(rVec, rVec) );
+        haveAmplitude = 0;
+
+        for (uint j=0; j<${nodes_per_item}; j++)
+        {
+          phase = omegaLocal[j] * (time + rLocal) ;
+          dPhase = fabs(phase - phasePrev[j]);
+          phasePrev[j] = phase;
+
+          if (j < nOmegaBlock && dPhase < (${my_dtype})M_PI)
+          {
+            // everything except the omega factor is shared by the block
+            if (!haveAmplitude)
+            {
+              rInv = (${my_dtype})1. / rLocal;
+              nVec = rInv * rVec;
+
+              uLocal = (${my_dtype}3) {ux[it], uy[it], uz[it]};
+
+              gammaInv = ${f_native}rsqrt( (${my_dtype})1. + dot(uLocal, uLocal) );
+              uLocal *= gammaInv;
+
+              uMinusN = uLocal - nVec;
+              c2 = rInv * rInv * nVec;
+              haveAmplitude = 1;
+            }
+
+            sinPhase = ${f_native}sin(phase);
+            cosPhase = ${f_native}cos(phase);
+
+            c1 = omegaLocal[j] * rInv * uMinusN;
+
+            spectrLocalRe[j] += -c1*sinPhase + c2*cosPhase;
+            spectrLocalIm[j] +=  c1*cosPhase + c2*sinPhase;
+          }
+        }
+      }
+
+      if (iSnap<nSnaps && it_glob+2 == itSnaps[iSnap])
+      {
+        for (uint j=0; j<nOmegaBlock; j++)
+        {
+          spectrum[gti0 + j + nTotal*iSnap] +=  wpdt2 * (
+            dot(spectrLocalRe[j], spectrLocalRe[j]) +
+            dot(spectrLocalIm[j], spectrLocalIm[j]) );
+        }
+        iSnap += 1;
+      }
+    }
+  }
+}
+
+__kernel void total_recurrence(
+  __global ${my_dtype} *spectrum,
+  __global ${my_dtype} *x,
+  __global ${my_dtype} *y,
+  __global ${my_dtype} *z,
+  __global ${my_dtype} *ux,
+  __global ${my_dtype} *uy,
+  __global ${my_dtype} *uz,
+           ${my_dtype} wp,
+                  uint itStart,
+                  uint itEnd,
+                  uint nSteps,
+  __global ${my_dtype} *omega,
+  __global ${my_dtype} *radius,
+  __global ${my_dtype} *sinPhi,
+  __global ${my_dtype} *cosPhi,
+           ${my_dtype} distanceToScreen,
+                  uint nOmega,
+                  uint nRadius,
+                  uint nPhi,
+           ${my_dtype} dt,
+                  uint nSnaps,
+  __global        uint *itSnaps,
+           ${my_dtype} dOmega)
+{
+  // each work-item handles a run of ${omega_block} consecutive omegas of one
+  // screen point; on a linear grid exp(i*omega_j*phi) is obtained from
+  // exp(i*omega_0*phi) by repeated rotation with exp(i*dOmega*phi)
+  uint gti = (uint) get_global_id(0);
+  uint nBlocks = (nOmega + ${omega_block} - 1) / ${omega_block};
+  uint nTotal = nRadius*nPhi*nOmega;
+
+  if (gti < nBlocks*nRadius*nPhi)
+  {
+    uint iPhi = gti / (nBlocks * nRadius);
+    uint iRadius = (gti - iPhi*nBlocks*nRadius) / nBlocks;
+    uint iBlock = gti - iPhi*nBlocks*nRadius - iRadius*nBlocks;
+
+    uint iOmega0 = iBlock * ${omega_block};
+    uint nOmegaBlock = min((uint)${omega_block}, nOmega - iOmega0);
+    uint gti0 = iOmega0 + nOmega*(iRadius + nRadius*iPhi);
+
+    ${my_dtype}3 coordOnScreen = (${my_dtype}3) { radius[iRadius]*cosPhi[iPhi],
+                                                  radius[iRadius]*sinPhi[iPhi],
+                                                  distanceToScreen };
+
+    ${my_dtype} omegaLocal[${omega_block}];
+    ${my_dtype}3 spectrLocalRe[${omega_block}];
+    ${my_dtype}3 spectrLocalIm[${omega_block}];
+
+    for (uint j=0; j<${omega_block}; j++)
+    {
+      omegaLocal[j] = (j < nOmegaBlock) ? omega[iOmega0 + j] : omega[iOmega0];
+      spectrLocalRe[j] = (${my_dtype}3) {0., 0., 0.};
+      spectrLocalIm[j] = (${my_dtype}3) {0., 0., 0.};
+    }
+
+    ${my_dtype}3 xLocal, uLocal, rVec, nVec, c1, c2;
+    ${my_dtype} time, phi, dPhi, rLocal, rInv, gammaInv;
+    ${my_dtype} cosPhase, sinPhase, cosStep, sinStep, cosTmp, norm;
+
+    ${my_dtype} wpdt2 =  wp * dt * dt;
+    ${my_dtype} phiPrev = (${my_dtype}) 0.;
+
+    uint iSnap, it_glob;
+    for (iSnap=0; iSnap<nSnaps; iSnap++)
+    {
+      if (itStart < itSnaps[iSnap]) break;
+    }
+
+    for (uint it=0; it<itEnd-1; it++)
+    {
+      it_glob = itStart + it;
+
+      if (it<nSteps-1)
+      {
+        time = (${my_dtype})it_glob * dt;
+        xLocal = (${my_dtype}3) {x[it], y[it], z[it]};
+
+        rVec = coordOnScreen - xLocal;
+        rLocal = ${f_native}sqrt( dot(rVec, rVec) );
+
+        // retarded time; the phase of omega_j is omega_j * phi
+        phi = time + rLocal;
+        dPhi = fabs(phi - phiPrev);
+        phiPrev = phi;
+
+        if (fmin(omegaLocal[0], omegaLocal[nOmegaBlock-1]) * dPhi < (${my_dtype})M_PI)
+        {
+          rInv = (${my_dtype})1. / rLocal;
+          nVec = rInv * rVec;
+
+          uLocal = (${my_dtype}3) {ux[it], uy[it], uz[it]};
+
+          gammaInv = ${f_native}rsqrt( (${my_dtype})1. + dot(uLocal, uLocal) );
+          uLocal *= gammaInv;
+
+          // the omega factor of c1 is applied per omega below
+          c1 = rInv * (uLocal - nVec);
+          c2 = rInv * rInv * nVec;
+
+          sinPhase = ${f_native}sin(omegaLocal[0] * phi);
+          cosPhase = ${f_native}cos(omegaLocal[0] * phi);
+          sinStep = ${f_native}sin(dOmega * phi);
+          cosStep = ${f_native}cos(dOmega * phi);
+
+          for (uint j=0; j<${omega_block}; j++)
+          {
+            if (j < nOmegaBlock && omegaLocal[j] * dPhi < (${my_dtype})M_PI)
+            {
+              spectrLocalRe[j] += -omegaLocal[j]*c1*sinPhase + c2*cosPhase;
+              spectrLocalIm[j] +=  omegaLocal[j]*c1*cosPhase + c2*sinPhase;
+            }
+
+            cosTmp = cosPhase*cosStep - sinPhase*sinStep;
+            sinPhase = sinPhase*cosStep + cosPhase*sinStep;
+            cosPhase = cosTmp;
+
+            // pull the rotated factor back to the unit circle
+            if ((j+1) % ${renorm_interval} == 0)
+            {
+              norm = (${my_dtype})1.5 - (${my_dtype})0.5 * (cosPhase*cosPhase + sinPhase*sinPhase);
+              cosPhase *= norm;
+              sinPhase *= norm;
+            }
+          }
+        }
+      }
+
+      if (iSnap<nSnaps && it_glob+2 == itSnaps[iSnap])
+      {
+        for (uint j=0; j<nOmegaBlock; j++)
+        {
+          spectrum[gti0 + j + nTotal*iSnap] +=  wpdt2 * (
+            dot(spectrLocalRe[j], spectrLocalRe[j]) +
+            dot(spectrLocalIm[j], spectrLocalIm[j]) );
+        }
+        iSnap += 1;
+      }
+    }
+  }
+}
+
+__kernel void total_batch(
+  __global ${my_dtype} *spectrum,
+  __global ${my_dtype} *x,
+  __global ${my_dtype} *y,
+  __global ${my_dtype} *z,
+  __global ${my_dtype} *ux,
+  __global ${my_dtype} *uy,
+  __global ${my_dtype} *uz,
+  __global        uint *trackOffset,
+  __global        uint *trackSteps,
+  __global        uint *trackItStart,
+  __global        uint *trackItEnd,
+  __global ${my_dtype} *trackWeight,
+                  uint nTracks,
+  __global ${my_dtype} *omega,
+  __global ${my_dtype} *radius,
+  __global ${my_dtype} *sinPhi,
+  __global ${my_dtype} *cosPhi,
+           ${my_dtype} distanceToScreen,
+                  uint nOmega,
+                  uint nRadius,
+                  uint nPhi,
+           ${my_dtype} dt,
+                  uint nSnaps,
+  __global        uint *itSnaps,
+                  uint snapStride)
+{
+  uint gti = (uint) get_global_id(0);
+  uint nTotal = nRadius*nPhi*nOmega;
+
+  if (gti < nTotal)
+  {
+    uint iPhi = gti / (nOmega * nRadius);
+    uint iRadius = (gti - iPhi*nOmega*nRadius) / nOmega;
+    uint iOmega = gti - iPhi*nOmega*nRadius - iRadius*nOmega;
+
+    ${my_dtype} omegaLocal = omega[iOmega];
+
+    ${my_dtype}3 coordOnScreen = (${my_dtype}3) { radius[iRadius]*cosPhi[iPhi],
+                                                  radius[iRadius]*sinPhi[iPhi],
+                                                  distanceToScreen };
+
+    ${my_dtype}3 xLocal, uLocal, rVec, nVec, c1, c2;
+    ${my_dtype} time, phase, dPhase, sinPhase, cosPhase, rLocal, rInv, gammaInv;
+
+    for (uint iTrack=0; iTrack<nTracks; iTrack++)
+    {
+      uint offset = trackOffset[iTrack];
+      uint nSteps = trackSteps[iTrack];
+      uint itStart = trackItStart[iTrack];
+      uint itEnd = trackItEnd[iTrack];
+      __global uint *itSnapsTrack = itSnaps + iTrack*snapStride;
+
+      ${my_dtype} wpdt2 =  trackWeight[iTrack] * dt * dt;
+      ${my_dtype} phasePrev = (${my_dtype}) 0.;
+      ${my_dtype}3 spectrLocalRe = (${my_dtype}3) {0., 0., 0.};
+      ${my_dtype}3 spectrLocalIm = (${my_dtype}3) {0., 0., 0.};
+
+      uint iSnap, it_glob, itTr;
+      for (iSnap=0; iSnap<nSnaps; iSnap++)
+      {
+        if (itStart < itSnapsTrack[iSnap]) break;
+      }
+
+      for (uint it=0; it<itEnd-1; it++)
+      {
+        it_glob = itStart + it;
+
+        if (it<nSteps-1)
+        {
+          itTr = offset + it;
+          time = (${my_dtype})it_glob * dt;
+          xLocal = (${my_dtype}3) {x[itTr], y[itTr], z[itTr]};
+
+          rVec = coordOnScreen - xLocal;
+          rLocal = ${f_native}sqrt( dot(rVec, rVec) );
+
+          phase = omegaLocal * (time + rLocal) ;
+          dPhase = fabs(phase - phasePrev);
+          phasePrev = phase;
+
+          if ( dPhase < (${my_dtype})M_PI )
+          {
+            rInv = (${my_dtype})1. / rLocal;
+            nVec = rInv * rVec;
+
+            uLocal = (${my_dtype}3) {ux[itTr], uy[itTr], uz[itTr]};
+
+            gammaInv = ${f_native}rsqrt( (${my_dtype})1. + dot(uLocal, uLocal) );
+            uLocal *= gammaInv;
+
+            sinPhase = ${f_native}sin(phase);
+            cosPhase = ${f_native}cos(phase);
+
+            c1 = omegaLocal * rInv * (uLocal - nVec);
+            c2 = rInv * rInv * nVec;
+
+            spectrLocalRe += -c1*sinPhase + c2*cosPhase;
+            spectrLocalIm +=  c1*cosPhase + c2*sinPhase;
+          }
+        }
+
+        if (iSnap<nSnaps && it_glob+2 == itSnapsTrack[iSnap])
+        {
+          spectrum[gti + nTotal*iSnap] +=  wpdt2 * (
+            dot(spectrLocalRe, spectrLocalRe) +
+            dot(spectrLocalIm, spectrLocalIm) );
+          iSnap += 1;
+        }
+      }
+    }
+  }
+}
+
+__kernel void total_comps(
+  __global ${my_dtype} *spectrum,
+  __global ${my_dtype} *spectrum1,
+  __global ${my_dtype} *spectrum2,
+  __global ${my_dtype} *spectrum3,
+  __global ${my_dtype} *x,
+  __global ${my_dtype} *y,
+  __global ${my_dtype} *z,
+  __global ${my_dtype} *ux,
+  __global ${my_dtype} *uy,
+  __global ${my_dtype} *uz,
+           ${my_dtype} wp,
+                  uint itStart,
+                  uint itEnd,
+                  uint nSteps,
+  __global ${my_dtype} *omega,
+  __global ${my_dtype} *radius,
+  __global ${my_dtype} *sinPhi,
+  __global ${my_dtype} *cosPhi,
+           ${my_dtype} distanceToScreen,
+                  uint nOmega,
+                  uint nRadius,
+                  uint nPhi,
+           ${my_dtype} dt,
+                  uint nSnaps,
+  __global        uint *itSnaps )
+{
+  // total 与笛卡尔分量在同一个时间循环里累加
+  uint gti = (uint) get_global_id(0);
+  uint nTotal = nRadius*nPhi*nOmega;
+
+  if (gti < nTotal)
+   {
+    uint iPhi = gti / (nOmega * nRadius);
+    uint iRadius = (gti - iPhi*nOmega*nRadius) / nOmega;
+    uint iOmega = gti - iPhi*nOmega*nRadius - iRadius*nOmega;
+
+    ${my_dtype} omegaLocal = omega[iOmega];
+
+    ${my_dtype}3 coordOnScreen = (${my_dtype}3) { radius[iRadius]*cosPhi[iPhi],
+                                                  radius[iRadius]*sinPhi[iPhi],
+                                                  distanceToScreen };
+
+    ${my_dtype}3 xLocal, uLocal, rVec, nVec, c1, c2;
+    ${my_dtype} time, phase, dPhase, sinPhase, cosPhase, rLocal, rInv, gammaInv;
+
+    ${my_dtype} wpdt2 =  wp * dt * dt;
+    ${my_dtype} phasePrev = (${my_dtype}) 0.;
+    ${my_dtype}3 spectrLocalRe = (${my_dtype}3) {0., 0., 0.};
+    ${my_dtype}3 spectrLocalIm = (${my_dtype}3) {0., 0., 0.};
+
+    uint iSnap, it_glob;
+    for (iSnap=0; iSnap<nSnaps; iSnap++)
+    {
+      if (itStart < itSnaps[iSnap]) break;
+    }
+
+    for (uint it=0; it<itEnd-1; it++)
+    {
+      it_glob = itStart + it;
+
+      if (it<nSteps-1)
+      {
+        time = (${my_dtype})it_glob * dt;
+        xLocal = (${my_dtype}3) {x[it], y[it], z[it]};
+
+        rVec = coordOnScreen - xLocal;
+        rLocal = ${f_native}sqrt( dot(rVec, rVec) );
+
+        phase = omegaLocal * (time + rLocal) ;
+        dPhase = fabs(phase - phasePrev);
+        phasePrev = phase;
+
+        if ( dPhase < (${my_dtype})M_PI )
+        {
+          rInv = (${my_dtype})1. / rLocal;
+          nVec = rInv * rVec;
+
+          uLocal = (${my_dtype}3) {ux[it], uy[it], uz[it]};
+
+          gammaInv = ${f_native}rsqrt( (${my_dtype})1. + dot(uLocal, uLocal) );
+          uLocal *= gammaInv;
+
+          sinPhase = ${f_native}sin(phase);
+          cosPhase = ${f_native}cos(phase);
+
+          c1 = omegaLocal * rInv * (uLocal - nVec);
+          c2 = rInv * rInv * nVec;
+
+          spectrLocalRe += -c1*sinPhase + c2*cosPhase;
+          spectrLocalIm +=  c1*cosPhase + c2*sinPhase;
+        }
+      }
+
+      if (iSnap < nSnaps && it_glob+2 == itSnaps[iSnap])
+      {
+        spectrum[gti + nTotal*iSnap] +=  wpdt2 * (
+          dot(spectrLocalRe, spectrLocalRe) +
+          dot(spectrLocalIm, spectrLocalIm) );
+
+        spectrum1[gti + nTotal*iSnap] +=  wpdt2 *
+          (spectrLocalRe.s0*spectrLocalRe.s0 +
+           spectrLocalIm.s0*spectrLocalIm.s0);
+
+        spectrum2[gti + nTotal*iSnap] +=  wpdt2 *
+          (spectrLocalRe.s1*spectrLocalRe.s1 +
+           spectrLocalIm.s1*spectrLocalIm.s1);
+
+        spectrum3[gti + nTotal*iSnap] +=  wpdt2 *
+          (spectrLocalRe.s2*spectrLocalRe.s2 +
+           spectrLocalIm.s2*spectrLocalIm.s2);
+        iSnap += 1;
+      }
+    }
+  }
+}
+
+__kernel void total_mixed(
+  __global ${my_dtype} *spectrum,
+  __global ${phase_dtype} *x,
+  __global ${phase_dtype} *y,
+  __global ${phase_dtype} *z,
+  __global ${my_dtype} *ux,
+  __global ${my_dtype} *uy,
+  __global ${my_dtype} *uz,
+           ${my_dtype} wp,
+                  uint itStart,
+                  uint itEnd,
+                  uint nSteps,
+  __global ${phase_dtype} *omega,
+  __global ${phase_dtype} *radius,
+  __global ${phase_dtype} *sinPhi,
+  __global ${phase_dtype} *cosPhi,
+           ${phase_dtype} distanceToScreen,
+                  uint nOmega,
+                  uint nRadius,
+                  uint nPhi,
+           ${phase_dtype} dt,
+                  uint nSnaps,
+  __global        uint *itSnaps )
+{
+  // 混合精度：推迟时间与相位用 ${phase_dtype}，并在转换前约化到 [-pi, pi]；
+  // 振幅与累加用 ${my_dtype}，累加采用 Kahan 补偿求和
+  uint gti = (uint) get_global_id(0);
+  uint nTotal = nRadius*nPhi*nOmega;
+
+  if (gti < nTotal)
+   {
+    uint iPhi = gti / (nOmega * nRadius);
+    uint iRadius = (gti - iPhi*nOmega*nRadius) / nOmega;
+    uint iOmega = gti - iPhi*nOmega*nRadius - iRadius*nOmega;
+
+    ${phase_dtype} omegaLocal = omega[iOmega];
+
+    ${phase_dtype}3 coordOnScreen = (${phase_dtype}3) { radius[iRadius]*cosPhi[iPhi],
+                                                        radius[iRadius]*sinPhi[iPhi],
+                                                        distanceToScreen };
+
+    ${phase_dtype}3 xLocal, rVec;
+    ${phase_dtype} time, phase, dPhase, rLocal;
+    ${my_dtype}3 uLocal, nVec, c1, c2, yRe, yIm, tRe, tIm;
+    ${my_dtype} phaseReduced, sinPhase, cosPhase, rInv, gammaInv;
+
+    ${my_dtype} wpdt2 =  wp * (${my_dtype})(dt * dt);
+    ${phase_dtype} phasePrev = (${phase_dtype}) 0.;
+    ${my_dtype}3 spectrLocalRe = (${my_dtype}3) {0., 0., 0.};
+    ${my_dtype}3 spectrLocalIm = (${my_dtype}3) {0., 0., 0.};
+    ${my_dtype}3 compRe = (${my_dtype}3) {0., 0., 0.};
+    ${my_dtype}3 compIm = (${my_dtype}3) {0., 0., 0.};
+
+    uint iSnap, it_glob;
+    for (iSnap=0; iSnap<nSnaps; iSnap++)
+    {
+      if (itStart < itSnaps[iSnap]) break;
+    }
+
+    for (uint it=0; it<itEnd-1; it++)
+    {
+      it_glob = itStart + it;
+
+      if (it<nSteps-1)
+      {
+        time = (${phase_dtype})it_glob * dt;
+        xLocal = (${phase_dtype}3) {x[it], y[it], z[it]};
+
+        rVec = coordOnScreen - xLocal;
+        rLocal = sqrt( dot(rVec, rVec) );
+
+        phase = omegaLocal * (time + rLocal) ;
+        dPhase = fabs(phase - phasePrev);
+        phasePrev = phase;
+
+        if ( dPhase < (${phase_dtype})M_PI )
+        {
+          rInv = (${my_dtype})(1. / rLocal);
+          nVec = convert_${my_dtype}3(rVec) * rInv;
+
+          uLocal = (${my_dtype}3) {ux[it], uy[it], uz[it]};
+
+          gammaInv = ${f_native}rsqrt( (${my_dtype})1. + dot(uLocal, uLocal) );
+          uLocal *= gammaInv;
+
+          phaseReduced = (${my_dtype})(phase - (${phase_dtype})(2*M_PI) * rint(phase * (${phase_dtype})(0.5*M_1_PI)));
+          sinPhase = ${f_native}sin(phaseReduced);
+          cosPhase = ${f_native}cos(phaseReduced);
+
+          c1 = (${my_dtype})omegaLocal * rInv * (uLocal - nVec);
+          c2 = rInv * rInv * nVec;
+
+          yRe = -c1*sinPhase + c2*cosPhase - compRe;
+          tRe = spectrLocalRe + yRe;
+          compRe = (tRe - spectrLocalRe) - yRe;
+          spectrLocalRe = tRe;
+
+          yIm = c1*cosPhase + c2*sinPhase - compIm;
+          tIm = spectrLocalIm + yIm;
+          compIm = (tIm - spectrLocalIm) - yIm;
+          spectrLocalIm = tIm;
+        }
+      }
+
+      if (iSnap < nSnaps && it_glob+2 == itSnaps[iSnap])
+      {
+        spectrum[gti + nTotal*iSnap] +=  wpdt2 * (
+          dot(spectrLocalRe, spectrLocalRe) +
+          dot(spectrLocalIm, spectrLocalIm) );
+        iSnap += 1;
+      }
+    }
+  }
+}
+
 __kernel void cartesian_comps(
   __global ${my_dtype} *spectrum1,
   __global ${my_dtype} *spectrum2,
@@ -324,3 +1069,72 @@ __kernel void cartesian_comps_complex(
     }
   }
 }
+
+// Reductions of a spectrum (nSnaps, nDirs, nOmega) before it is fetched.
+// reduce_directions: partial sums over chunks of dirChunk directions,
+//   result (nSnaps, nChunks, nOmega); the host adds the chunks
+__kernel void reduce_directions(
+  __global ${my_dtype} *spectrum,
+  __global ${my_dtype} *dirWeights,
+  __global ${my_dtype} *result,
+                  uint nOmega,
+                  uint nDirs,
+                  uint dirChunk,
+                  uint nChunks,
+                  uint nSnaps)
+{
+  uint gti = (uint) get_global_id(0);
+
+  if (gti < nOmega*nChunks*nSnaps)
+  {
+    uint iSnap = gti / (nOmega*nChunks);
+    uint iChunk = (gti - iSnap*nOmega*nChunks) / nOmega;
+    uint iOmega = gti - iSnap*nOmega*nChunks - iChunk*nOmega;
+
+    uint iDirStart = iChunk * dirChunk;
+    uint iDirEnd = min(iDirStart + dirChunk, nDirs);
+    ${my_dtype} acc = (${my_dtype}) 0.;
+
+    for (uint iDir=iDirStart; iDir<iDirEnd; iDir++)
+    {
+      acc += dirWeights[iDir] * spectrum[(iSnap*nDirs + iDir)*nOmega + iOmega];
+    }
+    result[gti] = acc;
+  }
+}
+
+// reduce_omega: integral over omega and the maximum over omega (first one
+//   on ties) with its index, per snapshot and direction, result (nSnaps, nDirs)
+__kernel void reduce_omega(
+  __global ${my_dtype} *spectrum,
+  __global ${my_dtype} *omegaWeights,
+  __global ${my_dtype} *angular,
+  __global ${my_dtype} *peakValue,
+  __global        uint *peakIndex,
+                  uint nOmega,
+                  uint nDirs,
+                  uint nSnaps)
+{
+  uint gti = (uint) get_global_id(0);
+
+  if (gti < nDirs*nSnaps)
+  {
+    __global ${my_dtype} *spectrumDir = spectrum + gti*nOmega;
+    ${my_dtype} acc = (${my_dtype}) 0.;
+    ${my_dtype} value = spectrumDir[0];
+    uint index = 0;
+
+    for (uint iOmega=0; iOmega<nOmega; iOmega++)
+    {
+      acc += omegaWeights[iOmega] * spectrumDir[iOmega];
+      if (spectrumDir[iOmega] > value)
+      {
+        value = spectrumDir[iOmega];
+        index = iOmega;
+      }
+    }
+    angular[gti] = acc;
+    peakValue[gti] = value;
+    peakIndex[gti] = index;
+  }
+}
@@ -0,0 +1,94 @@
+"""Cost model and track partitioning between MPI ranks."""
+
+import heapq
+
+import numpy as np
+
+from .track_store import TrackStore
+
+LOAD_BALANCE_MODES = ('cost', 'dynamic', 'round_robin')
+
+
+def track_lengths(particleTracks):
+    """每条轨迹的步数（TrackStore 不读入数据）"""
+    if isinstance(particleTracks, TrackStore):
+        return particleTracks.lengths.astype(np.int64)
+    return np.array([len(track[0]) for track in particleTracks], dtype=np.int64)
+
+
+def track_costs(particleTracks, it_range=None, n_nodes=1):
+    """
+    每条轨迹的计算量估计：累加的步数 × 网格节点数。
+    给定 it_range 时 kernel 只累加 it_start 之后、it_range[-1] 之前的步
+    """
+    lengths = track_lengths(particleTracks).astype(np.double)
+    if isinstance(particleTracks, TrackStore):
+        it_start = particleTracks.it_start.astype(np.double)
+    else:
+        it_start = np.array([track[7] for track in particleTracks], dtype=np.double)
+
+    if it_range is not None:
+        lengths = np.clip(np.minimum(lengths, it_range[-1] - it_start), 0, None)
+    # 每条轨迹至少按一步计（kernel 启动与上传的开销）
+    return (lengths + 1) * n_nodes
+
+
+def partition_lpt(costs, n_parts):
+    """
+    LPT（longest processing time first）：按计算量从大到小依次分给当前负载最小的部分。
+    返回 n_parts 个升序的下标数组；所有 rank 用相同的 costs 得到相同的划分
+    """
+    costs = np.asarray(costs, dtype=np.double)
+    heap = [(0., part) for part in range(n_parts)]
+    parts = [[] for _ in range(n_parts)]
+    for i in np.argsort(-costs, kind='stable'):
+        load, part = heapq.heappop(heap)
+        parts[part].append(i)
+        heapq.heappush(heap, (load + costs[i], part))
+    return [np.sort(np.array(part, dtype=np.int64)) for part in parts]
+
+
+def select_tracks(particleTracks, idx):
+    """按下标取出轨迹子集（TrackStore 返回视图，不读入数据）"""
+    if isinstance(particleTracks, TrackStore):
+        return particleTracks[idx]
+    return [particleTracks[i] for i in idx]
+
+
+class WorkQueue:
+    """
+    动态任务队列：rank 0 的 RMA 窗口中保存一个共享计数器，
+    各 rank 用 Fetch_and_op 原子地领取下一段 [start, stop)，rank 0 同时也参与计算，
+    不需要专门的 master 进程
+    """
+
+    def __init__(self, comm, n_items, chunk=1):
+        from mpi4py import MPI
+
+        self._MPI = MPI
+        self.comm = comm
+        self.n_items = n_items
+        self.chunk = max(int(chunk), 1)
+
+        counter = np.zeros(1 if comm.Get_rank() == 0 else 0, dtype=np.int64)
+        self.win = MPI.Win.Create(counter, disp_unit=counter.itemsize, comm=comm)
+        self._counter = counter  # 窗口存在期间保持引用
+        comm.Barrier()
+
+    def next(self):
+        MPI = self._MPI
+        step = np.array([self.chunk], dtype=np.int64)
+        start = np.zeros(1, dtype=np.int64)
+
+        self.win.Lock(0, MPI.LOCK_SHARED)
+        self.win.Fetch_and_op(step, start, 0, 0, MPI.SUM)
+        self.win.Unlock(0)
+
+        start = int(start[0])
+        if start >= self.n_items:
+            return None
+        return start, min(start + self.chunk, self.n_items)
+
+    def free(self):
+        self.comm.Barrier()
+        self.win.Free()
@@ -1,5 +1,8 @@
 """Main module."""
 
+import time
+from pathlib import Path
+
 import numpy as np
 from tqdm import tqdm
 
@@ -9,16 +12,31 @@ try:
 except ImportError:
     mpi_installed = False
 
-from .config import RadiationConfig
-from .opencl_env import OpenCLEnvironment
+from .autotune import AutoTuner, TuningCache, autotune_cache_file, device_key, tuning_key
+from .checkpoint import Checkpoint
+from .config import TUNABLE, RadiationConfig
+from .opencl_env import OpenCLEnvironment, list_devices
 from .compiler import KernelCompiler
 from .particle import ParticleProcessor
 from .data_manager import RadiationDataManager
+from .nufft import NufftParticleProcessor
+from .numpy_backend import NumpyParticleProcessor
+from .device_pool import DevicePool, DeviceWorker
+from .profiling import Profiler
+from . import reductions
+from .load_balance import (LOAD_BALANCE_MODES, WorkQueue, partition_lpt, select_tracks,
+                           track_costs, track_lengths)
+from .tiling import TiledSpectrum, plan_tiles
+from .track_store import TrackStore
 
 # src_path = "./kernels/"
 from fourier_radiator import __path__ as src_path
 src_path = src_path[0] + '/kernels/'
 
+# _broadcast_tracks 每次 Bcast 的字节数上限（远小于 MPI 计数的 2**31 限制）
+BCAST_CHUNK_BYTES = 1 << 28
+
+
 class FourierRadiator:
     def __init__(self, Args):
         self.rank, self.size = self._get_mpi_info()
@@ -27,17 +45,196 @@ class FourierRadiator:
         self.Args = self.config.get_args()
         self.dtype = self.config.get_dtype()
 
-        self.env = OpenCLEnvironment(self.rank, self.Args.get("ctx"))
-        self.compiler = KernelCompiler(self.Args['mode'], self.Args['dtype'], self.env.get_context(), src_path)
-        self.processor = ParticleProcessor(self.config, self.env, self.compiler.program)
-        self.data_mgr = RadiationDataManager(self.config, self.env)
+        # 网格分解：每个 rank 只计算 gridDecomposition 轴上的一段网格，设备上也只分配这一段
+        self.local_config = self.config
+        axis = self.Args['gridDecomposition']
+        if axis is not None and self.size > 1:
+            bounds = self.config.split_grid(axis, self.size)
+            if any(start == stop for start, stop in bounds):
+                raise ValueError(f"gridDecomposition='{axis}' needs at least {self.size} grid nodes "
+                                 "along that axis")
+            self.local_config = self.config.restrict_grid(axis, *bounds[self.rank])
+
+        ctx = self.Args.get("ctx")
+        if self._is_pool(ctx):
+            self.workers = self._build_pool(ctx)
+        else:
+            self.workers = []
+        if not self.workers:
+            env = OpenCLEnvironment(self.rank, None if self._is_pool(ctx) else ctx,
+                                    profiling=self.Args['profiling'])
+            self.workers = [self._build_worker(env)]
+
+        # 第一个设备的对象保留为属性，单设备时与原来相同
+        self.env = self.workers[0].env
+        self.compiler = self.workers[0].compiler
+        self.processor = self.workers[0].processor
+        self.data_mgr = self.workers[0].data_mgr
+        self.profile = None  # Args['profiling'] 时为上一次计算的 profiling.ProfileReport
+
+    @staticmethod
+    def _is_pool(ctx):
+        return (isinstance(ctx, str) and ctx.lower() == 'all') or isinstance(ctx, (list, tuple))
+
+    def _build_worker(self, env, compiler=None):
+        if 'nufft' in self.Args['Features']:
+            # NUFFT 引擎在 CPU 上计算，不需要编译 kernel
+            processor = NufftParticleProcessor(self.local_config)
+        elif env.get_context() is None:
+            if self.Args['coherent']:
+                raise ValueError("'coherent' requires an OpenCL device")
+            # 没有可用的 OpenCL 设备时退回 NumPy 后端
+            if self.rank == 0:
+                print("[FourierRadiator] No OpenCL device, using the NumPy CPU backend")
+            processor = NumpyParticleProcessor(self.local_config)
+        else:
+            compiler = compiler or self._build_compiler([env])[0]
+            processor = ParticleProcessor(self.local_config, env, compiler.program,
+                                          compiler.omega_block, compiler.nodes_per_item)
+        return DeviceWorker(self.local_config, env, compiler, processor,
+                            RadiationDataManager(self.local_config, env))
+
+    def _build_pool(self, ctx):
+        """
+        ctx='all'：本节点的全部 OpenCL 设备（同一节点上有多个 rank 时按节点内 rank 分配）；
+        ctx 为 cl.Device / cl.Context 的列表：使用这些设备
+        """
+        if isinstance(ctx, str):
+            devices = list_devices()
+            if mpi_installed and self.size > 1 and devices:
+                node = MPI.COMM_WORLD.Split_type(MPI.COMM_TYPE_SHARED)
+                local_rank, local_size = node.Get_rank(), node.Get_size()
+                node.Free()
+                devices = devices[local_rank::local_size] or [devices[local_rank % len(devices)]]
+        else:
+            devices = list(ctx)
+
+        envs = [OpenCLEnvironment(self.rank, device, profiling=self.Args['profiling']) for device in devices]
+        envs = [env for env in envs if env.get_context() is not None]
+        if not envs:
+            return []
+        compilers = self._build_compiler(envs)
+        return [self._build_worker(env, compiler) for env, compiler in zip(envs, compilers)]
+
+    def _build_compiler(self, envs):
+        tunings = self._tune(envs)
+
+        def build():
+            return [KernelCompiler(self.Args['mode'], self.Args['dtype'], env.get_context(), src_path,
+                                   omega_block=tuning.get('omegaBlock', self.Args['omegaBlock']),
+                                   nodes_per_item=tuning.get('nodesPerItem', 1),
+                                   cache_dir=self.Args['kernelCacheDir'],
+                                   use_cache=self.Args['kernelCache'],
+                                   cache_size=self.Args['kernelCacheSize'])
+                    for env, tuning in zip(envs, tunings)]
+
+        # rank 0 先编译并写入磁盘缓存，其余 rank 之后直接读取二进制
+        if mpi_installed and self.size > 1 and self.Args['kernelCache']:
+            comm = MPI.COMM_WORLD
+            compilers = build() if self.rank == 0 else None
+            comm.Barrier()
+            if self.rank != 0:
+                compilers = build()
+        else:
+            compilers = build()
+
+        if self.rank == 0:
+            for env, compiler in zip(envs, compilers):
+                device = f" ({env.get_device_name()})" if len(envs) > 1 else ""
+                print(f"[KernelCompiler] kernel cache{device}: {compiler.cache_status}")
+        return compilers
+
+    def _tune(self, envs):
+        """
+        每个设备的 WGS / nodesPerItem / omegaBlock：调用方给定的值优先，其次是调优缓存中
+        （按设备与 kernel 保存）的结果；autotune=True 且缓存中没有时先在设备上调优并写入缓存。
+        WGS 直接设置到 env 上，返回编译参数的列表
+        """
+        mode = self.Args['autotune']
+        cache = TuningCache(autotune_cache_file(self.Args))
+        key = tuning_key(self.local_config)
+        fixed = {k: self.Args[k] for k in self.config.fixed}
+
+        def lookup():
+            tunings = []
+            for env in envs:
+                tuning = None
+                if mode is not False:
+                    tuning = cache.get(device_key(env), key)
+                    if tuning is None and mode is True:
+                        tuning = AutoTuner(self.local_config, env, src_path, fixed).run()
+                        cache.put(device_key(env), key, tuning)
+                        print(f"[AutoTuner] {env.get_device_name()} ({key}): "
+                              + ', '.join(f"{k}={tuning[k]}" for k in TUNABLE if k in tuning))
+                tunings.append({k: v for k, v in (tuning or {}).items() if k in TUNABLE})
+            return tunings
+
+        # 与编译相同：rank 0 先调优并写缓存，其余 rank 之后读取（同一节点上不会同时测速）
+        if mode is True and mpi_installed and self.size > 1:
+            tunings = lookup() if self.rank == 0 else None
+            MPI.COMM_WORLD.Barrier()
+            if self.rank != 0:
+                tunings = lookup()
+        else:
+            tunings = lookup()
+
+        for env, tuning in zip(envs, tunings):
+            tuning.update(fixed)
+            if tuning.get('WGS') is not None:
+                env.WGS = int(tuning['WGS'])
+        return tunings
 
     def calculate_spectrum(self, particleTracks, timeStep=None,
                            L_screen=None, Np_max=None, it_range=None,
                            nSnaps=1, sigma_particle=0,
                            weights_normalize=None,
-                           verbose=True):
+                           verbose=True, load_balance='cost', allreduce=False,
+                           checkpoint=None, checkpoint_interval=600., resume=None, accumulate=False,
+                           out=None):
+        """
+        load_balance: MPI rank 之间的轨迹分配
+            'cost'        按计算量（步数 × 网格节点数）做 LPT 划分（默认）
+            'dynamic'     各 rank 从共享计数器动态领取轨迹（按计算量从大到小）
+            'round_robin' 原来的 particleTracks[rank::size]
+        allreduce: True 时每个 rank 都得到归约（网格分解时为拼接）后的谱，否则只有 rank 0
+        网格分解（Args['gridDecomposition']）时每个 rank 处理全部轨迹，load_balance 不起作用；
+        非 0 的 rank 可以传入 particleTracks=None，轨迹从 rank 0 广播
+        checkpoint: 检查点目录，每隔 checkpoint_interval 秒（以及结束时）写入各 rank 的部分谱、
+            total_weight 与已处理轨迹的下标
+        resume: 从该检查点目录继续（参数必须与写入时一致），已处理的轨迹不再计算；
+            可以与 checkpoint 是同一个目录，rank 数也可以不同（网格分解时除外）
+        accumulate: True 时把本次的结果加到上一次 calculate_spectrum 的结果上（total_weight 同样累加）
+        Args['profiling'] 为 True 时，各阶段（主机端类型转换、上传、kernel、回传、MPI 归约）的计时
+        汇总在 self.profile（profiling.ProfileReport，每个 rank 各自一份）
+        Args['coherent'] 为 True 时同一遍计算还给出相干谱 Data['radiation']['coherent']
+        与复场 Data['field']（含权重与 sigma_particle 的形状因子，归约的是复振幅）
+        out: {key: 预分配的主机数组}，Data['radiation'] 中这些键的结果写入其中
+            （布局与类型见 Args['fetchLayout']，单设备单 rank 时由设备直接拷入）
+        Args['reductions'] 的积分与峰值在回传前由设备计算，结果在 Data['reduced'][key]
+            （见 reductions.finish；Args['fetchSpectrum']=False 时只回传这些）
+        """
+        if load_balance not in LOAD_BALANCE_MODES:
+            raise ValueError(f"load_balance must be {' or '.join(map(repr, LOAD_BALANCE_MODES))}")
 
+        self.profiler = Profiler() if self.Args['profiling'] else None
+        for worker in self.workers:
+            worker.env.profiler = self.profiler
+        try:
+            self._calculate_spectrum(particleTracks, timeStep, L_screen, Np_max, it_range, nSnaps,
+                                     sigma_particle, weights_normalize, verbose, load_balance, allreduce,
+                                     checkpoint, checkpoint_interval, resume, accumulate, out)
+        finally:
+            for worker in self.workers:
+                worker.env.profiler = None
+
+        if self.profiler is not None:
+            self.profile = self.profiler.report(self.rank)
+            if self.rank == 0 and verbose:
+                print(self.profile.summary())
+
+    def _calculate_spectrum(self, particleTracks, timeStep, L_screen, Np_max, it_range, nSnaps,
+                            sigma_particle, weights_normalize, verbose, load_balance, allreduce,
+                            checkpoint, checkpoint_interval, resume, accumulate, out):
         if self.Args['mode'] == 'near':
             if L_screen is not None:
                 self.Args['L_screen'] = L_screen
@@ -45,50 +242,299 @@ class FourierRadiator:
                 raise ValueError("Define L_screen for near-field calculation")
 
         if timeStep is not None:
-            self.Args['timeStep'] = self.dtype(timeStep)
+            self.Args['timeStep'] = self.config.get_phase_dtype()(timeStep)
 
-        self.data_mgr.prepare_radiation(sigma_particle=self.dtype(sigma_particle), nSnaps=np.uint32(nSnaps))
-        self.Data = self.data_mgr.get_data()
+        # 子网格配置是另一份 Args，运行参数同步过去
+        local_args = self.local_config.get_args()
+        for key in ('L_screen', 'timeStep'):
+            if key in self.Args:
+                local_args[key] = self.Args[key]
 
-        if it_range is not None:
-            self.snap_iterations = self.data_mgr.get_snap_iterations(it_range, nSnaps)
-        else:
-            self.snap_iterations = None
-            if self.rank == 0 and verbose:
-                print("Using individual it_range per track")
+        grid_split = self.local_config is not self.config
+        if grid_split:
+            particleTracks = self._broadcast_tracks(particleTracks)
+
+        # 上一次的结果（accumulate）；磁盘上的分块结果会被本次覆盖，先读入内存
+        previous = None
+        if accumulate and getattr(self, 'Data', None) is not None:
+            # 本次结果可能写入同一个 out 数组，这时也先复制
+            previous = {key: np.array(arr) if isinstance(arr, np.memmap) or out is not None else arr
+                        for key, arr in self.Data['radiation'].items() if key != 'coherent'}
+            previous_reduced = self.Data.get('reduced')
+            # 相干谱不可加：加的是复场，平方在 _finalize_coherent 中重新做
+            if self.Args['coherent']:
+                for i, axis in enumerate('xyz'):
+                    previous[f'field_{axis}_re'] = self.Data['field'][..., i].real.copy()
+                    previous[f'field_{axis}_im'] = self.Data['field'][..., i].imag.copy()
+            previous_weight = self.total_weight
+            if 'total' in previous and previous['total'].shape[0] != nSnaps:
+                raise ValueError("accumulate=True requires the same nSnaps as the previous call")
+
+        # 峰值不可加：只有一个设备持有（本 rank 那部分网格的）完整的谱时才在设备上求，
+        # 否则在求和之后由主机上的谱求
+        device_peak = len(self.workers) == 1 and (self.size == 1 or grid_split) and previous is None
+        if 'peak' in self.Args['reductions'] and not device_peak and not self.Args['fetchSpectrum']:
+            raise ValueError("reductions 'peak' with fetchSpectrum=False needs the whole spectrum on one "
+                             "device: a single device, no MPI particle split and no accumulate")
 
         # 选择粒子
         Np = len(particleTracks)
         if Np_max is not None:
             Np = min(Np_max, Np)
-        particleTracks = particleTracks[:Np][self.rank::self.size]
+        particleTracks = particleTracks[:Np]
+
+        # 谱放不进显存（或指定了 gridTiles）时按网格分块，否则一次分配整个网格
+        tiles = self._plan_tiles(particleTracks, nSnaps)
+        if tiles is None:
+            for worker in self.workers:
+                worker.prepare(self.dtype(sigma_particle), np.uint32(nSnaps), it_range)
+        self.snap_iterations = self.workers[0].snap_iterations if tiles is None else None
+        if it_range is None and self.rank == 0 and verbose:
+            print("Using individual it_range per track")
+        if tiles is not None and self.rank == 0 and verbose:
+            print(f"[FourierRadiator] grid split into {len(tiles[1])} tiles along '{tiles[0]}'")
 
-        # 权重归一化
-        self.total_weight = 0.0
-        if weights_normalize in ['mean', 'max']:
-            weights = [track[6] for track in particleTracks]
-            norm = np.mean(weights) if weights_normalize == 'mean' else np.max(weights)
+        # 权重归一化（不修改传入的轨迹）；在分配之前对全部 Np 条轨迹计算，结果与 rank 数无关
+        if isinstance(particleTracks, TrackStore):
+            weights = particleTracks.weights.astype(np.double)
         else:
-            norm = None
+            weights = np.array([track[6] for track in particleTracks], dtype=np.double)
+        if weights_normalize == 'ones':
+            weights[:] = 1.0
+        elif weights_normalize in ['mean', 'max'] and weights.size > 0:
+            weights /= np.mean(weights) if weights_normalize == 'mean' else np.max(weights)
 
-        iterator = tqdm(range(len(particleTracks))) if self.rank == 0 else range(len(particleTracks))
-        for i in iterator:
-            track = particleTracks[i]
+        # -------- 检查点与恢复 --------
+        ckpt = None
+        restored = None
+        done = np.zeros(0, dtype=np.int64)
+        if checkpoint is not None or resume is not None:
+            if tiles is not None:
+                raise ValueError("checkpoint/resume cannot be combined with grid tiling")
+            signature = self._checkpoint_signature(Np, nSnaps, it_range, sigma_particle, weights_normalize)
+            if resume is not None:
+                restored_ckpt = Checkpoint(resume, self.rank, self.size, signature)
+                restored = restored_ckpt.load(own_only=grid_split)
+                if restored is not None:
+                    self._restore_spectra(restored[0])
+                    done = restored[2]
+                # 网格分解时各 rank 处理全部轨迹，只跳过自己处理过的；否则跳过所有 rank 处理过的
+                if mpi_installed and self.size > 1 and not grid_split:
+                    done = np.concatenate(MPI.COMM_WORLD.allgather(done))
+            if checkpoint is not None:
+                same = resume is not None and Path(checkpoint).resolve() == Path(resume).resolve()
+                ckpt = restored_ckpt if same else Checkpoint(checkpoint, self.rank, self.size, signature)
 
-            if weights_normalize == 'ones':
-                track[6] = 1.0
-            elif norm is not None:
-                track[6] /= norm
+        self._processed = [] if restored is None else [restored[2]]
+        self.total_weight = 0. if restored is None else restored[1]
+        remaining = np.setdiff1d(np.arange(Np), done)
+        if resume is not None and self.rank == 0 and verbose:
+            print(f"[FourierRadiator] resuming: {Np - remaining.size} of {Np} tracks already processed")
 
-            self.total_weight += track[6]
+        # -------- rank 之间的分配 --------
+        costs = None
+        if self.size > 1 and load_balance != 'round_robin' and not grid_split:
+            costs = track_costs(select_tracks(particleTracks, remaining), it_range, self.Args['numGridNodes'])
 
-            device_track = self.processor.track_to_device(track)
-            self.processor.process_track(device_track, self.Data, self.snap_iterations, nSnaps, it_range)
+        self._last_checkpoint = time.monotonic()
+        if costs is not None and load_balance == 'dynamic' and tiles is None:
+            # 计算量大的轨迹先分出去，结尾剩下的都是小任务
+            order = remaining[np.argsort(-costs, kind='stable')]
+            queue = WorkQueue(MPI.COMM_WORLD, order.size, chunk=self.Args['batchSize'])
+            progress = tqdm() if self.rank == 0 else None
+            chunk = queue.next()
+            while chunk is not None:
+                idx = np.sort(order[chunk[0]:chunk[1]])
+                self._process_indices(particleTracks, idx, weights, nSnaps, it_range, progress,
+                                      ckpt, checkpoint_interval)
+                chunk = queue.next()
+            queue.free()
+        else:
+            if grid_split:
+                idx = remaining
+            elif costs is not None:
+                idx = remaining[partition_lpt(costs, self.size)[self.rank]]
+            else:
+                idx = remaining[self.rank::self.size]
+            n_passes = 1 if tiles is None else len(tiles[1])
+            progress = tqdm(total=len(idx) * n_passes) if self.rank == 0 else None
+            if tiles is None:
+                # 有检查点时分段处理，段与段之间按时间间隔写检查点
+                n_chunk = len(idx) if ckpt is None else max(-(-len(idx) // 100), int(self.Args['batchSize']), 1)
+                for start in range(0, len(idx), max(n_chunk, 1)):
+                    self._process_indices(particleTracks, idx[start:start + n_chunk], weights, nSnaps,
+                                          it_range, progress, ckpt, checkpoint_interval)
+            else:
+                self._process_tiled(select_tracks(particleTracks, idx), weights[idx],
+                                    sigma_particle, nSnaps, it_range, tiles, progress, out)
+                self.total_weight += float(np.sum(weights[idx]))
+        if progress is not None:
+            progress.close()
 
-        self.data_mgr.fetch_results()
+        if ckpt is not None:
+            self._save_checkpoint(ckpt)
 
-        if mpi_installed:
-            self._gather_result_mpi()
+        if tiles is None:
+            self._sum_workers(verbose, out)
+
+        if grid_split:
+            self._profiled_reduce(self._gather_grid_mpi, allreduce)
+        elif mpi_installed and self.size > 1:
+            self._profiled_reduce(self._gather_result_mpi, allreduce)
+
+        if previous is not None:
+            for key, arr in previous.items():
+                if self.Data['radiation'][key].shape != arr.shape:
+                    raise ValueError("accumulate=True requires the same grid as the previous call")
+                self.Data['radiation'][key] += arr
+            if previous_reduced is not None and 'reduced' in self.Data:
+                reductions.add(self.Data['reduced'], previous_reduced)
+            # MPI 归约后非 root 的 rank 上 total_weight 为 None
+            if self.total_weight is not None and previous_weight is not None:
+                self.total_weight += previous_weight
+
+        if 'peak' in self.Args['reductions'] and not device_peak:
+            for key, reduced in self.Data['reduced'].items():
+                reduced.update(reductions.host_reduce(self.Data['radiation'][key], self.Args, ('peak',),
+                                                      self.Args['fetchLayout']))
+
+        if self.Args['coherent']:
+            self._finalize_coherent()
+
+        # 经过 MPI 归约、网格拼接或 accumulate 后结果不在 out 中时，拷贝进去
+        if out is not None:
+            for key, dest in out.items():
+                arr = self.Data['radiation'].get(key)
+                if arr is not None and arr is not dest:
+                    np.copyto(dest, arr)
+                    self.Data['radiation'][key] = dest
+
+    def _finalize_coherent(self):
+        """
+        各粒子（各设备、各 rank）的复场已经求和：组成 Data['field']，
+        复数数组，最后一轴为 x, y, z 分量，前四轴与 Data['radiation'] 的布局相同：
+            fetchLayout='grid'    (nSnaps, nOmega, nTheta, nPhi, 3)
+            fetchLayout='device'  (nSnaps, nPhi, nTheta, nOmega, 3)
+        相干谱 Data['radiation']['coherent'] = |field|^2 对分量求和，轴顺序同样跟随 fetchLayout
+        """
+        # 设备的 Data 不改动（下一次 prepare_radiation 按键重新分配），结果放在一份浅拷贝中
+        radiation = dict(self.Data['radiation'])
+        self.Data = dict(self.Data, radiation=radiation)
+        field = np.empty(radiation['total'].shape + (3,), dtype=np.cdouble)
+        for i, axis in enumerate('xyz'):
+            field[..., i].real = radiation.pop(f'field_{axis}_re')
+            field[..., i].imag = radiation.pop(f'field_{axis}_im')
+        self.Data['field'] = field
+        radiation['coherent'] = np.einsum('...i,...i->...', field.real, field.real) \
+            + np.einsum('...i,...i->...', field.imag, field.imag)
+        if 'reduced' in self.Data:
+            self.Data['reduced'] = dict(self.Data['reduced'])
+            self.Data['reduced']['coherent'] = reductions.host_reduce(
+                radiation['coherent'], self.Args, self.Args['reductions'], self.Args['fetchLayout'])
+
+    def _process_indices(self, particleTracks, idx, weights, nSnaps, it_range, progress,
+                         ckpt=None, checkpoint_interval=None):
+        # 处理 particleTracks[:Np] 中下标为 idx 的轨迹并记录；距上次检查点超过间隔时写检查点
+        self._process_local(select_tracks(particleTracks, idx), weights[idx], nSnaps, it_range, progress)
+        self._processed.append(np.asarray(idx, dtype=np.int64))
+        self.total_weight += float(np.sum(weights[idx]))
+        if ckpt is not None and time.monotonic() - self._last_checkpoint >= checkpoint_interval:
+            self._save_checkpoint(ckpt)
+
+    def _checkpoint_signature(self, Np, nSnaps, it_range, sigma_particle, weights_normalize):
+        Args = self.local_config.get_args()
+        return {
+            'mode': Args['mode'], 'dtype': Args['dtype'], 'grid': repr(Args['grid']),
+            'gridSlice': repr(Args.get('gridSlice')), 'Features': sorted(Args['Features']),
+            'components': Args['components'], 'timeStep': float(Args['timeStep']),
+            'L_screen': float(Args['L_screen']) if Args['mode'] == 'near' else None,
+            'Np': int(Np), 'nSnaps': int(nSnaps), 'it_range': repr(it_range),
+            'sigma_particle': float(sigma_particle), 'weights_normalize': weights_normalize,
+        }
+
+    def _save_checkpoint(self, ckpt):
+        # 各设备的部分谱（设备布局与精度）求和后写入
+        spectra = {}
+        for worker in self.workers:
+            worker.finish()
+            for key, arr in worker.Data['radiation'].items():
+                host = arr if isinstance(arr, np.ndarray) else arr.get()
+                spectra[key] = spectra[key] + host if key in spectra else np.array(host)
+        processed = np.concatenate(self._processed) if self._processed else np.zeros(0, dtype=np.int64)
+        ckpt.save(spectra, self.total_weight, processed)
+        self._last_checkpoint = time.monotonic()
+
+    def _restore_spectra(self, spectra):
+        # 恢复的部分谱放到第一个设备上，其余设备从零开始
+        radiation = self.workers[0].Data['radiation']
+        for key, arr in spectra.items():
+            if radiation[key].shape != arr.shape:
+                raise ValueError("Checkpoint spectrum shape does not match the grid")
+            if isinstance(radiation[key], np.ndarray):
+                radiation[key][...] = arr
+            else:
+                radiation[key].set(np.ascontiguousarray(arr, dtype=radiation[key].dtype))
+
+    def _process_local(self, particleTracks, weights, nSnaps, it_range, progress):
+        # 本 rank 分到的轨迹：单设备直接处理，设备池中再按吞吐动态分给各设备
+        update = progress.update if progress is not None else None
+        if len(self.workers) > 1:
+            pool = DevicePool(self.workers)
+            pool.process(particleTracks, weights, nSnaps, it_range,
+                         unit=self.Args['batchSize'], progress=update)
+            self.device_stats = pool.stats
+        else:
+            self.workers[0].process(particleTracks, weights, nSnaps, it_range, update)
+
+    def _plan_tiles(self, particleTracks, nSnaps):
+        # 只对单个 OpenCL 设备分块；设备池与主机端后端仍一次分配整个网格
+        if len(self.workers) > 1 or not isinstance(self.processor, ParticleProcessor):
+            return None
+        lengths = track_lengths(particleTracks)
+        max_len = int(lengths.max()) if lengths.size else 0
+        # 轨迹缓冲池按 2 倍增长，批量模式一次放 batchSize 条
+        itemsize = np.dtype(self.config.get_phase_dtype()).itemsize
+        track_bytes = 2 * 6 * itemsize * max_len * max(int(self.Args['batchSize']), 1)
+        return plan_tiles(self.local_config, self.env, nSnaps, track_bytes)
+
+    def _process_tiled(self, particleTracks, weights, sigma_particle, nSnaps, it_range, tiles, progress,
+                       out=None):
+        def make_worker(config):
+            return DeviceWorker(config, self.env, self.compiler, self.processor.with_config(config),
+                                RadiationDataManager(config, self.env))
+
+        axis, bounds = tiles
+        tiled = TiledSpectrum(self.local_config, self.env, make_worker, axis, bounds, nSnaps,
+                              out_dir=self.Args['tileOutput'], out=out)
+        radiation = tiled.run(particleTracks, weights, self.dtype(sigma_particle), np.uint32(nSnaps),
+                              it_range, progress.update if progress is not None else None)
+        self.Data = self.workers[0].Data
+        self.Data['radiation'] = radiation
+        if tiled.reduced is not None:
+            self.Data['reduced'] = tiled.reduced
+
+    def _sum_workers(self, verbose, out=None):
+        # 第一个设备的结果直接写入 out，其余设备的加到上面
+        for i, worker in enumerate(self.workers):
+            worker.fetch(out if i == 0 else None)
+        self.Data = self.workers[0].Data
+
+        # 各设备的谱求和
+        for worker in self.workers[1:]:
+            for key in self.Data['radiation']:
+                self.Data['radiation'][key] += worker.Data['radiation'][key]
+            if 'reduced' in self.Data:
+                reductions.add(self.Data['reduced'], worker.Data['reduced'])
+
+        if self.rank == 0 and verbose and len(self.workers) > 1:
+            for stat in self.device_stats:
+                rate = stat['steps'] / stat['seconds'] if stat['seconds'] > 0 else 0.
+                print(f"[DevicePool] {stat['device']}: {stat['tracks']} tracks, {rate:.3g} steps/s")
+
+    def release_buffers(self):
+        """释放上传流水线、轨迹缓冲池与快照缓存（下一次 calculate_spectrum 会重新分配）"""
+        for worker in self.workers:
+            worker.release_buffers()
 
     def _get_mpi_info(self):
         if mpi_installed:
@@ -97,15 +543,129 @@ class FourierRadiator:
         else:
             return 0, 1
 
-    def _gather_result_mpi(self):
+    def _profiled_reduce(self, gather, allreduce):
+        if self.profiler is None:
+            return gather(allreduce)
+        nbytes = sum(arr.nbytes for arr in self.Data['radiation'].values())
+        with self.profiler.timer('reduce', gather.__name__.strip('_'), nbytes=nbytes):
+            gather(allreduce)
+
+    def _gather_result_mpi(self, allreduce=False):
+        # 所有键拼接成一个连续缓冲区，一次归约；数据类型由 numpy 数组推断
         comm = MPI.COMM_WORLD
-        for key in self.Data['radiation']:
-            buff = np.zeros_like(self.Data['radiation'][key])
-            comm.Barrier()
-            comm.Reduce([self.Data['radiation'][key], MPI.DOUBLE],
-                        [buff, MPI.DOUBLE])
-            comm.Barrier()
-            self.Data['radiation'][key] = buff
+        # reductions 中可加的项一起归约（峰值在归约后由整个谱重新求）
+        targets = [(self.Data['radiation'], key) for key in self.Data['radiation']]
+        targets += [(reduced, name) for reduced in self.Data.get('reduced', {}).values()
+                    for name in reductions.LINEAR if name in reduced]
+        arrays = [container[key] for container, key in targets]
+        buff = np.concatenate([arr.ravel() for arr in arrays])
+
+        if allreduce:
+            comm.Allreduce(MPI.IN_PLACE, buff, op=MPI.SUM)
+            self.total_weight = comm.allreduce(self.total_weight)
+        else:
+            if self.rank == 0:
+                comm.Reduce(MPI.IN_PLACE, buff, op=MPI.SUM, root=0)
+            else:
+                comm.Reduce(buff, None, op=MPI.SUM, root=0)
+                buff[:] = 0  # 与原来一致：非 root 的 rank 上结果为零
+            self.total_weight = comm.reduce(self.total_weight)
+
+        offset = 0
+        for (container, key), arr in zip(targets, arrays):
+            container[key] = buff[offset:offset + arr.size].reshape(arr.shape).astype(arr.dtype, copy=False)
+            offset += arr.size
+
+    def _broadcast_tracks(self, particleTracks):
+        """
+        只有部分 rank 持有轨迹时从 rank 0 广播；TrackStore 只广播路径与下标，各 rank 自己打开。
+        轨迹列表先广播每条的长度、权重与 it_start，坐标按组打包成 (6, 点数) 的数组，
+        每组不超过 BCAST_CHUNK_BYTES，用缓冲区 Bcast 分段发送（pickle 的 bcast 超过 2 GB 会失败）
+        """
+        comm = MPI.COMM_WORLD
+        if not comm.allreduce(particleTracks is None, op=MPI.LOR):
+            return particleTracks
+
+        header = None
+        if self.rank == 0:
+            if isinstance(particleTracks, TrackStore):
+                header = ('store', str(particleTracks.path), particleTracks._ids)
+            else:
+                particleTracks = list(particleTracks)
+                dtype = np.result_type(*(np.asarray(coord).dtype for coord in particleTracks[0][:6])) \
+                    if particleTracks else np.dtype(np.double)
+                header = ('list', np.array([len(track[0]) for track in particleTracks], dtype=np.int64),
+                          np.array([track[6] for track in particleTracks], dtype=np.double),
+                          np.array([track[7] for track in particleTracks], dtype=np.int64), dtype.str)
+        kind, *data = comm.bcast(header, root=0)
+        if kind == 'store':
+            return TrackStore(data[0], ids=data[1])
+
+        lengths, weights, it_start, dtype = data
+        dtype = np.dtype(dtype)
+        chunk = max(BCAST_CHUNK_BYTES // dtype.itemsize, 1)  # 每次 Bcast 的元素个数
+        ends = np.cumsum(lengths)
+        tracks = []
+        start = 0
+        while start < lengths.size:
+            # 一组轨迹：至少一条，总点数不超过 chunk / 6
+            begin = ends[start - 1] if start else 0
+            stop = max(int(np.searchsorted(ends, begin + chunk // 6, side='right')), start + 1)
+            offsets = np.concatenate(([0], ends[start:stop] - begin))
+            buf = np.empty((6, offsets[-1]), dtype=dtype)
+            if self.rank == 0:
+                for j, track in enumerate(particleTracks[start:stop]):
+                    for row, coord in zip(buf, track[:6]):
+                        row[offsets[j]:offsets[j + 1]] = coord
+            flat = buf.reshape(-1)
+            for lo in range(0, flat.size, chunk):
+                comm.Bcast(flat[lo:lo + chunk], root=0)
+            if self.rank != 0:
+                for j in range(stop - start):
+                    coords = tuple(row[offsets[j]:offsets[j + 1]] for row in buf)
+                    tracks.append(coords + (weights[start + j], int(it_start[start + j])))
+            start = stop
+        return particleTracks if self.rank == 0 else tracks
+
+    def _gather_grid_mpi(self, allgather=False):
+        """
+        网格分解时各 rank 的谱是不相交的子网格，不需要归约：
+        所有键打包后一次 Gatherv（或 Allgatherv），再沿分解轴拼接
+        """
+        comm = MPI.COMM_WORLD
+        axis_name = self.Args['gridDecomposition']
+        axis = self.config.result_axis(axis_name)
+        bounds = self.config.split_grid(axis_name, self.size)
+
+        # reductions 很小，直接收集 Python 对象再拼接
+        if 'reduced' in self.Data:
+            parts = comm.allgather(self.Data['reduced']) if allgather else comm.gather(self.Data['reduced'])
+            if parts is not None:
+                self.Data['reduced'] = reductions.join(parts, axis_name, bounds)
+
+        keys = list(self.Data['radiation'])
+        if not keys:
+            return
+        local = [np.moveaxis(self.Data['radiation'][key], axis, 0) for key in keys]
+        sendbuf = np.concatenate([arr.ravel() for arr in local])
+
+        # 每个 rank 的块：各键依次排列，每个键 (n_axis, 其余轴)
+        other = local[0].shape[1:]
+        block = int(np.prod(other))
+        counts = np.array([(stop - start) * block * len(keys) for start, stop in bounds])
+        displs = np.concatenate([[0], np.cumsum(counts[:-1])])
+
+        recvbuf = np.empty(int(counts.sum()), dtype=sendbuf.dtype) if allgather or self.rank == 0 else None
+        if allgather:
+            comm.Allgatherv(sendbuf, [recvbuf, (counts, displs)])
+        else:
+            comm.Gatherv(sendbuf, [recvbuf, (counts, displs)] if self.rank == 0 else None, root=0)
 
-        comm.Barrier()
-        self.total_weight = comm.reduce(self.total_weight)
+        if recvbuf is None:
+            return
+        for k, key in enumerate(keys):
+            parts = []
+            for (start, stop), displ in zip(bounds, displs):
+                n = (stop - start) * block
+                parts.append(recvbuf[displ + k * n:displ + (k + 1) * n].reshape((stop - start,) + other))
+            self.Data['radiation'][key] = np.ascontiguousarray(np.moveaxis(np.concatenate(parts), 0, axis))
@@ -0,0 +1,192 @@
+"""Type-3 non-uniform FFT and the NUFFT far-field engine."""
+
+import numpy as np
+
+from .particle import snap_steps
+
+
+def nufft3(x, c, s, eps=1e-9, direct_limit=1 << 16):
+    """
+    计算 F[k] = sum_j c[j] * exp(1j * s[k] * x[j])，x 和 s 都是非均匀点（type-3 NUFFT）
+
+    x: (n,) 实数点;  c: (n,) 或 (n, m) 系数;  s: (ns,) 实数频率
+    返回 (ns,) 或 (ns, m) 复数数组
+
+    采用两次高斯网格化：先把 x 上的系数展开到均匀网格，再用过采样 FFT
+    加高斯插值求非均匀频率 s 处的值，两次都用解卷积因子补偿
+    """
+    x = np.asarray(x, dtype=np.double)
+    s = np.asarray(s, dtype=np.double)
+    c = np.asarray(c)
+    squeeze = c.ndim == 1
+    c = (c[:, None] if squeeze else c).astype(np.complex128)  # x 为空时 reshape(0, -1) 无法推断列数
+
+    if x.size == 0 or s.size == 0:
+        out = np.zeros((s.size, c.shape[1]), dtype=np.complex128)
+        return out[:, 0] if squeeze else out
+
+    # -------- 平移到以 0 为中心，平移量放进前后相位因子 --------
+    x_c, X = 0.5 * (x.max() + x.min()), 0.5 * (x.max() - x.min())
+    s_c, S = 0.5 * (s.max() + s.min()), 0.5 * (s.max() - s.min())
+    x_r = x - x_c
+    s_r = s - s_c
+
+    c = c * np.exp(1j * s_c * x_r)[:, None]
+
+    if x.size * s.size <= direct_limit or X * S < 1.:
+        out = np.exp(1j * np.outer(s_r, x_r)) @ c
+    else:
+        out = _nufft3_gridded(x_r, c, s_r, X, S, eps)
+
+    out *= np.exp(1j * s * x_c)[:, None]
+    return out[:, 0] if squeeze else out
+
+
+def _nufft3_gridded(x, c, s, X, S, eps):
+    log_eps = np.log(1. / eps)
+
+    # -------- 1. 高斯展开到 x 的均匀网格（2 倍过采样）--------
+    h = np.pi / (2 * S)
+    tau = log_eps / (8 * S**2)
+    w_x = int(np.ceil(np.sqrt(4 * tau * log_eps) / h)) + 1
+    M = int(np.ceil(X / h)) + w_x + 1
+    L = M * h
+
+    # -------- 2. s 方向的 FFT 长度与插值高斯 --------
+    N = _fast_length(4 * M + 1)
+    ds = 2 * np.pi / (N * h)
+    sigma = log_eps / (8 * L**2)
+    w_s = int(np.ceil(np.sqrt(4 * sigma * log_eps) / ds)) + 1
+
+    offsets = np.arange(-w_x, w_x + 1)
+    idx = np.rint(x / h).astype(np.int64)[:, None] + offsets
+    kernel = np.exp(-(idx * h - x[:, None])**2 / (4 * tau))
+
+    grid = np.zeros((N, c.shape[1]), dtype=np.complex128)
+    flat_idx = (idx % N).ravel()
+    for i in range(c.shape[1]):
+        values = (kernel * c[:, i:i + 1]).ravel()
+        grid[:, i] = (np.bincount(flat_idx, weights=values.real, minlength=N)
+                      + 1j * np.bincount(flat_idx, weights=values.imag, minlength=N))
+
+    # 网格点 x_m = m*h（m 可为负，按 N 取模存放），除以插值高斯的傅里叶变换
+    m = np.arange(N)
+    m[m > N // 2] -= N
+    grid /= (np.sqrt(4 * np.pi * sigma) * np.exp(-sigma * (m * h)**2))[:, None]
+
+    # G'(l*ds) = sum_m F'_m exp(i*l*m*2pi/N)
+    grid = N * np.fft.ifft(grid, axis=0)
+
+    # -------- 3. 在 s 处做高斯插值并解卷积 --------
+    offsets = np.arange(-w_s, w_s + 1)
+    idx = np.rint(s / ds).astype(np.int64)[:, None] + offsets
+    kernel = np.exp(-(s[:, None] - idx * ds)**2 / (4 * sigma))
+
+    out = ds * np.einsum('kl,klm->km', kernel, grid[idx % N])
+    out *= (h / (np.sqrt(4 * np.pi * tau) * np.exp(-tau * s**2)))[:, None]
+    return out
+
+
+def _fast_length(n):
+    # 不小于 n 的 2^a 3^b 5^c
+    best = 1 << int(np.ceil(np.log2(n)))
+    f5 = 1
+    while f5 < best:
+        f35 = f5
+        while f35 < best:
+            f = f35
+            while f < n:
+                f *= 2
+            best = min(best, f)
+            f35 *= 3
+        f5 *= 5
+    return best
+
+
+class NufftParticleProcessor:
+    """
+    远场谱的 NUFFT 引擎（CPU, NumPy）：对每个方向，把各步的振幅放在推迟时间
+    t - n·x 上，用一次 type-3 NUFFT 得到所有 omega 的和，
+    接口与 ParticleProcessor 相同，结果写入同样布局的 Data['radiation']['total']
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.dtype = config.get_dtype()
+        self.Args = config.get_args()
+
+    def track_to_device(self, particleTrack):
+        if len(particleTrack) != 8:
+            raise ValueError("Each particleTrack must have 8 elements")
+
+        x, y, z, ux, uy, uz, wp, it_start = particleTrack
+
+        # 在主机上计算，坐标统一转为 double
+        coords = [np.ascontiguousarray(coord, dtype=np.double) for coord in (x, y, z, ux, uy, uz)]
+        return coords + [self.dtype(wp), np.uint32(it_start)]
+
+    def process_track(self, particleTrack, radiation_data,
+                      snap_iterations, nSnaps, it_range=None):
+
+        x, y, z, ux, uy, uz, wp, it_start = particleTrack
+        n_steps = x.size
+
+        # -------- snap_iterations 与 it_range（与 kernel 一致）--------
+        if it_range is None:
+            it_start = 0
+            it_range = (0, n_steps)
+            snap_iterations = np.linspace(*it_range, nSnaps + 1, dtype=np.uint32)[1:]
+
+        snaps = snap_steps(it_start, it_range[-1], n_steps, snap_iterations)
+        if not snaps or n_steps < 2:
+            return
+
+        dt = np.double(self.Args['timeStep'])
+        omega = 2 * np.pi * np.asarray(self.Args['omega'], dtype=np.double)
+        omega_max = np.abs(omega).max()
+        spectrum = radiation_data['radiation']['total']
+
+        # -------- 只依赖轨迹的量：步中点速度与加速度 --------
+        last = max(step for _, step in snaps) + 1
+        u = np.stack((ux, uy, uz), axis=1)[:last + 1]
+        beta = u / np.sqrt(1. + np.sum(u * u, axis=1))[:, None]
+        acc = (beta[1:] - beta[:-1]) / dt
+        beta = 0.5 * (beta[1:] + beta[:-1])
+        pos = np.stack((x, y, z), axis=1)[:last]
+        time = (it_start + np.arange(last)) * dt
+
+        wpdt2 = np.double(wp) * dt * dt
+
+        for iPhi, phi in enumerate(np.asarray(self.Args['phi'], dtype=np.double)):
+            for iTheta, theta in enumerate(np.asarray(self.Args['theta'], dtype=np.double)):
+                n_vec = np.array([np.sin(theta) * np.cos(phi),
+                                  np.sin(theta) * np.sin(phi),
+                                  np.cos(theta)])
+
+                phase = time - pos @ n_vec
+                c2 = 1. / (1. - beta @ n_vec)
+                c1 = (acc @ n_vec) * c2 * c2
+                amplitude = c1[:, None] * (n_vec - beta) - c2[:, None] * acc
+
+                # kernel 跳过 omega*|Δphase| >= π 的步（第一步与 0 比较）：
+                # 对所有 omega 都通过的步用 NUFFT，其余少数步逐频率直接求和
+                d_phase = np.abs(np.diff(phase, prepend=0.))
+                resolved = omega_max * d_phase < np.pi
+
+                field = np.zeros((omega.size, 3), dtype=np.complex128)
+                start = 0
+                for iSnap, step in snaps:
+                    stop = step + 1
+                    if stop > start:
+                        seg = slice(start, stop)
+                        fine = resolved[seg]
+                        field += nufft3(phase[seg][fine], amplitude[seg][fine], omega,
+                                        eps=self.Args['nufftEps'])
+                        if not fine.all():
+                            coarse = ~fine
+                            mask = np.outer(omega, d_phase[seg][coarse]) < np.pi
+                            field += (mask * np.exp(1j * np.outer(omega, phase[seg][coarse]))) \
+                                @ amplitude[seg][coarse]
+                        start = stop
+
+                    spectrum[iSnap, iPhi, iTheta] += wpdt2 * np.sum(np.abs(field)**2, axis=1)
@@ -0,0 +1,191 @@
+"""NumPy CPU backend used when no OpenCL device is available."""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from .config import COMPONENT_KEYS
+from .particle import snap_steps
+
+
+class NumpyParticleProcessor:
+    """
+    与 ParticleProcessor 接口相同的 CPU 实现：按 (网格节点块 × 时间块) 分块，
+    用向量化的 NumPy 计算 total / cartesian_comps kernel 的同一公式，
+    方向块分给线程池并行，每块的临时数组大小受 Args['cpuChunkMB'] 限制
+    """
+
+    def __init__(self, config):
+        self.config = config
+        # dtype='mixed' 时主机上直接用 double 计算
+        self.dtype = config.get_phase_dtype()
+        self.Args = config.get_args()
+
+        self.n_threads = int(self.Args['cpuThreads'] or os.cpu_count() or 1)
+        self.chunk_bytes = int(self.Args['cpuChunkMB'] * 2**20)
+
+    def track_to_device(self, particleTrack):
+        if len(particleTrack) != 8:
+            raise ValueError("Each particleTrack must have 8 elements")
+
+        x, y, z, ux, uy, uz, wp, it_start = particleTrack
+
+        coords = [np.ascontiguousarray(coord, dtype=self.dtype) for coord in (x, y, z, ux, uy, uz)]
+        return coords + [self.dtype(wp), np.uint32(it_start)]
+
+    def process_track(self, particleTrack, radiation_data,
+                      snap_iterations, nSnaps, it_range=None):
+
+        x, y, z, ux, uy, uz, wp, it_start = particleTrack
+        n_steps = x.size
+
+        # -------- snap_iterations 与 it_range（与 kernel 一致）--------
+        if it_range is None:
+            it_start = 0
+            it_range = (0, n_steps)
+            snap_iterations = np.linspace(*it_range, nSnaps + 1, dtype=np.uint32)[1:]
+
+        snaps = snap_steps(it_start, it_range[-1], n_steps, snap_iterations)
+        if not snaps or n_steps < 2:
+            return
+
+        # -------- 只依赖轨迹的量 --------
+        dtype = self.dtype
+        dt = dtype(self.Args['timeStep'])
+        last = max(step for _, step in snaps) + 1
+
+        u = np.stack((ux, uy, uz), axis=1)[:last + 1]
+        beta = u / np.sqrt(dtype(1.) + np.sum(u * u, axis=1))[:, None]
+        track = {
+            'pos': np.stack((x, y, z), axis=1)[:last],
+            'time': (it_start + np.arange(last)).astype(dtype) * dt,
+            'wpdt2': dtype(wp) * dt * dt,
+        }
+        if self.Args['mode'] == 'far':
+            track['acc'] = (beta[1:] - beta[:-1]) / dt
+            track['beta'] = dtype(0.5) * (beta[1:] + beta[:-1])
+        else:
+            track['beta'] = beta[:last]
+
+        # -------- 方向（屏上点）分块，交给线程池 --------
+        nOmega, nTheta, nPhi = self.Args['gridNodeNums']
+        n_dirs = nTheta * nPhi
+        elems = max(self.chunk_bytes // (8 * np.dtype(dtype).itemsize), 1)
+        n_dir_tile = max(1, min(-(-n_dirs // self.n_threads), elems // (nOmega * 16)))
+        n_block = max(1, elems // (nOmega * n_dir_tile))
+
+        components = self.Args['components']
+        tiles = [slice(d, min(d + n_dir_tile, n_dirs)) for d in range(0, n_dirs, n_dir_tile)]
+        with ThreadPoolExecutor(max_workers=min(self.n_threads, len(tiles))) as executor:
+            list(executor.map(
+                lambda tile: self._process_tile(tile, track, snaps, n_block, radiation_data, components),
+                tiles))
+
+    def _directions(self, tile, radiation_data):
+        # 方向编号 d = iPhi*nTheta + iTheta，与 kernel 的网格顺序一致
+        nTheta = self.Args['gridNodeNums'][1]
+        d = np.arange(tile.start, tile.stop)
+        iPhi, iTheta = d // nTheta, d % nTheta
+
+        if self.Args['mode'] == 'far':
+            sinTheta = radiation_data['sinTheta'][iTheta]
+            return np.stack((sinTheta * radiation_data['cosPhi'][iPhi],
+                             sinTheta * radiation_data['sinPhi'][iPhi],
+                             radiation_data['cosTheta'][iTheta]), axis=1)
+        else:
+            radius = radiation_data['radius'][iTheta]
+            return np.stack((radius * radiation_data['cosPhi'][iPhi],
+                             radius * radiation_data['sinPhi'][iPhi],
+                             np.full_like(radius, self.Args['L_screen'])), axis=1)
+
+    def _process_tile(self, tile, track, snaps, n_block, radiation_data, components):
+        dtype = self.dtype
+        omega = radiation_data['omega']
+        nOmega = omega.size
+        vecs = self._directions(tile, radiation_data)
+        n_dirs = vecs.shape[0]
+
+        field_re = np.zeros((n_dirs, nOmega, 3), dtype=dtype)
+        field_im = np.zeros((n_dirs, nOmega, 3), dtype=dtype)
+        phase_prev = np.zeros((n_dirs, 1), dtype=dtype)
+
+        start = 0
+        for iSnap, step in snaps:
+            for m0 in range(start, step + 1, n_block):
+                m1 = min(m0 + n_block, step + 1)
+                phase_prev = self._accumulate(
+                    slice(m0, m1), vecs, track, omega, phase_prev, field_re, field_im)
+            start = max(start, step + 1)
+
+            self._write_snap(radiation_data['radiation'], iSnap, tile,
+                             track['wpdt2'], field_re, field_im, components)
+
+    def _accumulate(self, steps, vecs, track, omega, phase_prev, field_re, field_im):
+        dtype = self.dtype
+        pos, time, beta = track['pos'][steps], track['time'][steps], track['beta'][steps]
+
+        if self.Args['mode'] == 'far':
+            n_vec = vecs[:, None, :]
+            phase = time[None, :] - vecs @ pos.T                       # (D, B)
+
+            acc = track['acc'][steps]
+            c2 = dtype(1.) / (dtype(1.) - beta @ vecs.T).T              # (D, B)
+            c1 = (acc @ vecs.T).T * c2 * c2
+            amplitude = c1[..., None] * (n_vec - beta[None]) - c2[..., None] * acc[None]
+        else:
+            r_vec = vecs[:, None, :] - pos[None]                        # (D, B, 3)
+            r_local = np.sqrt(np.sum(r_vec * r_vec, axis=2))
+            phase = time[None, :] + r_local
+            r_inv = dtype(1.) / r_local
+            n_vec = r_vec * r_inv[..., None]
+            amp_omega = r_inv[..., None] * (beta[None] - n_vec)        # 乘以 omega 的部分
+            amplitude = (r_inv * r_inv)[..., None] * n_vec
+
+        # 与 kernel 相同：omega*|Δphase| >= π 的步不累加（第一步与 0 比较）
+        d_phase = np.abs(np.diff(np.concatenate((phase_prev, phase), axis=1), axis=1))
+        omega_phase = omega[None, :, None] * phase[:, None, :]          # (D, Ω, B)
+        mask = omega[None, :, None] * d_phase[:, None, :] < dtype(np.pi)
+        cos_phase = np.where(mask, np.cos(omega_phase), dtype(0.))
+        sin_phase = np.where(mask, np.sin(omega_phase), dtype(0.))
+
+        field_re += cos_phase @ amplitude
+        field_im += sin_phase @ amplitude
+        if self.Args['mode'] != 'far':
+            field_re -= omega[None, :, None] * (sin_phase @ amp_omega)
+            field_im += omega[None, :, None] * (cos_phase @ amp_omega)
+
+        return phase[:, -1:]
+
+    def _write_snap(self, radiation, iSnap, tile, wpdt2, field_re, field_im, components):
+        nSnaps = radiation['total'].shape[0]
+        nOmega = field_re.shape[1]
+
+        spectrum = radiation['total'].reshape(nSnaps, -1, nOmega)
+        spectrum[iSnap, tile] += wpdt2 * np.sum(field_re * field_re + field_im * field_im, axis=2)
+
+        if components is None:
+            return
+
+        if components == 'spheric':
+            # 投影到 (n, theta, phi) 单位矢量
+            basis = self._spheric_basis(tile)                   # (D, 3, 3)
+            field_re = np.einsum('dij,doj->doi', basis, field_re)
+            field_im = np.einsum('dij,doj->doi', basis, field_im)
+
+        power = wpdt2 * (field_re * field_re + field_im * field_im)    # (D, Ω, 3)
+        for i, key in enumerate(COMPONENT_KEYS[components]):
+            spectrum = radiation[key].reshape(nSnaps, -1, nOmega)
+            spectrum[iSnap, tile] += power[..., i]
+
+    def _spheric_basis(self, tile):
+        nTheta = self.Args['gridNodeNums'][1]
+        d = np.arange(tile.start, tile.stop)
+        theta = self.Args['theta'][d % nTheta].astype(self.dtype)
+        phi = self.Args['phi'][d // nTheta].astype(self.dtype)
+        zero = np.zeros_like(theta)
+        return np.stack((
+            np.stack((np.sin(theta) * np.cos(phi), np.sin(theta) * np.sin(phi), np.cos(theta)), axis=1),
+            np.stack((np.cos(theta) * np.cos(phi), np.cos(theta) * np.sin(phi), -np.sin(theta)), axis=1),
+            np.stack((-np.sin(phi), np.cos(phi), zero), axis=1),
+        ), axis=1)
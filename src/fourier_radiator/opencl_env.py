@@ -1,13 +1,33 @@
-import pyopencl as cl
-import pyopencl.array as arrcl
 import numpy as np
 
+try:
+    import pyopencl as cl
+    import pyopencl.array as arrcl
+    opencl_installed = True
+except ImportError:
+    opencl_installed = False
+
+def list_devices():
+    """所有平台上的全部 OpenCL 设备（ctx='all' 的设备池）"""
+    if not opencl_installed:
+        return []
+    try:
+        return [dev for plat in cl.get_platforms() for dev in plat.get_devices()]
+    except Exception as e:
+        print(f"[OpenCL] device enumeration failed: {e}")
+        return []
+
 class OpenCLEnvironment:
-    def __init__(self, rank, ctx=None):
+    def __init__(self, rank, ctx=None, profiling=False):
         self.rank = rank
         self.ctx = self._create_context(ctx)
-        self.queue = cl.CommandQueue(self.ctx)
+        # profiling 时所有队列开启 PROFILING_ENABLE，事件带设备端时间戳
+        self.queue_properties = cl.command_queue_properties.PROFILING_ENABLE \
+            if profiling and self.ctx is not None else 0
+        self.queue = self.new_queue() if self.ctx is not None else None
         self.WGS = 256  # 默认工作组大小
+        self._pool = {}  # 按名字复用的设备缓冲，见 pooled()
+        self.profiler = None  # profiling.Profiler，由 FourierRadiator 在每次计算时设置
 
     # def _create_context(self, ctx):
     #     if ctx is not None:
@@ -28,14 +48,22 @@ class OpenCLEnvironment:
     def _create_context(self, ctx):
         """
         ctx:
-            1) 已经创建好的 cl.Context → 直接返回
+            1) 已经创建好的 cl.Context → 直接返回；cl.Device → 为它创建 Context
             2) 字符串 'gpu' / 'cpu'    → 按类型挑设备
             3) None                    → 默认先找 GPU，再退 CPU
+            4) 字符串 'host'           → 不用 OpenCL，走 NumPy CPU 后端
         """
+        if ctx == 'host' or not opencl_installed:
+            self.plat_name = "None"
+            return None
+
         # --- 1. 调用方直接给了 Context ---
         if isinstance(ctx, cl.Context):
             self.plat_name = "Manual"
             return ctx
+        if isinstance(ctx, cl.Device):
+            self.plat_name = ctx.platform.name
+            return cl.Context([ctx])
 
         # --- 2. 决定想要的 device_type ---
         if isinstance(ctx, str):
@@ -45,7 +73,8 @@ class OpenCLEnvironment:
             elif want == "cpu":
                 dev_type = cl.device_type.CPU
             else:
-                raise ValueError("ctx must be 'gpu', 'cpu', a cl.Context or None")
+                raise ValueError("ctx must be 'gpu', 'cpu', 'host', 'all', a cl.Context, "
+                                 "a list of devices/contexts or None")
         else:                       # ctx is None
             dev_type = cl.device_type.GPU      # 默认先找 GPU
             fallback = cl.device_type.CPU      # 找不到就用 CPU
@@ -75,20 +104,65 @@ class OpenCLEnvironment:
             self.plat_name = "None"
             return None
 
+    def new_queue(self):
+        """同一 context 上的另一个队列（传输队列等），属性与主队列相同"""
+        return cl.CommandQueue(self.ctx, properties=self.queue_properties)
+
     def to_device(self, array, dtype=None):
-        if dtype:
-            array = np.ascontiguousarray(array.astype(dtype))
+        # 类型与内存布局已经满足时不复制
+        array = np.ascontiguousarray(array, dtype=dtype)
         return arrcl.to_device(self.queue, array)
 
+    def pooled(self, key, n, dtype):
+        """
+        返回缓冲池中名为 key 的设备数组的前 n 个元素；容量不足时按 2 倍增长，
+        所以稳态下（轨迹长度不超过已见过的最大值）不再分配设备内存
+        """
+        dtype = np.dtype(dtype)
+        buf = self._pool.get(key)
+        if buf is None or buf.dtype != dtype or buf.size < n:
+            capacity = n
+            if buf is not None and buf.dtype == dtype:
+                capacity = max(n, 2 * buf.size)
+            buf = arrcl.empty(self.queue, (max(capacity, 1),), dtype)
+            self._pool[key] = buf
+        return buf[:n]
+
+    def to_pooled(self, key, array, dtype):
+        # 与 to_device 相同，但写入缓冲池中的数组（按队列顺序，不会覆盖仍在使用的数据）
+        if self.profiler is None:
+            array = np.ascontiguousarray(array, dtype=dtype).ravel()
+        else:
+            with self.profiler.timer('cast', key):
+                array = np.ascontiguousarray(array, dtype=dtype).ravel()
+        view = self.pooled(key, array.size, dtype)
+        if array.size:
+            event = cl.enqueue_copy(self.queue, view.data, array)
+            if self.profiler is not None:
+                self.profiler.event('upload', event, key, nbytes=array.nbytes)
+        return view
+
+    def release_pool(self):
+        """释放缓冲池中的全部设备缓冲"""
+        if self.queue is not None:
+            self.queue.finish()
+        self._pool.clear()
+
     def zeros(self, shape, dtype):
         return arrcl.zeros(self.queue, shape, dtype=dtype)
 
+    def local_memory(self, nbytes):
+        return cl.LocalMemory(int(nbytes))
+
     def get_queue(self):
         return self.queue
 
     def get_context(self):
         return self.ctx
 
+    def get_device_name(self):
+        return self.ctx.devices[0].name.strip() if self.ctx is not None else "host"
+
     def get_platform_name(self):
         return self.plat_name
 
@@ -1,13 +1,73 @@
 import numpy as np
 
+try:
+    import pyopencl as cl
+except ImportError:
+    cl = None
+
+from .config import COMPONENT_KEYS, FIELD_KEYS
+from .reductions import finish
+
+# reduce_directions 中每个 work-item 求和的方向数
+DIR_CHUNK = 64
+
+
+def snap_steps(it_start, it_end, n_steps, snap_iterations):
+    """
+    按 kernel 中的规则给出每个快照写出时已经累加到的最后一步：
+    返回 [(iSnap, last_step), ...]，快照 iSnap 包含 0 <= it <= last_step 的步
+    """
+    snaps = []
+    iSnap = 0
+    while iSnap < len(snap_iterations) and it_start >= snap_iterations[iSnap]:
+        iSnap += 1
+
+    for iSnap in range(iSnap, len(snap_iterations)):
+        it = int(snap_iterations[iSnap]) - 2 - int(it_start)
+        if it < 0 or it > int(it_end) - 2:
+            break
+        snaps.append((iSnap, min(it, int(n_steps) - 2)))
+
+    return snaps
+
+
 class ParticleProcessor:
-    def __init__(self, config, opencl_env, kernel_program):
+    def __init__(self, config, opencl_env, kernel_program, omega_block=None, nodes_per_item=None):
         self.config = config
         self.env = opencl_env
         self.program = kernel_program
         self.dtype = config.get_dtype()
+        self.phase_dtype = config.get_phase_dtype()
         self.Args = config.get_args()
+        # 编译期的分块参数，必须与 program 编译时一致（自动调优时每个设备可以不同）
+        self.omega_block = int(omega_block or self.Args['omegaBlock'])
+        self.nodes_per_item = int(nodes_per_item or self.Args['nodesPerItem'] or 1)
+        if config.kernel_variant() != 'total':
+            self.nodes_per_item = 1  # 只有 total 有 omega 分块的版本（total_block）
         self.queue = self.env.get_queue()
+        self._kernels = {}
+        self._snap_cache = {}  # (nSteps, nSnaps) -> 设备上的 snap_iterations
+
+    def with_config(self, config):
+        """换一份（子网格）配置的处理器，kernel 对象、缓冲池与快照缓存共用"""
+        other = ParticleProcessor(config, self.env, self.program, self.omega_block, self.nodes_per_item)
+        other._kernels = self._kernels
+        other._snap_cache = self._snap_cache
+        return other
+
+    def _kernel(self, name):
+        # 每次取 kernel 都会新建对象，这里缓存复用；program 在进程内共享（调优时也会取），
+        # 用 cl.Kernel 而不是 program.<name>，避免 pyopencl 的重复获取警告
+        if name not in self._kernels:
+            self._kernels[name] = cl.Kernel(self.program, name)
+        return self._kernels[name]
+
+    def _launch(self, name, global_size, local_size, *args, work=0, wait_for=None):
+        # 启动 kernel；profiling 时记录事件与计算量（网格节点数 × 步数）
+        event = self._kernel(name)(self.queue, global_size, local_size, *args, wait_for=wait_for)
+        if self.env.profiler is not None:
+            self.env.profiler.event('kernel', event, name, work=work)
+        return event
 
     def track_to_device(self, particleTrack):
         if len(particleTrack) != 8:
@@ -15,34 +75,145 @@ class ParticleProcessor:
 
         x, y, z, ux, uy, uz, wp, it_start = particleTrack
 
+        # 写入缓冲池中按最长轨迹分配的数组，不再每条轨迹分配
         return [
-            self.env.to_device(x, self.dtype),
-            self.env.to_device(y, self.dtype),
-            self.env.to_device(z, self.dtype),
-            self.env.to_device(ux, self.dtype),
-            self.env.to_device(uy, self.dtype),
-            self.env.to_device(uz, self.dtype),
+            self.env.to_pooled('x', x, self.phase_dtype),
+            self.env.to_pooled('y', y, self.phase_dtype),
+            self.env.to_pooled('z', z, self.phase_dtype),
+            self.env.to_pooled('ux', ux, self.dtype),
+            self.env.to_pooled('uy', uy, self.dtype),
+            self.env.to_pooled('uz', uz, self.dtype),
             self.dtype(wp),
             np.uint32(it_start)
         ]
 
+    def track_snaps(self, n_steps, nSnaps):
+        """it_range 为 None 时一条长度为 n_steps 的轨迹的快照步，按 (n_steps, nSnaps) 缓存在设备上"""
+        key = (int(n_steps), int(nSnaps))
+        if key not in self._snap_cache:
+            if len(self._snap_cache) >= 4096:
+                self._snap_cache.clear()
+            snap_iterations = np.linspace(0, n_steps, nSnaps + 1, dtype=np.uint32)[1:]
+            self._snap_cache[key] = self.env.to_device(snap_iterations, np.uint32)
+        return self._snap_cache[key]
+
+    def release_buffers(self):
+        self._snap_cache.clear()
+        self.env.release_pool()
+
+    def tracks_to_device(self, particleTracks, weights, nSnaps, it_range=None):
+        """将一批长度不等的轨迹打包进连续缓冲区，附带每条轨迹的偏移/长度/权重/it_start"""
+        for track in particleTracks:
+            if len(track) != 8:
+                raise ValueError("Each particleTrack must have 8 elements")
+
+        steps = np.array([len(track[0]) for track in particleTracks], dtype=np.uint32)
+        offsets = np.zeros_like(steps)
+        offsets[1:] = np.cumsum(steps[:-1])
+
+        # -------- it_range 与 snap_iterations（与 process_track 一致）--------
+        if it_range is None:
+            it_start = np.zeros_like(steps)
+            it_end = steps.copy()
+            snap_iterations = np.ascontiguousarray(np.stack([
+                np.linspace(0, n, nSnaps + 1, dtype=np.uint32)[1:] for n in steps
+            ]))
+            snap_stride = np.uint32(nSnaps)
+        else:
+            it_start = np.array([track[7] for track in particleTracks], dtype=np.uint32)
+            it_end = np.full_like(steps, it_range[-1])
+            snap_iterations = None
+            snap_stride = np.uint32(0)
+
+        def pack():
+            return [np.concatenate([np.asarray(track[i], dtype=self.dtype) for track in particleTracks])
+                    for i in range(6)]
+
+        if self.env.profiler is None:
+            coords = pack()
+        else:
+            with self.env.profiler.timer('cast', 'batch_pack'):
+                coords = pack()
+
+        pooled = self.env.to_pooled
+        batch = {
+            'coords': [pooled(f'batch_coord{i}', coord, self.dtype) for i, coord in enumerate(coords)],
+            'offsets': pooled('batch_offsets', offsets, np.uint32),
+            'steps': pooled('batch_steps', steps, np.uint32),
+            'it_start': pooled('batch_it_start', it_start, np.uint32),
+            'it_end': pooled('batch_it_end', it_end, np.uint32),
+            'weights': pooled('batch_weights', weights, self.dtype),
+            'nTracks': np.uint32(len(particleTracks)),
+            'snap_stride': snap_stride,
+            'nSteps': int(np.clip(np.minimum(steps, it_end).astype(np.int64) - it_start, 0, None).sum()),
+        }
+        if snap_iterations is not None:
+            batch['snap_iterations'] = pooled('batch_snaps', snap_iterations, np.uint32)
+
+        return batch
+
+    def _grid_args(self, radiation_data):
+        # -------- 角/频率轴缓冲 + 网格尺寸 --------
+        if self.Args['mode'] == 'far':
+            args_axes = [
+                radiation_data['omega'].data,
+                radiation_data['sinTheta'].data,
+                radiation_data['cosTheta'].data,
+                radiation_data['sinPhi'].data,
+                radiation_data['cosPhi'].data
+            ]
+        else:
+            args_axes = [
+                radiation_data['omega'].data,
+                radiation_data['radius'].data,
+                radiation_data['sinPhi'].data,
+                radiation_data['cosPhi'].data,
+                self.phase_dtype(self.Args['L_screen'])
+            ]
+
+        nOmega, nTheta, nPhi = self.Args['gridNodeNums']
+        args_res = [np.uint32(nOmega), np.uint32(nTheta), np.uint32(nPhi)]
+
+        return args_axes + args_res
+
     def process_track(self, particleTrack, radiation_data,
-                    snap_iterations, nSnaps, it_range=None):
+                    snap_iterations, nSnaps, it_range=None, wait_for=None):
 
         x, y, z, ux, uy, uz, wp, it_start = particleTrack
 
         # -------- snap_iterations 与 it_range --------
+        # it_range 为 None 时按轨迹自身长度生成快照（已上传的可以直接传入）
         if it_range is None:
             it_start = np.uint32(0)
             it_range = (0, x.size)
-            snap_iterations = np.ascontiguousarray(
-                np.linspace(*it_range, nSnaps + 1, dtype=np.uint32)[1:]
-            )
-            snap_iterations = self.env.to_device(snap_iterations, np.uint32)
+            if snap_iterations is None:
+                snap_iterations = self.track_snaps(x.size, nSnaps)
+
+        if self.Args['decimationTolerance'] is not None:
+            return self._process_decimated(particleTrack, radiation_data, snap_iterations,
+                                           nSnaps, it_start, it_range[-1], wait_for)
+
+        if 'preparedTrack' in self.Args['Features']:
+            return self._process_prepared(particleTrack, radiation_data, snap_iterations,
+                                          nSnaps, it_start, it_range[-1], wait_for)
 
         # -------- 线程配置 --------
         Nn = self.Args['numGridNodes']
+        if 'phaseRecurrence' in self.Args['Features']:
+            # 每个 work-item 负责一个方向上连续 omegaBlock 个频率
+            nOmega = self.Args['gridNodeNums'][0]
+            nBlocks = -(-nOmega // self.omega_block)
+            Nn = Nn // nOmega * nBlocks
+        elif self.nodes_per_item > 1:
+            # total_block：每个 work-item 负责一个方向上连续 nodes_per_item 个频率
+            nOmega = self.Args['gridNodeNums'][0]
+            Nn = Nn // nOmega * -(-nOmega // self.nodes_per_item)
         WGS, WGS_tot = self.env.compute_wgs(Nn)
+        if 'directionMajor' in self.Args['Features']:
+            # 每个工作组负责一个方向上的 WGS 个频率，方向数 × 每个方向的频率块数个工作组
+            nOmega = self.Args['gridNodeNums'][0]
+            WGS = min(self.env.get_wgs(), nOmega)
+            WGS_tot = Nn // nOmega * -(-nOmega // WGS) * WGS
 
         # -------- 1-6 轨迹数组 --------
         args_track = [coord.data for coord in (x, y, z, ux, uy, uz)]
@@ -55,32 +226,284 @@ class ParticleProcessor:
             np.uint32(x.size)                  # nSteps
         ]
 
-        # -------- 11-15 角/频率轴缓冲 --------
-        args_axes = [
-            radiation_data['omega'].data,
-            radiation_data['sinTheta'].data,
-            radiation_data['cosTheta'].data,
-            radiation_data['sinPhi'].data,
-            radiation_data['cosPhi'].data
+        # -------- 11-18 角/频率轴缓冲与网格尺寸 --------
+        args_grid = self._grid_args(radiation_data)
+
+        # -------- 19-21 其他 --------
+        args_aux = [
+            self.phase_dtype(self.Args['timeStep']),  # dt
+            np.uint32(nSnaps),                        # nSnaps
+            snap_iterations.data                      # itSnaps
         ]
 
-        # -------- 16-18 网格尺寸 --------
+        # -------- 合并并调用 --------
+        args = args_track + args_grid + args_aux
+
+        kernel_name = 'total'
+        spectra = [radiation_data['radiation']['total'].data]
+        if self.Args['coherent']:
+            # total 与带权重和形状因子的复场在同一个 kernel 中累加；22 形状因子
+            kernel_name = 'total_coherent'
+            spectra += [radiation_data['radiation'][key].data for key in FIELD_KEYS]
+            args += [radiation_data['FormFactor'].data]
+        elif self.Args['dtype'] == 'mixed':
+            # 相位用 double，振幅与 Kahan 补偿的累加用 float
+            kernel_name = 'total_mixed'
+        elif self.Args['components'] is not None:
+            # total 与三个分量在同一个 kernel 中计算
+            kernel_name = 'total_comps'
+            spectra += [radiation_data['radiation'][key].data
+                        for key in COMPONENT_KEYS[self.Args['components']]]
+            if self.Args['mode'] == 'far':
+                args += [np.uint32(self.Args['components'] == 'spheric')]
+            if 'localTiling' in self.Args['Features']:
+                # 23-24 轨迹分块的 local memory，同 total_tiled
+                kernel_name = 'total_comps_tiled'
+                vec_bytes = 4 * np.dtype(self.dtype).itemsize
+                args += [self.env.local_memory(WGS * vec_bytes),
+                         self.env.local_memory((WGS + 1) * vec_bytes)]
+        elif 'phaseRecurrence' in self.Args['Features']:
+            # 22 线性频率网格的步长（与 omega 一样乘 2π）
+            kernel_name = 'total_recurrence'
+            args += [self.dtype(2 * np.pi * self.Args['dOmega'])]
+        elif self.nodes_per_item > 1:
+            kernel_name = 'total_block'
+        elif 'localTiling' in self.Args['Features']:
+            # 22-23 轨迹分块的 local memory：位置 WGS 个，速度 WGS+1 个
+            kernel_name = 'total_tiled'
+            vec_bytes = 4 * np.dtype(self.dtype).itemsize
+            args += [self.env.local_memory(WGS * vec_bytes),
+                     self.env.local_memory((WGS + 1) * vec_bytes)]
+        elif 'directionMajor' in self.Args['Features']:
+            # 22-23 每一块步的推迟时间与振幅（各 WGS 个）
+            kernel_name = 'total_direction'
+            itemsize = np.dtype(self.dtype).itemsize
+            args += [self.env.local_memory(WGS * itemsize),
+                     self.env.local_memory(WGS * 4 * itemsize)]
+
+        n_acc = max(min(int(it_range[-1]), x.size) - int(it_start), 0)
+        return self._launch(
+            kernel_name,
+            (WGS_tot,), (WGS,),
+            *spectra,
+            *args,
+            work=self.Args['numGridNodes'] * n_acc,
+            wait_for=wait_for
+        )
+
+    def reduce_spectrum(self, radiation_data, key, names):
+        """
+        在设备上对 radiation_data['radiation'][key] 做 Args['reductions']，只回传归约后的数组；
+        返回 reductions.finish 的结果（主机数组）
+        """
+        spectrum = radiation_data['radiation'][key]
+        nSnaps = spectrum.shape[0]
+        nOmega = self.Args['gridNodeNums'][0]
+        nPhi, nTheta = spectrum.shape[1:3]
+        nDirs = nPhi * nTheta
+
+        dI = angular = peak = None
+        if 'spectrum' in names:
+            # 每个 work-item 对 DIR_CHUNK 个方向求和，各块的部分和在主机上相加
+            n_chunks = -(-nDirs // DIR_CHUNK)
+            partial = self.env.pooled('reduce_spectrum', nSnaps * n_chunks * nOmega, self.dtype)
+            WGS, WGS_tot = self.env.compute_wgs(partial.size)
+            self._launch('reduce_directions', (WGS_tot,), (WGS,), spectrum.data,
+                         radiation_data['dirWeights'].data, partial.data, np.uint32(nOmega),
+                         np.uint32(nDirs), np.uint32(DIR_CHUNK), np.uint32(n_chunks), np.uint32(nSnaps))
+            dI = self._fetch(partial, f'{key}_spectrum').reshape(nSnaps, n_chunks, nOmega) \
+                .sum(axis=1, dtype=np.double)
+
+        if {'angular', 'energy', 'peak'} & set(names):
+            n = nSnaps * nDirs
+            buffers = (self.env.pooled('reduce_angular', n, self.dtype),
+                       self.env.pooled('reduce_peak_value', n, self.dtype),
+                       self.env.pooled('reduce_peak_index', n, np.uint32))
+            WGS, WGS_tot = self.env.compute_wgs(n)
+            self._launch('reduce_omega', (WGS_tot,), (WGS,), spectrum.data,
+                         radiation_data['omegaWeights'].data, *(buf.data for buf in buffers),
+                         np.uint32(nOmega), np.uint32(nDirs), np.uint32(nSnaps))
+            shape = (nSnaps, nPhi, nTheta)
+            if {'angular', 'energy'} & set(names):
+                angular = self._fetch(buffers[0], f'{key}_angular').reshape(shape)
+            if 'peak' in names:
+                peak = tuple(self._fetch(buf, f'{key}_peak').reshape(shape) for buf in buffers[1:])
+
+        return finish(names, self.Args, dI, angular, peak)
+
+    def _fetch(self, array, name):
+        host = np.empty(array.shape, dtype=array.dtype)
+        event = cl.enqueue_copy(self.queue, host, array.data)
+        if self.env.profiler is not None:
+            self.env.profiler.event('fetch', event, name, nbytes=host.nbytes)
+        return host
+
+    def prepare_track(self, particleTrack, it_start, wait_for=None):
+        """
+        每条轨迹一次：在设备上计算 total_prepared 使用的逐（子）步数组
+            xt       (x, y, z, t)
+            betaMid  子步中点的速度 β
+            betaDot  加速度 dβ/dt
+        trackSmoothing 次 [1 2 1]/4 平滑作用于 β；trackUpsample 把每步细分为子步，
+        步内用三次 Hermite 插值：x 以 β 为斜率，β 以中心差分为斜率（轨迹两端用单侧差分）。
+        返回 (xt, betaMid, betaDot, event)，数组为缓冲池中的 4 分量向量（w 分量为时间或 0）
+        """
+        x, y, z, ux, uy, uz = particleTrack[:6]
+        n = x.size
+        upsample = int(self.Args['trackUpsample'])
+        n_sub = max(n - 1, 0) * upsample
+        dtype = self.dtype
+
+        W, W_tot = self.env.compute_wgs(max(n, 1))
+        keys = ('prep_beta', 'prep_beta_smooth')  # 平滑时两个缓冲交替读写
+        beta = self.env.pooled(keys[0], 4 * n, dtype)
+        event = self._launch('track_beta', (W_tot,), (W,), ux.data, uy.data, uz.data,
+                             beta.data, np.uint32(n), wait_for=wait_for)
+        for i in range(int(self.Args['trackSmoothing'])):
+            smoothed = self.env.pooled(keys[(i + 1) % 2], 4 * n, dtype)
+            event = self._launch('smooth_beta', (W_tot,), (W,), beta.data, smoothed.data, np.uint32(n))
+            beta = smoothed
+
+        xt, beta_mid, beta_dot = (self.env.pooled(key, 4 * n_sub, dtype)
+                                  for key in ('prep_xt', 'prep_beta_mid', 'prep_beta_dot'))
+        if n_sub:
+            W, W_tot = self.env.compute_wgs(n_sub)
+            event = self._launch('prepare_track', (W_tot,), (W,), x.data, y.data, z.data, beta.data,
+                                 xt.data, beta_mid.data, beta_dot.data, np.uint32(it_start),
+                                 np.uint32(n), np.uint32(upsample), dtype(self.Args['timeStep']))
+        return xt, beta_mid, beta_dot, event
+
+    def _process_prepared(self, particleTrack, radiation_data, snap_iterations,
+                          nSnaps, it_start, it_end, wait_for):
+        # 与轨迹相关、与网格节点无关的量先算好，total_prepared 只做相位与累加
+        # 同一个按序队列，total_prepared 在预处理的 kernel 之后执行
+        xt, beta_mid, beta_dot, _ = self.prepare_track(particleTrack, it_start, wait_for)
+        upsample = int(self.Args['trackUpsample'])
+        n = particleTrack[0].size
+        WGS, WGS_tot = self.env.compute_wgs(self.Args['numGridNodes'])
+
+        return self._launch(
+            'total_prepared', (WGS_tot,), (WGS,),
+            radiation_data['radiation']['total'].data,
+            xt.data, beta_mid.data, beta_dot.data,
+            self.dtype(particleTrack[6]), np.uint32(it_start), np.uint32(it_end), np.uint32(n),
+            *self._grid_args(radiation_data),
+            self.dtype(self.Args['timeStep'] / upsample), np.uint32(nSnaps), snap_iterations.data,
+            np.uint32(upsample),
+            work=self.Args['numGridNodes'] * max(min(int(it_end), n) - int(it_start), 0) * upsample
+        )
+
+    def _decimation_levels(self, particleTrack, radiation_data, it_start, wait_for):
+        """
+        在设备上逐层构建 2, 4, 8, ... 倍抽取的轨迹，并求出每层相邻步推迟时间的最大变化；
+        一旦最低频率在某层上的每步相位已超过容差，更粗的层也不可能被使用，停止构建
+        """
+        tolerance = self.Args['decimationTolerance']
+        omega_min = 2 * np.pi * np.abs(self.Args['omega']).min()
+        n_dirs = self.Args['gridNodeNums'][1] * self.Args['gridNodeNums'][2]
+        WGS, WGS_tot = self.env.compute_wgs(n_dirs)
+        dt = self.dtype(self.Args['timeStep'])
+        axes = self._grid_args(radiation_data)[1:5]
+        bound = self.env.pooled('dec_bound', n_dirs, self.dtype)
+
+        levels = [(1, particleTrack[:6], np.inf)]
+        coarse = particleTrack[:6]
+        for level in range(1, self.Args['decimationLevels'] + 1):
+            n_out = (coarse[0].size + 1) // 2
+            if n_out < 2:
+                break
+
+            stride = 2 ** level
+            out = [self.env.pooled(f'dec{level}_{name}', n_out, self.dtype)
+                   for name in ('x', 'y', 'z', 'ux', 'uy', 'uz')]
+            W, W_tot = self.env.compute_wgs(n_out)
+            self._launch('decimate', (W_tot,), (W,),
+                         *[a.data for a in coarse], *[a.data for a in out],
+                         np.uint32(n_out), wait_for=wait_for)
+
+            self._launch(
+                'phase_step_bound', (WGS_tot,), (WGS,), bound.data,
+                out[0].data, out[1].data, out[2].data,
+                np.uint32(n_out), np.uint32(stride), np.uint32(it_start), dt,
+                *axes, np.uint32(self.Args['gridNodeNums'][1]), np.uint32(self.Args['gridNodeNums'][2]))
+            max_step = float(bound.get().max())
+
+            if omega_min * max_step > tolerance:
+                break
+            levels.append((stride, out, max_step))
+            coarse = out
+
+        return levels
+
+    def _process_decimated(self, particleTrack, radiation_data, snap_iterations,
+                           nSnaps, it_start, it_end, wait_for):
+        # 每个 omega 选择每步相位不超过容差的最粗一层，连续的同层 omega 合成一个频段
+        levels = self._decimation_levels(particleTrack, radiation_data, it_start, wait_for)
+        omega = 2 * np.pi * np.abs(self.Args['omega'].astype(np.double))
+        tolerance = self.Args['decimationTolerance']
+
+        choice = np.zeros(omega.size, dtype=np.int64)
+        for i, (_, _, max_step) in enumerate(levels[1:], start=1):
+            choice[omega * max_step <= tolerance] = i
+
         nOmega, nTheta, nPhi = self.Args['gridNodeNums']
-        args_res = [np.uint32(nOmega), np.uint32(nTheta), np.uint32(nPhi)]
+        fine = [coord.data for coord in particleTrack[:6]]
+        args_scalars = [self.dtype(particleTrack[6]), np.uint32(it_start), np.uint32(it_end),
+                        np.uint32(particleTrack[0].size)]
+        args_grid = self._grid_args(radiation_data)
+        args_aux = [self.dtype(self.Args['timeStep']), np.uint32(nSnaps), snap_iterations.data]
+
+        bounds = np.flatnonzero(np.diff(choice)) + 1
+        event = None
+        for start, stop in zip(np.r_[0, bounds], np.r_[bounds, omega.size]):
+            stride, coarse, _ = levels[choice[start]]
+            WGS, WGS_tot = self.env.compute_wgs(int(stop - start) * nTheta * nPhi)
+            event = self._launch(
+                'total_band', (WGS_tot,), (WGS,),
+                radiation_data['radiation']['total'].data,
+                *[coord.data for coord in coarse], *fine,
+                *args_scalars, *args_grid, *args_aux,
+                np.uint32(start), np.uint32(stop - start), np.uint32(stride),
+                work=int(stop - start) * nTheta * nPhi * (max(int(it_end) - int(it_start), 0) // stride),
+                wait_for=wait_for
+            )
+        return event
+
+    def process_batch(self, batch, radiation_data, snap_iterations, nSnaps):
+        # -------- 线程配置 --------
+        Nn = self.Args['numGridNodes']
+        WGS, WGS_tot = self.env.compute_wgs(Nn)
+
+        # -------- 打包的轨迹与每条轨迹的索引 --------
+        args_track = [coord.data for coord in batch['coords']]
+        args_track += [
+            batch['offsets'].data,
+            batch['steps'].data,
+            batch['it_start'].data,
+            batch['it_end'].data,
+            batch['weights'].data,
+            batch['nTracks']
+        ]
+
+        args_grid = self._grid_args(radiation_data)
+
+        # snap_stride = 0 时所有轨迹共享同一个 itSnaps
+        if batch['snap_stride'] > 0:
+            snap_iterations = batch['snap_iterations']
 
-        # -------- 19-21 其他 --------
         args_aux = [
-            self.dtype(self.Args['timeStep']),  # dt
-            np.uint32(nSnaps),                  # nSnaps
-            snap_iterations.data                # itSnaps
+            self.dtype(self.Args['timeStep']),
+            np.uint32(nSnaps),
+            snap_iterations.data,
+            batch['snap_stride']
         ]
 
-        # -------- 合并并调用 --------
-        args = args_track + args_axes + args_res + args_aux
+        args = args_track + args_grid + args_aux
 
-        self.program.total(
-            self.queue,
+        return self._launch(
+            'total_batch',
             (WGS_tot,), (WGS,),
             radiation_data['radiation']['total'].data,
-            *args
+            *args,
+            work=Nn * batch['nSteps']
         )
@@ -0,0 +1,139 @@
+"""Double-buffered asynchronous host-to-device track upload."""
+
+import time
+
+import numpy as np
+
+try:
+    import pyopencl as cl
+    import pyopencl.array as arrcl
+except ImportError:
+    cl = None
+
+
+class _Slot:
+    """一组暂存缓冲：pinned 主机内存 + 设备数组，以及最后使用它的 kernel 事件"""
+
+    def __init__(self):
+        self.capacity = 0
+        self.host = []
+        self.device = []
+        self.snaps_host = None
+        self.snaps_device = None
+        self.event = None
+        self.buffers = []
+        self.mapped = []  # 映射出来的主机数组，重新分配或释放前需要 unmap
+
+
+class TrackPipeline:
+    """
+    轨迹上传流水线：depth 个暂存槽轮流使用，主机端类型转换写进 pinned 缓冲，
+    再在独立的传输队列上非阻塞拷贝到设备，kernel 通过 wait_for 等待拷贝完成，
+    这样第 i+1 条轨迹的转换与上传可以和第 i 条轨迹的 kernel 重叠。
+    每个 DeviceWorker 保留一个流水线，暂存缓冲在多次 process 之间复用，release_buffers 时释放
+    """
+
+    def __init__(self, env, dtype, depth=2):
+        self.env = env
+        self.dtype = dtype
+        self.ctx = env.get_context()
+        self.queue = env.get_queue()
+        self.transfer_queue = env.new_queue()
+        self.slots = [_Slot() for _ in range(max(int(depth), 2))]
+        self._next = 0
+
+    def _pinned(self, slot, n, dtype):
+        flags = cl.mem_flags.READ_ONLY | cl.mem_flags.ALLOC_HOST_PTR
+        buf = cl.Buffer(self.ctx, flags, max(n, 1) * np.dtype(dtype).itemsize)
+        host, _ = cl.enqueue_map_buffer(self.transfer_queue, buf, cl.map_flags.WRITE,
+                                        0, (max(n, 1),), dtype)
+        slot.buffers.append(buf)
+        slot.mapped.append(host)
+        return host
+
+    def _unmap(self, slot):
+        for host in slot.mapped:
+            host.base.release(self.transfer_queue)
+        self.transfer_queue.finish()
+        slot.mapped = []
+        slot.buffers = []
+
+    def _reserve(self, slot, n, n_snaps):
+        if n > slot.capacity:
+            # 按 2 倍增长，避免长度略有变化时反复分配
+            capacity = max(n, 2 * slot.capacity)
+            self._unmap(slot)
+            slot.snaps_host = None
+            slot.host = [self._pinned(slot, capacity, self.dtype) for _ in range(6)]
+            slot.device = [arrcl.empty(self.queue, (capacity,), self.dtype) for _ in range(6)]
+            slot.capacity = capacity
+
+        if n_snaps and (slot.snaps_host is None or slot.snaps_host.size < n_snaps):
+            slot.snaps_host = self._pinned(slot, n_snaps, np.uint32)
+            slot.snaps_device = arrcl.empty(self.queue, (n_snaps,), np.uint32)
+
+    def upload(self, particleTrack, wp, snap_iterations=None):
+        """
+        把轨迹写进下一个暂存槽并异步上传，返回 (slot, device_track, snaps, events)；
+        kernel 需要 wait_for=events，并在启动后调用 release(slot, kernel_event)
+        """
+        if len(particleTrack) != 8:
+            raise ValueError("Each particleTrack must have 8 elements")
+
+        slot = self.slots[self._next]
+        self._next = (self._next + 1) % len(self.slots)
+
+        # 上一次使用这个槽的 kernel 结束后才能覆盖它的缓冲
+        if slot.event is not None:
+            slot.event.wait()
+            slot.event = None
+
+        n = len(particleTrack[0])
+        n_snaps = 0 if snap_iterations is None else len(snap_iterations)
+        self._reserve(slot, n, n_snaps)
+
+        profiler = self.env.profiler
+        t0 = time.perf_counter()
+        events = []
+        for host, device, coord in zip(slot.host, slot.device, particleTrack[:6]):
+            host[:n] = coord
+            events.append(cl.enqueue_copy(self.transfer_queue, device.data, host[:n],
+                                          is_blocking=False))
+
+        snaps = None
+        if n_snaps:
+            slot.snaps_host[:n_snaps] = snap_iterations
+            events.append(cl.enqueue_copy(self.transfer_queue, slot.snaps_device.data,
+                                          slot.snaps_host[:n_snaps], is_blocking=False))
+            snaps = slot.snaps_device[:n_snaps]
+
+        self.transfer_queue.flush()
+        if profiler is not None:
+            # 写入 pinned 缓冲的类型转换（含入队）在主机上计时，拷贝用事件的设备时间
+            profiler.add('cast', time.perf_counter() - t0, name='pinned_cast')
+            sizes = [n * np.dtype(self.dtype).itemsize] * 6 + [n_snaps * 4]
+            for event, nbytes in zip(events, sizes):
+                profiler.event('upload', event, 'pinned_upload', nbytes=nbytes)
+
+        device_track = [device[:n] for device in slot.device]
+        device_track += [self.dtype(wp), np.uint32(particleTrack[7])]
+        return slot, device_track, snaps, events
+
+    def release(self, slot, event):
+        slot.event = event
+
+    def finish(self):
+        for slot in self.slots:
+            if slot.event is not None:
+                slot.event.wait()
+                slot.event = None
+        self.transfer_queue.finish()
+
+    def release_buffers(self):
+        """等待所有 kernel 结束，unmap 并释放各槽的 pinned 与设备缓冲"""
+        self.finish()
+        for slot in self.slots:
+            self._unmap(slot)
+            slot.host, slot.device = [], []
+            slot.snaps_host = slot.snaps_device = None
+            slot.capacity = 0
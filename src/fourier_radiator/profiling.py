@@ -0,0 +1,179 @@
+"""Opt-in per-stage timings (host cast, upload, kernel, fetch, MPI reduce) and trace export."""
+
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import pyopencl as cl
+except ImportError:
+    cl = None
+
+# 阶段名；cast 与 reduce 在主机上计时，upload / kernel / fetch 优先用 OpenCL 事件的设备时间
+STAGES = ('cast', 'upload', 'kernel', 'fetch', 'reduce')
+TRANSFER_STAGES = ('cast', 'upload', 'fetch', 'reduce')
+
+
+class Profiler:
+    """
+    收集一次 calculate_spectrum 的计时记录，每条记录为
+        (stage, name, device, start, seconds, nbytes, work)
+    start 为相对 Profiler 创建时刻的主机时间（秒）。
+    OpenCL 事件先保存，report() 时（或积压过多时）才读取 profile 信息，不在热路径上同步；
+    设备时钟与主机时钟的偏移按每个设备第一条事件的入队时刻估计。多个设备线程可以同时记录
+    """
+
+    _MAX_PENDING = 4096
+
+    def __init__(self):
+        self.t0 = time.perf_counter()
+        self.records = []
+        self._pending = []   # (stage, name, device, event, nbytes, work, 入队时的主机时间)
+        self._offsets = {}   # device -> 设备时钟（秒）到主机时间的偏移
+        self._lock = threading.Lock()
+        self.wall = None
+
+    def _now(self):
+        return time.perf_counter() - self.t0
+
+    def add(self, stage, seconds, start=None, name=None, device='host', nbytes=0, work=0):
+        if start is None:
+            start = self._now() - seconds
+        with self._lock:
+            self.records.append((stage, name or stage, device, start, seconds, int(nbytes), int(work)))
+
+    @contextmanager
+    def timer(self, stage, name=None, device='host', nbytes=0, work=0):
+        """主机端计时：with profiler.timer('cast', nbytes=...): ..."""
+        start = self._now()
+        try:
+            yield
+        finally:
+            self.add(stage, self._now() - start, start, name, device, nbytes, work)
+
+    def event(self, stage, event, name=None, device=None, nbytes=0, work=0):
+        """记录一个 OpenCL 事件（队列需要开启 PROFILING_ENABLE）"""
+        if event is None:
+            return
+        if device is None:
+            device = event.command_queue.device.name.strip()
+        with self._lock:
+            self._pending.append((stage, name or stage, device, event, int(nbytes), int(work), self._now()))
+            flush = len(self._pending) >= self._MAX_PENDING
+        if flush:
+            self._resolve(len(self._pending) // 2)
+
+    def _resolve(self, n=None):
+        # 读取前 n 条（默认全部）待处理事件的设备时间；较早的事件通常早已完成，等待代价很小
+        with self._lock:
+            n = len(self._pending) if n is None else n
+            pending, self._pending = self._pending[:n], self._pending[n:]
+
+        records = []
+        for stage, name, device, event, nbytes, work, t_host in pending:
+            event.wait()
+            try:
+                queued, start, end = event.profile.queued, event.profile.start, event.profile.end
+            except cl.RuntimeError:
+                # 队列没有开启 profiling：只能记下入队时刻
+                records.append((stage, name, device, t_host, 0., nbytes, work))
+                continue
+            offset = self._offsets.setdefault(device, t_host - queued * 1e-9)
+            records.append((stage, name, device, offset + start * 1e-9, (end - start) * 1e-9, nbytes, work))
+
+        with self._lock:
+            self.records.extend(records)
+
+    def stop(self):
+        self._resolve()
+        self.wall = self._now()
+
+    def report(self, rank=0):
+        if self.wall is None:
+            self.stop()
+        return ProfileReport(sorted(self.records, key=lambda r: r[3]), self.wall, rank)
+
+
+class ProfileReport:
+    """
+    一次计算的计时汇总：
+        stages    {stage: {'count', 'seconds', 'bytes', 'bandwidth'}}，bandwidth 单位 B/s
+        kernel_throughput  kernel 时间内的网格节点·步数每秒
+        launches  kernel 启动次数，mean_kernel 为平均每次的时长
+        fractions {'transfer', 'compute', 'launch'} 占（按设备数平均的）墙钟时间的比例，
+                  launch 为设备既不计算也不传输的空闲时间（启动开销、主机端调度）
+        bound     三者中最大的一项
+    records 为原始记录，export_trace() 写出 Chrome trace（chrome://tracing 或 Perfetto）
+    """
+
+    def __init__(self, records, wall, rank=0):
+        self.records = records
+        self.wall = wall
+        self.rank = rank
+        self.devices = sorted({r[2] for r in records if r[0] in ('upload', 'kernel', 'fetch')}) or ['host']
+
+        self.stages = {}
+        for stage in STAGES:
+            rows = [r for r in records if r[0] == stage]
+            seconds = sum(r[4] for r in rows)
+            nbytes = sum(r[5] for r in rows)
+            self.stages[stage] = {
+                'count': len(rows), 'seconds': seconds, 'bytes': nbytes,
+                'bandwidth': nbytes / seconds if seconds > 0 and nbytes else None,
+            }
+
+        kernel = self.stages['kernel']
+        work = sum(r[6] for r in records if r[0] == 'kernel')
+        self.node_steps = work
+        self.launches = kernel['count']
+        self.mean_kernel = kernel['seconds'] / kernel['count'] if kernel['count'] else None
+        self.kernel_throughput = work / kernel['seconds'] if kernel['seconds'] > 0 else None
+
+        # 各设备并行工作，按设备数折算到一个设备的时间线上
+        n_dev = len(self.devices)
+        compute = kernel['seconds'] / n_dev
+        transfer = sum(self.stages[s]['seconds'] for s in ('upload', 'fetch')) / n_dev \
+            + self.stages['cast']['seconds'] + self.stages['reduce']['seconds']
+        launch = max(wall - compute - transfer, 0.)
+        total = max(wall, compute + transfer, 1e-300)
+        self.fractions = {'transfer': transfer / total, 'compute': compute / total, 'launch': launch / total}
+        self.bound = max(self.fractions, key=self.fractions.get)
+
+    def to_dict(self):
+        return {
+            'rank': self.rank, 'wall': self.wall, 'devices': self.devices, 'stages': self.stages,
+            'node_steps': self.node_steps, 'kernel_throughput': self.kernel_throughput,
+            'launches': self.launches, 'mean_kernel': self.mean_kernel,
+            'fractions': self.fractions, 'bound': self.bound,
+        }
+
+    def summary(self):
+        lines = [f"[Profile] rank {self.rank}: {self.wall:.3f} s wall, {self.bound}-bound "
+                 + ', '.join(f"{k} {v:.0%}" for k, v in self.fractions.items())]
+        for stage, s in self.stages.items():
+            if not s['count']:
+                continue
+            line = f"  {stage:>6}: {s['count']:7d} x, {s['seconds']:9.4f} s"
+            if s['bandwidth'] is not None:
+                line += f", {s['bytes'] / 2**20:10.2f} MiB, {s['bandwidth'] / 2**30:7.2f} GiB/s"
+            lines.append(line)
+        if self.kernel_throughput is not None:
+            lines.append(f"  kernel: {self.kernel_throughput:.3e} node-steps/s, "
+                         f"{self.mean_kernel * 1e6:.1f} us per launch")
+        return '\n'.join(lines)
+
+    def export_trace(self, path):
+        """Chrome trace 格式（JSON），pid 为 rank，每个 (设备, 阶段) 一行"""
+        lanes = {}
+        events = []
+        for stage, name, device, start, seconds, nbytes, work in self.records:
+            tid = lanes.setdefault((device, stage), len(lanes))
+            events.append({'name': name, 'cat': stage, 'ph': 'X', 'pid': self.rank, 'tid': tid,
+                           'ts': start * 1e6, 'dur': seconds * 1e6,
+                           'args': {'bytes': nbytes, 'node_steps': work}})
+        for (device, stage), tid in lanes.items():
+            events.append({'name': 'thread_name', 'ph': 'M', 'pid': self.rank, 'tid': tid,
+                           'args': {'name': f'{device} / {stage}'}})
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
@@ -0,0 +1,100 @@
+"""Spectral reductions (dI/dω, angular distribution, energy, peak) and how partial results combine."""
+
+import numpy as np
+
+from .config import GRID_AXES
+
+# 对粒子线性的积分：各设备、各 rank、多次 accumulate 的结果直接相加
+LINEAR = ('spectrum', 'angular', 'energy')
+
+
+def direction_weights(Args):
+    """设备上方向的顺序 (iPhi, iTheta) 对应的求积权重 (nPhi, nTheta)"""
+    return np.outer(Args['phiWeights'], Args['polarWeights'])
+
+
+def finish(names, Args, spectrum=None, angular=None, peak=None):
+    """
+    由设备端的部分结果得到 Data['reduced'][key]：
+        spectrum  (nSnaps, nOmega)          对方向积分的 dI/dω
+        angular   (nSnaps, nTheta, nPhi)    对 ω 积分的角分布（设备顺序 (nSnaps, nPhi, nTheta) 传入）
+        energy    (nSnaps,)                 总能量
+        peak, peak_index  (nSnaps,), (nSnaps, 3)  最大值及其 (iOmega, iTheta, iPhi)
+    peak 传入 (每个方向的最大值, 所在的 iOmega)，形状 (nSnaps, nPhi, nTheta)
+    """
+    out = {}
+    if 'spectrum' in names:
+        out['spectrum'] = np.asarray(spectrum, dtype=np.double)
+    if 'angular' in names:
+        out['angular'] = np.ascontiguousarray(angular.transpose(0, 2, 1), dtype=np.double)
+    if 'energy' in names:
+        out['energy'] = np.einsum('spt,pt->s', angular, direction_weights(Args))
+    if 'peak' in names:
+        value, index = peak
+        nSnaps, nPhi, nTheta = value.shape
+        best = value.reshape(nSnaps, -1).argmax(axis=1)
+        iPhi, iTheta = np.divmod(best, nTheta)
+        iOmega = index.reshape(nSnaps, -1)[np.arange(nSnaps), best]
+        out['peak'] = value.reshape(nSnaps, -1)[np.arange(nSnaps), best].astype(np.double)
+        out['peak_index'] = np.stack([iOmega, iTheta, iPhi], axis=1).astype(np.int64)
+    return out
+
+
+def host_reduce(spectrum, Args, names, layout='device'):
+    """
+    主机端（NumPy/NUFFT 后端、相干谱、多设备或多 rank 求和后的峰值）的同一组归约；
+    spectrum 为 layout 布局的 4 维数组
+    """
+    if layout == 'grid':
+        spectrum = spectrum.swapaxes(-1, -3)  # 视图，回到 (nSnaps, nPhi, nTheta, nOmega)
+    angular = peak = None
+    if {'angular', 'energy'} & set(names):
+        angular = np.einsum('spto,o->spt', spectrum, Args['omegaWeights'])
+    if 'peak' in names:
+        peak = (spectrum.max(axis=-1), spectrum.argmax(axis=-1))
+    dI = None
+    if 'spectrum' in names:
+        dI = np.einsum('spto,pt->so', spectrum, direction_weights(Args))
+    return finish(names, Args, dI, angular, peak)
+
+
+def add(total, part):
+    """把另一组粒子（设备、rank、上一次计算）的结果加到 total 上；峰值不可加，删去"""
+    for key, reduced in part.items():
+        target = total.setdefault(key, {})
+        for name in LINEAR:
+            if name in reduced:
+                target[name] = target[name] + reduced[name] if name in target else reduced[name]
+    for reduced in total.values():
+        reduced.pop('peak', None)
+        reduced.pop('peak_index', None)
+    return total
+
+
+def join(parts, axis, bounds):
+    """
+    网格沿 axis 分段（网格分解、网格分块）时各段的结果 parts[i] 对应节点 bounds[i] = (start, stop)：
+    沿该轴的分布拼接，其余积分相加，峰值取最大并把下标换算到整个网格
+    """
+    index = GRID_AXES[axis]
+    joined = {}
+    for key in parts[0]:
+        reduced = [part[key] for part in parts]
+        out = joined[key] = {}
+        if 'spectrum' in reduced[0]:
+            arrays = [r['spectrum'] for r in reduced]
+            out['spectrum'] = np.concatenate(arrays, axis=1) if index == 0 else sum(arrays)
+        if 'angular' in reduced[0]:
+            arrays = [r['angular'] for r in reduced]
+            out['angular'] = sum(arrays) if index == 0 else np.concatenate(arrays, axis=index)
+        if 'energy' in reduced[0]:
+            out['energy'] = sum(r['energy'] for r in reduced)
+        if 'peak' in reduced[0]:
+            values = np.stack([r['peak'] for r in reduced])
+            best = values.argmax(axis=0)
+            snaps = np.arange(values.shape[1])
+            out['peak'] = values[best, snaps]
+            peak_index = np.stack([r['peak_index'] for r in reduced])[best, snaps]
+            peak_index[:, index] += np.asarray([start for start, _ in bounds])[best]
+            out['peak_index'] = peak_index
+    return joined
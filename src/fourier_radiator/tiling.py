@@ -0,0 +1,133 @@
+"""Out-of-core grid tiling: device-sized grid chunks with asynchronous read-back."""
+
+from pathlib import Path
+
+import numpy as np
+
+try:
+    import pyopencl as cl
+except ImportError:
+    cl = None
+
+from . import reductions
+from .config import GRID_AXES
+
+
+def plan_tiles(config, env, nSnaps, track_bytes=0):
+    """
+    根据设备的 global_mem_size / max_mem_alloc_size 决定网格分块：
+    返回 (axis, [(start, stop), ...])，整个网格放得下（且没有指定 gridTiles）时返回 None。
+    沿节点最多的轴分块；同时存在两块谱（一块计算、一块回传），所以每块只用一半预算
+    """
+    Args = config.get_args()
+    itemsize = np.dtype(config.get_dtype()).itemsize
+    n_keys = len(config.radiation_keys())
+    node_bytes = int(nSnaps) * itemsize
+
+    device = env.get_context().devices[0]
+    budget = Args['deviceMemoryFraction'] * device.global_mem_size - track_bytes
+    fit_nodes = min(budget // (node_bytes * n_keys), device.max_mem_alloc_size // node_bytes)
+    if Args['gridTiles'] is None and Args['numGridNodes'] <= fit_nodes:
+        return None
+
+    names = ('omega', 'theta', 'phi') if Args['mode'] == 'far' else ('omega', 'radius', 'phi')
+    axis = max(names, key=lambda name: Args['gridNodeNums'][GRID_AXES[name]])
+    n_axis = Args['gridNodeNums'][GRID_AXES[axis]]
+    slab = Args['numGridNodes'] // n_axis  # 该轴上一个节点对应的网格节点数
+
+    n_tiles = Args['gridTiles']
+    if n_tiles is None:
+        per_tile = min(budget // (2 * node_bytes * n_keys), device.max_mem_alloc_size // node_bytes) // slab
+        if per_tile < 1:
+            raise MemoryError(f"A single '{axis}' slice of the grid ({slab * node_bytes * n_keys} bytes) "
+                              "does not fit in device memory")
+        n_tiles = -(-n_axis // int(per_tile))
+
+    return axis, config.split_grid(axis, min(int(n_tiles), n_axis))
+
+
+class TiledSpectrum:
+    """
+    逐块计算谱：每块网格建一个子配置（RadiationConfig.restrict_grid）和对应的 DeviceWorker，
+    对全部轨迹累加后在独立的传输队列上非阻塞拷回主机；
+    拷贝与下一块的 kernel 重叠，主机在下一块计算时把上一块写入结果（内存或磁盘上的 .npy）
+    """
+
+    def __init__(self, config, env, make_worker, axis, bounds, nSnaps, out_dir=None, out=None):
+        self.config = config
+        self.env = env
+        self.make_worker = make_worker
+        self.axis = axis
+        self.bounds = bounds
+        self.copy_queue = env.new_queue()
+
+        Args = config.get_args()
+        self.grid_layout = Args['fetchLayout'] == 'grid'
+        nodes = tuple(Args['gridNodeNums'])
+        shape = (int(nSnaps),) + (nodes if self.grid_layout else nodes[::-1])
+        dtype = np.double if self.grid_layout else config.get_dtype()
+        keys = config.radiation_keys() if Args['fetchSpectrum'] else ()
+        out = {key: arr for key, arr in (out or {}).items() if key in keys}
+        for key, arr in out.items():
+            if arr.shape != shape or arr.dtype != dtype:
+                raise ValueError(f"out['{key}'] must be a {np.dtype(dtype)} array of shape {shape}")
+        keys = [key for key in keys if key not in out]
+        # 各块的 reductions，run() 结束时拼接
+        self.reduced = None
+        self._reduced_parts = [] if Args['reductions'] else None
+        if out_dir is not None:
+            out_dir = Path(out_dir)
+            out_dir.mkdir(parents=True, exist_ok=True)
+            self.radiation = {key: np.lib.format.open_memmap(out_dir / f'{key}.npy', mode='w+',
+                                                             dtype=dtype, shape=shape)
+                              for key in keys}
+        else:
+            self.radiation = {key: np.zeros(shape, dtype=dtype) for key in keys}
+        self.radiation.update(out)
+
+    def run(self, particleTracks, weights, sigma_particle, nSnaps, it_range, progress=None):
+        pending = None
+        for start, stop in self.bounds:
+            worker = self.make_worker(self.config.restrict_grid(self.axis, start, stop))
+            worker.prepare(sigma_particle, nSnaps, it_range)
+            worker.process(particleTracks, weights, nSnaps, it_range, progress)
+
+            # 本块的 kernel 全部完成后再拷贝（传输队列与计算队列之间用 marker 同步）
+            marker = cl.enqueue_marker(worker.env.get_queue())
+            copies = []
+            for key, device in worker.Data['radiation'].items():
+                if key not in self.radiation:
+                    continue  # fetchSpectrum=False
+                host = np.empty(device.shape, dtype=device.dtype)
+                event = cl.enqueue_copy(self.copy_queue, host, device.data,
+                                        wait_for=[marker], is_blocking=False)
+                if self.env.profiler is not None:
+                    self.env.profiler.event('fetch', event, f'tile_{key}', nbytes=host.nbytes)
+                copies.append((key, host, event))
+            self.copy_queue.flush()
+            if self._reduced_parts is not None:
+                worker.reduce()
+                self._reduced_parts.append(worker.Data['reduced'])
+
+            if pending is not None:
+                self._store(*pending)
+            pending = (worker, start, stop, copies)
+
+        if pending is not None:
+            self._store(*pending)
+        if self._reduced_parts:
+            self.reduced = reductions.join(self._reduced_parts, self.axis, self.bounds)
+        for out in self.radiation.values():
+            if isinstance(out, np.memmap):
+                out.flush()
+        return self.radiation
+
+    def _store(self, worker, start, stop, copies):
+        # 设备布局 (nSnaps, nPhi, nTheta, nOmega) -> 结果布局（fetchLayout='grid' 时为 (nSnaps, nOmega, nTheta, nPhi)）
+        index = [slice(None)] * 4
+        index[self.config.result_axis(self.axis)] = slice(start, stop)
+        for key, host, event in copies:
+            event.wait()
+            self.radiation[key][tuple(index)] = host.swapaxes(-1, -3) if self.grid_layout else host
+        # 释放这一块的设备缓冲
+        worker.Data['radiation'].clear()
@@ -0,0 +1,104 @@
+"""Packed on-disk track store read through np.memmap."""
+
+import json
+from pathlib import Path
+
+import numpy as np
+
+COLUMNS = ('x', 'y', 'z', 'ux', 'uy', 'uz')
+
+
+class TrackStore:
+    """
+    轨迹按列连续存放：每个坐标一个原始二进制文件（np.memmap 打开），
+    index.npz 保存每条轨迹的 offset/length、权重与 it_start。
+
+    store[i] 返回 calculate_spectrum 需要的 8 元组，坐标是 memmap 视图（不复制），
+    store[a:b:c] 与 store[[i, j, ...]] 返回只包含这些轨迹的 TrackStore，
+    因此 particleTracks[:Np][rank::size] 的写法不变，每个 rank 只读入自己的轨迹
+    """
+
+    def __init__(self, path, ids=None):
+        self.path = Path(path)
+        meta = json.loads((self.path / 'meta.json').read_text())
+        self.dtype = np.dtype(meta['dtype'])
+
+        with np.load(self.path / 'index.npz') as index:
+            self._offsets = index['offsets']
+            self._lengths = index['lengths']
+            self._weights = index['weights']
+            self._it_start = index['it_start']
+
+        n_total = int(meta['n_points'])
+        self._columns = [
+            np.memmap(self.path / f'{name}.bin', dtype=self.dtype, mode='r', shape=(n_total,))
+            if n_total else np.zeros(0, dtype=self.dtype)
+            for name in COLUMNS
+        ]
+        self._ids = np.arange(self._offsets.size) if ids is None else np.asarray(ids, dtype=np.int64)
+
+    @classmethod
+    def write(cls, path, tracks, dtype=np.double):
+        """把可迭代的 8 元组轨迹（list 或生成器，如 utils.iter_tracks）逐条写入 path"""
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        dtype = np.dtype(dtype)
+
+        lengths, weights, it_start = [], [], []
+        files = [open(path / f'{name}.bin', 'wb') for name in COLUMNS]
+        try:
+            for track in tracks:
+                if len(track) != 8:
+                    raise ValueError("Each particleTrack must have 8 elements")
+                for f, coord in zip(files, track[:6]):
+                    f.write(np.ascontiguousarray(coord, dtype=dtype).tobytes())
+                lengths.append(len(track[0]))
+                weights.append(track[6])
+                it_start.append(track[7])
+        finally:
+            for f in files:
+                f.close()
+
+        lengths = np.array(lengths, dtype=np.int64)
+        offsets = np.zeros_like(lengths)
+        offsets[1:] = np.cumsum(lengths[:-1])
+        np.savez(path / 'index.npz', offsets=offsets, lengths=lengths,
+                 weights=np.array(weights, dtype=np.double),
+                 it_start=np.array(it_start, dtype=np.uint32))
+        (path / 'meta.json').write_text(json.dumps({
+            'dtype': dtype.str, 'n_tracks': int(lengths.size), 'n_points': int(lengths.sum())
+        }))
+        return cls(path)
+
+    def __len__(self):
+        return self._ids.size
+
+    def __getitem__(self, key):
+        if isinstance(key, (int, np.integer)):
+            i = self._ids[key]
+            start, stop = self._offsets[i], self._offsets[i] + self._lengths[i]
+            coords = tuple(column[start:stop] for column in self._columns)
+            return coords + (self._weights[i], self._it_start[i])
+        return TrackStore._view(self, self._ids[key])
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def _view(self, ids):
+        view = object.__new__(TrackStore)
+        view.__dict__.update(self.__dict__)
+        view._ids = np.atleast_1d(ids)
+        return view
+
+    @property
+    def weights(self):
+        return self._weights[self._ids]
+
+    @property
+    def lengths(self):
+        return self._lengths[self._ids]
+
+    @property
+    def it_start(self):
+        return self._it_start[self._ids]
@@ -4,6 +4,33 @@ from tqdm import tqdm
 from pathlib import Path
 from scipy.constants import m_e, c
 
+# openPMD 记录名 -> (record, component)
+PARTICLE_RECORDS = {
+    'x': ('position', 'x'),
+    'y': ('position', 'y'),
+    'z': ('position', 'z'),
+    'ux': ('momentum', 'x'),
+    'uy': ('momentum', 'y'),
+    'uz': ('momentum', 'z'),
+    'w': ('weighting', io.Mesh_Record_Component.SCALAR),
+    'pid': ('id', io.Mesh_Record_Component.SCALAR),
+}
+TRACK_RECORDS = ('x', 'y', 'z', 'ux', 'uy', 'uz')
+
+def read_particle_records(series, iteration, species="electrons", records=PARTICLE_RECORDS):
+    """只登记需要的 species/记录，flush 时才真正读取；返回 {记录名: 数组}"""
+    particles = series.iterations[iteration].particles[species]
+    chunks = {}
+    for name in records:
+        record, component = PARTICLE_RECORDS[name]
+        chunks[name] = particles[record][component].load_chunk()
+    series.flush()
+    return chunks
+
+def _close(series):
+    if hasattr(series, 'close'):
+        series.close()
+
 # 获取单个文件的粒子数据
 def get_particle_data(file):
     series = io.Series(file, io.Access_Type.read_only)
@@ -36,41 +63,114 @@ def get_particle_data(file):
     # 合并所有时间步的数据
     return np.concatenate(x), np.concatenate(y), np.concatenate(z), np.concatenate(ux), np.concatenate(uy), np.concatenate(uz), np.concatenate(w), np.concatenate(pid)
 
-def track_particles(wkdir, selected_pid_values):
-    # 用于存储符合条件的轨迹数据
+def _list_steps(files):
+    """只读元数据：[(文件, 该文件中排好序的 iteration 列表)]"""
+    steps = []
+    for file in files:
+        series = io.Series(str(file), io.Access_Type.read_only)
+        steps.append((file, sorted(series.iterations)))
+        _close(series)
+    return steps
+
+def _collect_tracks(steps, selected, species="electrons", momentum_unit=m_e * c, dtype=np.double,
+                    verbose=True):
+    """
+    对一组所选粒子按文件名顺序逐个读取 (文件, iteration)，每步只读一次 id 并排序，
+    用 searchsorted 找到所选粒子所在的行，再把整列散射到预分配的 (粒子, 步) 数组
+    """
+    n_sel = selected.size
+    n_steps = sum(len(iterations) for _, iterations in steps)
+
+    cols = {name: np.zeros((n_sel, n_steps), dtype=dtype) for name in TRACK_RECORDS}
+    present = np.zeros((n_sel, n_steps), dtype=bool)
+    weights = np.zeros(n_sel, dtype=np.double)
+    seen = np.zeros(n_sel, dtype=bool)
+
+    k = 0
+    for file, iterations in (tqdm(steps) if verbose else steps):
+        series = io.Series(str(file), io.Access_Type.read_only)
+        for iteration in iterations:
+            pid = read_particle_records(series, iteration, species, ('pid',))['pid']
+            if pid.size == 0:
+                k += 1
+                continue
+
+            order = np.argsort(pid, kind='stable')
+            pos = np.minimum(np.searchsorted(pid[order], selected), pid.size - 1)
+            found = pid[order][pos] == selected
+            if not found.any():
+                k += 1
+                continue
+
+            # 只有本步包含所选粒子时才读取其余记录
+            data = read_particle_records(series, iteration, species, TRACK_RECORDS + ('w',))
+            rows = order[pos[found]]
+            for name in TRACK_RECORDS:
+                column = data[name][rows]
+                cols[name][found, k] = column / momentum_unit if name.startswith('u') else column
+
+            present[found, k] = True
+
+            new = found & ~seen
+            weights[new] = data['w'][order[pos[new]]]
+            seen |= found
+            k += 1
+        _close(series)
+
+    return cols, present, weights
+
+def _segments(mask):
+    """mask 中连续为 True 的区间 [(start, stop)]"""
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], mask.astype(np.int8), [0]))))
+    return list(zip(edges[::2], edges[1::2]))
+
+def _iter_chunks(wkdir, selected_pid_values, species, pattern, momentum_unit, dtype, verbose, chunk_size):
+    """逐块给出 (该块的粒子编号, cols, present, weights)"""
+    steps = _list_steps(sorted(Path(wkdir).glob(pattern)))
+    selected = np.unique(np.asarray(selected_pid_values))
+    for start in range(0, selected.size, chunk_size):
+        chunk = selected[start:start + chunk_size]
+        yield (chunk,) + _collect_tracks(steps, chunk, species, momentum_unit, dtype, verbose)
+
+def iter_tracks(wkdir, selected_pid_values, species="electrons", pattern="*.h5",
+                momentum_unit=m_e * c, dtype=np.double, verbose=True, chunk_size=4096, gaps='split'):
+    """
+    生成器：逐条给出 calculate_spectrum 需要的 (x, y, z, ux, uy, uz, w, it_start)，
+    it_start 为粒子第一次出现的步，动量以 momentum_unit（默认 m_e c）归一化。
+
+    所选粒子每 chunk_size 个读一遍所有文件，内存为 O(chunk_size × 步数)；
+    粒子数超过 chunk_size 时每一块都要重新读取 id 记录。
+    粒子中途消失又出现时，gaps='split' 把每段连续出现的部分作为一条单独的轨迹
+    （各自的 it_start，段与段之间的干涉项丢失），gaps='raise' 则抛出 ValueError
+    """
+    if gaps not in ('split', 'raise'):
+        raise ValueError("gaps must be 'split' or 'raise'")
+    for chunk, cols, present, weights in _iter_chunks(
+            wkdir, selected_pid_values, species, pattern, momentum_unit, dtype, verbose, chunk_size):
+        for j in np.flatnonzero(present.any(axis=1)):
+            segments = _segments(present[j])
+            if len(segments) > 1 and gaps == 'raise':
+                raise ValueError(f"Particle {chunk[j]} is missing from some steps between "
+                                 f"{segments[0][0]} and {segments[-1][1] - 1}")
+            for begin, end in segments:
+                coords = tuple(np.ascontiguousarray(cols[name][j, begin:end]) for name in TRACK_RECORDS)
+                yield coords + (weights[j], int(begin))
+
+def track_particles(wkdir, selected_pid_values, species="electrons", pattern="*.h5", chunk_size=4096):
+    """
+    与 iter_tracks 相同的数据，按粒子编号组织成字典（兼容旧接口）；
+    每个粒子只能有一段连续的轨迹，中途消失的粒子抛出 ValueError
+    """
     tracks = {}
-    filedir = Path(wkdir)
-    # 遍历目录中的所有文件，筛选出这些粒子的轨迹
-    for file in tqdm(list(filedir.glob("*.h5"))):
-        # 获取该文件的粒子数据
-        x, y, z, ux, uy, uz, w, pid = get_particle_data(str(file))
-        
-        # 筛选出符合条件的粒子（在此文件中）
-        selected_mask = np.isin(pid, selected_pid_values)
-        
-        # 提取符合条件的粒子的轨迹数据
-        for i, particle_id in enumerate(pid[selected_mask]):
-            # 如果这个粒子还没有被记录过，初始化它的轨迹数据并记录其起始索引
-            if particle_id not in tracks:
-                tracks[particle_id] = {
-                    "x": [],
-                    "y": [],
-                    "z": [],
-                    "ux": [],
-                    "uy": [],
-                    "uz": [],
-                    # "w": [],
-                    "w": w[selected_mask][i],  # 记录权重
-                    # "pid": particle_id,
-                    "idx_start": i  # 记录起始索引
-                }
-            
-            # 将粒子的轨迹数据追加到相应的轨迹中
-            tracks[particle_id]["x"].append(x[selected_mask][i])
-            tracks[particle_id]["y"].append(y[selected_mask][i])
-            tracks[particle_id]["z"].append(z[selected_mask][i])
-            tracks[particle_id]["ux"].append(ux[selected_mask][i]/m_e/c)
-            tracks[particle_id]["uy"].append(uy[selected_mask][i]/m_e/c)
-            tracks[particle_id]["uz"].append(uz[selected_mask][i]/m_e/c)
-            # tracks[particle_id]["w"].append(w[selected_mask][i])
-    return tracks
\ No newline at end of file
+    for chunk, cols, present, weights in _iter_chunks(
+            wkdir, selected_pid_values, species, pattern, m_e * c, np.double, True, chunk_size):
+        for j in np.flatnonzero(present.any(axis=1)):
+            segments = _segments(present[j])
+            if len(segments) > 1:
+                raise ValueError(f"Particle {chunk[j]} is missing from some steps; "
+                                 f"use iter_tracks(gaps='split') to read it as separate segments")
+            (begin, end), = segments
+            tracks[chunk[j]] = {name: cols[name][j, begin:end] for name in TRACK_RECORDS}
+            tracks[chunk[j]]["w"] = weights[j]
+            tracks[chunk[j]]["idx_start"] = int(begin)
+    return tracks
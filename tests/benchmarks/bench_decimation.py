@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+
+"""
+Direct `total` kernel vs the decimated trajectory pyramid (decimationTolerance)
+on a logarithmic omega grid, where most nodes can use a coarse level.
+
+    python tests/benchmarks/bench_decimation.py [--ctx cpu] [--tol 0.05 0.1 0.3]
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from fourier_radiator import FourierRadiator
+
+
+def make_tracks(Np, Nt, dt):
+    tracks = []
+    for i in range(Np):
+        t = np.arange(Nt) * dt
+        ux = 2.0 * np.cos(t + 0.3 * i)
+        uy = 2.0 * np.sin(t)
+        uz = np.full_like(t, 19.8)
+        g = np.sqrt(1 + ux**2 + uy**2 + uz**2)
+        x, y, z = (np.cumsum(u / g) * dt for u in (ux, uy, uz))
+        tracks.append([x, y, z, ux, uy, uz, 1.0, 0])
+    return tracks
+
+
+def run(tracks, args, dt):
+    calc = FourierRadiator(args)
+    calc.calculate_spectrum(tracks[:1], timeStep=dt, verbose=False)  # 预热
+    t0 = time.perf_counter()
+    calc.calculate_spectrum(tracks, timeStep=dt, verbose=False)
+    return time.perf_counter() - t0, calc.Data['radiation']['total']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--ctx', default='cpu')
+    parser.add_argument('--dtype', default='double')
+    parser.add_argument('--tracks', type=int, default=4)
+    parser.add_argument('--steps', type=int, default=20000)
+    parser.add_argument('--dt', type=float, default=0.05)
+    parser.add_argument('--grid', type=int, nargs=3, default=(64, 4, 2))
+    parser.add_argument('--omega', type=float, nargs=2, default=(1e-3, 20.))
+    parser.add_argument('--tol', type=float, nargs='+', default=(0.05, 0.1, 0.3))
+    opts = parser.parse_args()
+
+    args = {
+        'grid': [tuple(opts.omega), (0, 0.05), (0, 2 * np.pi), tuple(opts.grid)],
+        'dtype': opts.dtype, 'ctx': opts.ctx, 'Features': ['logGrid'],
+    }
+    tracks = make_tracks(opts.tracks, opts.steps, opts.dt)
+
+    t_ref, ref = run(tracks, args, opts.dt)
+    print(f"tracks={opts.tracks} steps={opts.steps} grid={tuple(opts.grid)} omega={tuple(opts.omega)} (logGrid)")
+    print(f"total             : {t_ref:8.3f} s")
+    for tol in opts.tol:
+        t_dec, res = run(tracks, dict(args, decimationTolerance=tol), opts.dt)
+        err = np.abs(res - ref).max() / np.abs(ref).max()
+        print(f"decimation tol={tol:<4}: {t_dec:8.3f} s  (speedup {t_ref / t_dec:5.2f}x, max rel. diff {err:.1e})")
+
+
+if __name__ == '__main__':
+    main()
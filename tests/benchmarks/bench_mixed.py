@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+
+"""
+Accuracy and speed of dtype='float' / 'mixed' / 'double'.
+
+Long helical tracks observed near the first harmonic: the retarded time
+t - n.x is a small difference of two large numbers, which single precision
+cannot resolve. The 'double' result is the reference.
+
+    python tests/benchmarks/bench_mixed.py [--ctx gpu] [--mode far|near] [--steps 40000]
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from fourier_radiator import FourierRadiator
+
+
+def make_tracks(Np, Nt, dt, K=2.0, gamma=20.0):
+    tracks = []
+    for i in range(Np):
+        t = np.arange(Nt) * dt
+        ux = K * np.cos(t + 0.3 * i)
+        uy = K * np.sin(t)
+        uz = np.full_like(t, np.sqrt(gamma**2 - 1 - K**2))
+        g = np.sqrt(1 + ux**2 + uy**2 + uz**2)
+        x, y, z = (np.cumsum(u / g) * dt for u in (ux, uy, uz))
+        tracks.append([x, y, z, ux, uy, uz, 1.0, 0])
+    return tracks
+
+
+def run(tracks, args, dtype, dt, repeat, **kwargs):
+    calc = FourierRadiator(dict(args, dtype=dtype))
+    calc.calculate_spectrum(tracks[:1], timeStep=dt, verbose=False, **kwargs)  # 预热
+
+    best = np.inf
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        calc.calculate_spectrum(tracks, timeStep=dt, verbose=False, **kwargs)
+        best = min(best, time.perf_counter() - t0)
+    return best, calc.Data['radiation']['total']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--ctx', default='cpu')
+    parser.add_argument('--mode', default='far', choices=('far', 'near'))
+    parser.add_argument('--tracks', type=int, default=2)
+    parser.add_argument('--steps', type=int, default=40000)
+    parser.add_argument('--dt', type=float, default=0.05)
+    parser.add_argument('--grid', type=int, nargs=3, default=(64, 4, 2))
+    parser.add_argument('--repeat', type=int, default=1)
+    opts = parser.parse_args()
+
+    # 第一谐波 omega_1 = 2 gamma^2 / (1 + K^2/2)（单位为 omega_u = 1），网格以 2pi 为单位
+    omega_1 = 2 * 20.0**2 / (1 + 2.0**2 / 2) / (2 * np.pi)
+    grid_2 = (0, 0.02) if opts.mode == 'far' else (0, 20.)
+    args = {
+        'grid': [(0.5 * omega_1, 1.5 * omega_1), grid_2, (0, 2 * np.pi), tuple(opts.grid)],
+        'mode': opts.mode, 'ctx': opts.ctx,
+    }
+    kwargs = {'L_screen': 1e4} if opts.mode == 'near' else {}
+    tracks = make_tracks(opts.tracks, opts.steps, opts.dt)
+
+    results = {dtype: run(tracks, args, dtype, opts.dt, opts.repeat, **kwargs)
+               for dtype in ('double', 'mixed', 'float')}
+    ref = results['double'][1]
+
+    print(f"mode={opts.mode} tracks={opts.tracks} steps={opts.steps} grid={tuple(opts.grid)}")
+    for dtype, (elapsed, spectrum) in results.items():
+        err = np.abs(spectrum - ref).max() / np.abs(ref).max()
+        print(f"{dtype:>6}: {elapsed:8.3f} s  (x{results['double'][0] / elapsed:5.2f} vs double)  "
+              f"max rel. error {err:.1e}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+
+"""
+Throughput and accuracy sweep against analytic helical-undulator spectra.
+
+Each case runs calculate_spectrum on analytic trajectories and reports the
+throughput in grid-node-steps per second together with the maximum relative
+error of the on-axis spectrum (all snapshots) against the closed form in
+reference.py. By default one parameter at a time is varied around a base case;
+--full runs the Cartesian product. Results are written as JSON, and --baseline
+compares against an earlier file: a throughput drop larger than
+--speed-tolerance or an error growth larger than --error-factor is reported as
+a regression, and the exit status is 1.
+
+    python tests/benchmarks/bench_suite.py [--ctx cpu] [--quick] [--out bench.json] [--baseline old.json]
+"""
+
+import argparse
+import itertools
+import json
+import platform
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+import fourier_radiator
+from fourier_radiator import FourierRadiator
+
+sys.path.insert(0, str(Path(__file__).parent))
+from reference import Helix, snap_durations  # noqa: E402
+
+BASE = {'mode': 'far', 'dtype': 'double', 'grid': (64, 4, 4), 'steps': 4000, 'tracks': 4, 'nSnaps': 1}
+SWEEP = {
+    'grid': [(32, 2, 2), (64, 4, 4), (128, 8, 8)],
+    'steps': [1000, 4000, 16000],
+    'tracks': [1, 4, 16],
+    'mode': ['far', 'near'],
+    'dtype': ['float', 'double', 'mixed'],
+    'nSnaps': [1, 4, 16],
+}
+QUICK = {
+    'grid': [(32, 2, 2), (64, 4, 4)],
+    'steps': [1000, 4000],
+    'tracks': [1, 4],
+    'mode': ['far', 'near'],
+    'dtype': ['float', 'double', 'mixed'],
+    'nSnaps': [1, 4],
+}
+KEY = ('mode', 'dtype', 'grid', 'steps', 'tracks', 'nSnaps')
+
+
+def cases(sweep, full):
+    if full:
+        for values in itertools.product(*(sweep[key] for key in KEY)):
+            yield dict(zip(KEY, values))
+        return
+
+    seen = set()
+    for key in KEY:
+        for value in sweep[key]:
+            case = dict(BASE, **{key: value})
+            ident = tuple(case[k] for k in KEY)
+            if ident not in seen:
+                seen.add(ident)
+                yield case
+
+
+def run_case(case, opts, helix):
+    dt = opts.dt
+    # theta（近场为 radius）的第一个节点在轴上，用于与解析谱比较
+    grid_2 = (0, 0.01) if case['mode'] == 'far' else (0, 1.)
+    omega = (0.8 * helix.omega_1, 1.2 * helix.omega_1)
+    calc = FourierRadiator({'grid': [omega, grid_2, (0, 2 * np.pi), tuple(case['grid'])],
+                            'mode': case['mode'], 'dtype': case['dtype'], 'ctx': opts.ctx})
+    tracks = helix.tracks(case['tracks'], case['steps'], dt)
+    kwargs = {'timeStep': dt, 'nSnaps': case['nSnaps'], 'verbose': False}
+    if case['mode'] == 'near':
+        kwargs['L_screen'] = opts.screen
+
+    calc.calculate_spectrum(tracks[:1], **kwargs)  # 预热（kernel 编译、缓冲分配）
+    best = np.inf
+    for _ in range(opts.repeat):
+        t0 = time.perf_counter()
+        calc.calculate_spectrum(tracks, **kwargs)
+        best = min(best, time.perf_counter() - t0)
+
+    omega_axis = np.asarray(calc.Args['omega'], dtype=np.double)
+    on_axis = calc.Data['radiation']['total'][:, :, 0, :]
+    error = 0.
+    for iSnap, T in enumerate(snap_durations(case['steps'], case['nSnaps'], dt)):
+        if case['mode'] == 'far':
+            ref = helix.far_on_axis(omega_axis, T)
+        else:
+            ref = helix.near_on_axis(omega_axis, T, opts.screen)
+        ref = case['tracks'] * ref[:, None]
+        error = max(error, float(np.abs(on_axis[iSnap] - ref).max() / ref.max()))
+
+    node_steps = calc.Args['numGridNodes'] * case['tracks'] * case['steps']
+    return dict(case, grid=list(case['grid']), seconds=best,
+                node_steps_per_s=node_steps / best, max_rel_error=error)
+
+
+def metadata(calc_env, opts):
+    try:
+        rev = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                             cwd=Path(__file__).parent).stdout.strip() or None
+    except OSError:
+        rev = None
+    return {
+        'device': calc_env.get_device_name(), 'platform': calc_env.get_platform_name(),
+        'version': fourier_radiator.__version__, 'git': rev, 'python': platform.python_version(),
+        'numpy': np.__version__, 'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'dt': opts.dt, 'L_screen': opts.screen, 'repeat': opts.repeat,
+    }
+
+
+def compare(results, baseline, speed_tolerance, error_factor):
+    """与基线逐项比较，返回回归的说明列表"""
+    old = {tuple(json.dumps(r[k]) for k in KEY): r for r in baseline['results']}
+    regressions = []
+    for r in results:
+        b = old.get(tuple(json.dumps(r[k]) for k in KEY))
+        if b is None:
+            continue
+        name = ' '.join(f"{k}={r[k]}" for k in KEY)
+        if r['node_steps_per_s'] < (1 - speed_tolerance) * b['node_steps_per_s']:
+            regressions.append(f"{name}: throughput {r['node_steps_per_s']:.3g} < "
+                               f"{b['node_steps_per_s']:.3g} node-steps/s")
+        if r['max_rel_error'] > error_factor * b['max_rel_error'] + 1e-12:
+            regressions.append(f"{name}: error {r['max_rel_error']:.2e} > {b['max_rel_error']:.2e}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--ctx', default='cpu')
+    parser.add_argument('--quick', action='store_true', help='smaller sweep')
+    parser.add_argument('--full', action='store_true', help='Cartesian product instead of one-at-a-time')
+    parser.add_argument('--dt', type=float, default=0.05)
+    parser.add_argument('--screen', type=float, default=1e6, help='L_screen of near-field cases')
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--out', default='bench_suite.json')
+    parser.add_argument('--baseline', default=None)
+    parser.add_argument('--speed-tolerance', type=float, default=0.25)
+    parser.add_argument('--error-factor', type=float, default=2.0)
+    opts = parser.parse_args()
+
+    helix = Helix()
+    results = []
+    print(f"{'mode':>5} {'dtype':>6} {'grid':>12} {'steps':>6} {'tracks':>6} {'snaps':>5}"
+          f" {'seconds':>8} {'node-steps/s':>13} {'max rel err':>11}")
+    for case in cases(QUICK if opts.quick else SWEEP, opts.full):
+        r = run_case(case, opts, helix)
+        results.append(r)
+        print(f"{r['mode']:>5} {r['dtype']:>6} {str(tuple(r['grid'])):>12} {r['steps']:>6} {r['tracks']:>6}"
+              f" {r['nSnaps']:>5} {r['seconds']:8.3f} {r['node_steps_per_s']:13.3e} {r['max_rel_error']:11.2e}")
+
+    env = FourierRadiator({'grid': [(1., 2.), (0, 0.1), (0, 1.), (2, 2, 2)], 'ctx': opts.ctx}).env
+    report = {'meta': metadata(env, opts), 'results': results}
+    Path(opts.out).write_text(json.dumps(report, indent=1))
+    print(f"results written to {opts.out}")
+
+    if opts.baseline is not None:
+        regressions = compare(results, json.loads(Path(opts.baseline).read_text()),
+                              opts.speed_tolerance, opts.error_factor)
+        for line in regressions:
+            print("REGRESSION", line)
+        if regressions:
+            sys.exit(1)
+        print(f"no regressions against {opts.baseline}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,9 @@
+import pytest
+
+
+@pytest.fixture(autouse=True, scope='session')
+def kernel_cache_dir(tmp_path_factory):
+    """编译缓存与调优缓存写入临时目录，不碰用户的 ~/.cache/fourier_radiator"""
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setenv('FOURIER_RADIATOR_CACHE', str(tmp_path_factory.mktemp('kernel_cache')))
+        yield
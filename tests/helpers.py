@@ -0,0 +1,78 @@
+"""Shared test fixtures: synthetic tracks, the OpenCL skip decorator and a FourierRadiator factory."""
+
+import inspect
+import unittest
+
+import numpy as np
+
+from fourier_radiator import FourierRadiator
+
+try:
+    import pyopencl as cl
+    opencl_available = any(plat.get_devices() for plat in cl.get_platforms())
+except Exception:
+    opencl_available = False
+
+requires_opencl = unittest.skipUnless(opencl_available, "no OpenCL device available")
+
+# 网格的前三个轴（omega, theta/radius, phi）与近场的屏幕距离：
+# 'harmonic' 在 long_track 第一谐波附近，'broad' 覆盖 helical_tracks 的低频部分
+AXES = {
+    'harmonic': {'far': [(30., 55.), (0, 0.02), (0, 2 * np.pi)],
+                 'near': [(30., 55.), (0, 20.), (0, 2 * np.pi)]},
+    'broad': {'far': [(0.01, 1.5), (0, 0.2), (0, 2 * np.pi)],
+              'near': [(0.01, 1.5), (0, 5.), (0, 2 * np.pi)]},
+}
+L_SCREEN = {'harmonic': 1e4, 'broad': 100.}
+
+# calculate_spectrum 的关键字，其余关键字作为 Args
+CALC_KWARGS = set(inspect.signature(FourierRadiator.calculate_spectrum).parameters) - {'self', 'particleTracks'}
+
+
+def helical_tracks(Np=4, Nt=800, dt=0.05):
+    """长度、权重、it_start 各不相同的螺旋轨迹"""
+    tracks = []
+    for i in range(Np):
+        t = np.arange(Nt - 50 * i) * dt
+        K, gamma = 2.0 + 0.2 * i, 20.0
+        ux = K * np.cos(t + 0.3 * i)
+        uy = K * np.sin(t)
+        uz = np.full_like(t, np.sqrt(gamma**2 - 1 - K**2))
+        g = np.sqrt(1 + ux**2 + uy**2 + uz**2)
+        x, y, z = (np.cumsum(u / g) * dt for u in (ux, uy, uz))
+        tracks.append([x, y, z, ux, uy, uz, 1.0 + 0.1 * i, 2 * i])
+    return tracks
+
+
+def long_track(Nt=12000, dt=0.05, K=2.0, gamma=20.0):
+    """一条长的螺旋轨迹（列表），推迟时间 t - n.x 是两个大数之差"""
+    t = np.arange(Nt) * dt
+    ux, uy = K * np.cos(t), K * np.sin(t)
+    uz = np.full_like(t, np.sqrt(gamma**2 - 1 - K**2))
+    g = np.sqrt(1 + ux**2 + uy**2 + uz**2)
+    x, y, z = (np.cumsum(u / g) * dt for u in (ux, uy, uz))
+    return [[x, y, z, ux, uy, uz, 1.0, 0]]
+
+
+def radiator(nodes=(13, 3, 2), mode='far', axes='harmonic', **args):
+    """FourierRadiator：double、OpenCL CPU 设备、不自动调优，args 覆盖默认（包括整个 grid）"""
+    Args = {'grid': AXES[axes][mode] + [tuple(nodes)], 'mode': mode, 'dtype': 'double', 'ctx': 'cpu',
+            'autotune': False}
+    Args.update(args)
+    return FourierRadiator(Args)
+
+
+def spectrum(tracks, nodes=(13, 3, 2), mode='far', axes='harmonic', calc=None, **kwargs):
+    """
+    计算 tracks 的谱并返回 FourierRadiator。kwargs 中 calculate_spectrum 的关键字（nSnaps、it_range…）
+    传给它，其余作为 Args；calc 给定时在它上面累加（accumulate=True，不再新建）
+    """
+    run = {key: kwargs.pop(key) for key in list(kwargs) if key in CALC_KWARGS}
+    run.setdefault('accumulate', calc is not None)
+    calc = calc or radiator(nodes, mode, axes, **kwargs)
+    run.setdefault('timeStep', 0.05)
+    run.setdefault('verbose', False)
+    if calc.Args['mode'] == 'near':
+        run.setdefault('L_screen', L_SCREEN[axes])
+    calc.calculate_spectrum(tracks, **run)
+    return calc
@@ -0,0 +1,73 @@
+"""
+由 test_mpi.py 以 mpiexec -n 2 python -m tests.mpi_cases <npz> 运行：
+rank 之间的归约（_gather_result_mpi）、网格分解（_gather_grid_mpi）、
+动态队列（load_balance.WorkQueue）与轨迹广播（_broadcast_tracks），rank 0 把结果写入 npz
+"""
+
+import sys
+
+import numpy as np
+
+from fourier_radiator import main
+from fourier_radiator.load_balance import WorkQueue
+
+from .helpers import helical_tracks, spectrum
+
+ALL = ('spectrum', 'angular', 'energy', 'peak')
+
+
+def run(tracks, **kwargs):
+    return spectrum(tracks, (16, 4, 2), axes='broad', nSnaps=2, it_range=(0, 560), **kwargs)
+
+
+def cases(path):
+    from mpi4py import MPI
+
+    comm = MPI.COMM_WORLD
+    rank = comm.Get_rank()
+    tracks = helical_tracks(Np=6, Nt=500)
+    results = {}
+
+    # 按粒子划分：三种分配方式（'dynamic' 经过 WorkQueue），结果归约到 rank 0
+    for load_balance in ('cost', 'dynamic', 'round_robin'):
+        calc = run(tracks, load_balance=load_balance, reductions=ALL)
+        if rank == 0:
+            results[f'split_{load_balance}'] = calc.Data['radiation']['total']
+            results[f'split_{load_balance}_energy'] = calc.Data['reduced']['total']['energy']
+            results[f'split_{load_balance}_weight'] = calc.total_weight
+
+    # allreduce：每个 rank 都得到相同的结果
+    calc = run(tracks, allreduce=True, components='cartesian')
+    gathered = comm.gather(calc.Data['radiation'])
+    if rank == 0:
+        for key in gathered[0]:
+            assert np.array_equal(gathered[0][key], gathered[1][key]), key
+            results[f'allreduce_{key}'] = gathered[0][key]
+
+    # 网格分解：rank 1 不持有轨迹，从 rank 0 分段广播（Bcast 上限压到 4 kB）
+    main.BCAST_CHUNK_BYTES = 4096
+    for axis in ('omega', 'phi'):
+        calc = run(tracks if rank == 0 else None, gridDecomposition=axis, allreduce=True,
+                   components='cartesian', reductions=ALL)
+        gathered = comm.gather((calc.Data['radiation'], calc.Data['reduced']['total']))
+        if rank == 0:
+            for key in gathered[0][0]:
+                assert np.array_equal(gathered[0][0][key], gathered[1][0][key]), key
+                results[f'grid_{axis}_{key}'] = gathered[0][0][key]
+            for name in ALL:
+                results[f'grid_{axis}_{name}'] = gathered[0][1][name]
+
+    # WorkQueue：每一段只被一个 rank 领取
+    queue = WorkQueue(comm, 37, chunk=3)
+    taken = []
+    while (item := queue.next()) is not None:
+        taken += range(*item)
+    queue.free()
+    taken = comm.gather(taken)
+    if rank == 0:
+        results['queue'] = np.sort(np.concatenate(taken))
+        np.savez(path, **results)
+
+
+if __name__ == '__main__':
+    cases(sys.argv[1])
@@ -1,21 +0,0 @@
-#!/usr/bin/env python
-
-"""Tests for `None` package."""
-
-
-import unittest
-
-from None import None
-
-
-class TestNone(unittest.TestCase):
-    """Tests for `None` package."""
-
-    def setUp(self):
-        """Set up test fixtures, if any."""
-
-    def tearDown(self):
-        """Tear down test fixtures, if any."""
-
-    def test_000_something(self):
-        """Test something."""
@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+
+"""Work-group size / omega blocking auto-tuner and the total_block kernel."""
+
+
+import json
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from .helpers import long_track, radiator, requires_opencl, spectrum
+
+
+@requires_opencl
+class TestAutotune(unittest.TestCase):
+
+    def test_block_kernel(self):
+        # 分块只改变工作划分，结果逐位相同（nOmega=13 不是块大小的整数倍）
+        for mode in ('far', 'near'):
+            ref = spectrum(long_track(Nt=1500), mode=mode, nSnaps=2).Data['radiation']['total']
+            for block in (3, 4):
+                calc = spectrum(long_track(Nt=1500), mode=mode, nSnaps=2, nodesPerItem=block, WGS=8)
+                np.testing.assert_array_equal(calc.Data['radiation']['total'], ref)
+
+    def test_tune_and_cache(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'autotune.json')
+            calc = radiator((16, 2, 2), autotune=True, autotuneCache=path)
+            with open(path) as f:
+                entry = next(iter(json.load(f).values()))['far/double/total/16x4']
+            self.assertEqual(calc.env.WGS, entry['WGS'])
+            self.assertEqual(calc.processor.nodes_per_item, entry['nodesPerItem'])
+
+            # 默认 autotune='cache'：直接使用缓存；调用方给定的值优先
+            calc = radiator((16, 2, 2), autotune='cache', autotuneCache=path, WGS=16)
+            self.assertEqual(calc.env.WGS, 16)
+            self.assertEqual(calc.processor.nodes_per_item, entry['nodesPerItem'])
+            calc = radiator((16, 2, 2), autotuneCache=path)
+            self.assertEqual((calc.env.WGS, calc.processor.nodes_per_item), (256, 1))
+
+            # 同一档的网格沿用缓存；大得多的网格是另一个键，不使用小网格上的结果
+            calc = radiator((13, 2, 2), autotune='cache', autotuneCache=path)
+            self.assertEqual((calc.env.WGS, calc.processor.nodes_per_item), (entry['WGS'], entry['nodesPerItem']))
+            calc = radiator((200, 16, 8), autotune='cache', autotuneCache=path)
+            self.assertEqual((calc.env.WGS, calc.processor.nodes_per_item), (256, 1))
+
+    def test_invalid(self):
+        from fourier_radiator import RadiationConfig
+
+        grid = [(0.01, 1.), (0, 0.1), (0, 1.), (8, 2, 2)]
+        with self.assertRaises(ValueError):
+            RadiationConfig({'grid': grid, 'nodesPerItem': 4, 'batchSize': 4})
+        with self.assertRaises(ValueError):
+            RadiationConfig({'grid': grid, 'autotune': 'always'})
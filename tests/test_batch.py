@@ -0,0 +1,38 @@
+#!/usr/bin/env python
+
+"""Batched track processing (Args['batchSize']) and the total_batch kernel."""
+
+
+import unittest
+
+import numpy as np
+
+from .helpers import helical_tracks, requires_opencl, spectrum
+
+
+@requires_opencl
+class TestBatch(unittest.TestCase):
+
+    def setUp(self):
+        # 长度、权重、it_start 各不相同，5 条轨迹：batchSize=2 时最后一批不满
+        self.tracks = helical_tracks(Np=5, Nt=600)
+
+    def _check(self, mode, **kwargs):
+        ref = spectrum(self.tracks, (16, 4, 2), mode, 'broad', **kwargs).Data['radiation']['total']
+        for batch_size in (2, 5, 8):
+            calc = spectrum(self.tracks, (16, 4, 2), mode, 'broad', batchSize=batch_size, **kwargs)
+            np.testing.assert_allclose(calc.Data['radiation']['total'], ref, rtol=1e-12, err_msg=str(batch_size))
+
+    def test_far(self):
+        self._check('far', nSnaps=2)
+
+    def test_near(self):
+        self._check('near', nSnaps=2)
+
+    def test_it_range(self):
+        for mode in ('far', 'near'):
+            self._check(mode, nSnaps=3, it_range=(0, 640))
+
+
+if __name__ == '__main__':
+    unittest.main()
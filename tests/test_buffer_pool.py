@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+
+"""Device buffer pool (OpenCLEnvironment.pooled), cached snap schedules and release_buffers."""
+
+
+import unittest
+
+import numpy as np
+
+from .helpers import helical_tracks, requires_opencl, spectrum
+
+
+def pool_buffers(calc):
+    return {key: (buf.data.int_ptr, buf.size) for key, buf in calc.env._pool.items()}
+
+
+@requires_opencl
+class TestBufferPool(unittest.TestCase):
+
+    def setUp(self):
+        # 长度 600, 550, ..., 400，it_start 各不相同
+        self.tracks = helical_tracks(Np=5, Nt=600)
+
+    def test_reuse_across_lengths(self):
+        calc = spectrum(self.tracks[:1], (16, 4, 2), axes='broad')
+        buffers = pool_buffers(calc)
+        self.assertEqual(set(buffers), {'x', 'y', 'z', 'ux', 'uy', 'uz'})
+        self.assertTrue(all(size == 600 for _, size in buffers.values()))
+
+        # 更短的轨迹不重新分配
+        spectrum(self.tracks[1:], calc=calc, accumulate=False)
+        self.assertEqual(pool_buffers(calc), buffers)
+
+        # 更长的轨迹按 2 倍增长，之后不超过这个长度的轨迹再次复用
+        spectrum(helical_tracks(Np=1, Nt=700), calc=calc, accumulate=False)
+        grown = pool_buffers(calc)
+        self.assertTrue(all(size == 1200 for _, size in grown.values()))
+        spectrum(self.tracks, calc=calc, accumulate=False)
+        self.assertEqual(pool_buffers(calc), grown)
+
+    def test_snap_schedule_per_track(self):
+        # 不给 it_range 时每条轨迹按自己的长度分快照：一起计算与逐条单独计算之和相同
+        calc = spectrum(self.tracks, (16, 4, 2), axes='broad', nSnaps=3)
+        ref = sum(spectrum([track], (16, 4, 2), axes='broad', nSnaps=3).Data['radiation']['total']
+                  for track in self.tracks)
+        np.testing.assert_allclose(calc.Data['radiation']['total'], ref, rtol=1e-12)
+
+        processor = calc.workers[0].processor
+        self.assertEqual(set(processor._snap_cache), {(len(track[0]), 3) for track in self.tracks})
+        for n_steps in (600, 550):
+            snaps = processor.track_snaps(n_steps, 3)
+            self.assertIs(snaps, processor.track_snaps(n_steps, 3))
+            np.testing.assert_array_equal(snaps.get(), np.linspace(0, n_steps, 4, dtype=np.uint32)[1:])
+        np.testing.assert_array_equal(processor.track_snaps(600, 2).get(), [300, 600])
+
+    def test_release_buffers(self):
+        for kwargs in ({'nSnaps': 2}, {'nSnaps': 3, 'it_range': (0, 640)}, {'batchSize': 2, 'nSnaps': 2}):
+            calc = spectrum(self.tracks, (16, 4, 2), axes='broad', **kwargs)
+            ref = calc.Data['radiation']['total'].copy()
+            calc.release_buffers()
+            self.assertEqual(calc.env._pool, {})
+            self.assertEqual(calc.workers[0].processor._snap_cache, {})
+            spectrum(self.tracks, calc=calc, accumulate=False, **kwargs)
+            np.testing.assert_array_equal(calc.Data['radiation']['total'], ref)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+
+"""Checkpoint/resume and accumulate=True of calculate_spectrum."""
+
+
+import tempfile
+import unittest
+
+import numpy as np
+
+from .helpers import helical_tracks, radiator, requires_opencl
+
+
+def calculator(ctx):
+    return radiator((16, 4, 3), axes='broad', ctx=ctx, components='cartesian')
+
+
+class Interrupt(Exception):
+    pass
+
+
+class CheckpointMixin:
+    ctx = 'host'
+
+    def setUp(self):
+        self.tracks = helical_tracks(Np=8, Nt=500)
+        self.kwargs = {'timeStep': 0.05, 'nSnaps': 2, 'it_range': (0, 520), 'verbose': False}
+        self.ref = calculator(self.ctx)
+        self.ref.calculate_spectrum(self.tracks, **self.kwargs)
+
+    def assertSameResult(self, calc):
+        for key, arr in self.ref.Data['radiation'].items():
+            np.testing.assert_allclose(calc.Data['radiation'][key], arr, rtol=1e-12)
+        self.assertAlmostEqual(calc.total_weight, self.ref.total_weight)
+
+    def test_resume_after_interrupt(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            calc = calculator(self.ctx)
+            process_local, calls = calc._process_local, []
+
+            def failing(*args):
+                if len(calls) == 3:
+                    raise Interrupt
+                calls.append(1)
+                process_local(*args)
+
+            calc._process_local = failing
+            with self.assertRaises(Interrupt):
+                calc.calculate_spectrum(self.tracks, checkpoint=tmp, checkpoint_interval=0., **self.kwargs)
+
+            resumed = calculator(self.ctx)
+            resumed.calculate_spectrum(self.tracks, checkpoint=tmp, resume=tmp, **self.kwargs)
+            self.assertSameResult(resumed)
+
+            # 已经完成的检查点：什么都不用再算
+            again = calculator(self.ctx)
+            again._process_local = None
+            again.calculate_spectrum(self.tracks, resume=tmp, **self.kwargs)
+            self.assertSameResult(again)
+
+            with self.assertRaises(ValueError):
+                calculator(self.ctx).calculate_spectrum(self.tracks, resume=tmp, **dict(self.kwargs, nSnaps=3))
+
+    def test_accumulate(self):
+        calc = calculator(self.ctx)
+        calc.calculate_spectrum(self.tracks[:5], **self.kwargs)
+        calc.calculate_spectrum(self.tracks[5:], accumulate=True, **self.kwargs)
+        self.assertSameResult(calc)
+
+        with self.assertRaises(ValueError):
+            calc.calculate_spectrum(self.tracks, accumulate=True, **dict(self.kwargs, nSnaps=3))
+
+
+class TestCheckpointHost(CheckpointMixin, unittest.TestCase):
+    ctx = 'host'
+
+
+@requires_opencl
+class TestCheckpointOpenCL(CheckpointMixin, unittest.TestCase):
+    ctx = 'cpu'
+
+
+if __name__ == '__main__':
+    unittest.main()
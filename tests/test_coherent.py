@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+
+"""Args['coherent']: complex field accumulation and the coherent spectrum."""
+
+
+import unittest
+
+import numpy as np
+
+from .helpers import long_track, radiator, requires_opencl, spectrum
+
+
+def coherent(tracks, mode='far', calc=None, **kwargs):
+    kwargs.setdefault('coherent', True)
+    return spectrum(tracks, mode=mode, calc=calc, nSnaps=2, **kwargs)
+
+
+@requires_opencl
+class TestCoherent(unittest.TestCase):
+
+    def test_single_particle(self):
+        # 一个粒子：相干谱等于非相干谱，total 与不开相干模式时逐位相同
+        for mode in ('far', 'near'):
+            calc = coherent(long_track(Nt=1500), mode)
+            radiation = calc.Data['radiation']
+            self.assertEqual(set(radiation), {'total', 'coherent'})
+            self.assertEqual(calc.Data['field'].shape, radiation['total'].shape + (3,))
+            np.testing.assert_allclose(radiation['coherent'], radiation['total'], rtol=1e-10)
+            ref = coherent(long_track(Nt=1500), mode, coherent=False).Data['radiation']['total']
+            np.testing.assert_array_equal(radiation['total'], ref)
+
+    def test_identical_particles(self):
+        # 两个相同的粒子：振幅相加，相干谱为 4 倍，非相干谱为 2 倍
+        single = coherent(long_track(Nt=1500)).Data['radiation']
+        pair = coherent(long_track(Nt=1500) * 2).Data['radiation']
+        np.testing.assert_allclose(pair['coherent'], 4 * single['coherent'], rtol=1e-12)
+        np.testing.assert_allclose(pair['total'], 2 * single['total'], rtol=1e-12)
+
+        # 分两次计算（accumulate）加的是复场
+        calc = coherent(long_track(Nt=1500))
+        coherent(long_track(Nt=1500), calc=calc)
+        np.testing.assert_allclose(calc.Data['radiation']['coherent'], pair['coherent'], rtol=1e-12)
+
+    def test_form_factor(self):
+        sigma = 0.002
+        point = coherent(long_track(Nt=1500))
+        bunch = coherent(long_track(Nt=1500), sigma_particle=sigma)
+        omega = np.asarray(point.Args['omega'], dtype=np.double)
+        ff2 = np.exp(-(2 * np.pi * omega * sigma) ** 2)[None, :, None, None]
+        np.testing.assert_allclose(bunch.Data['radiation']['coherent'],
+                                   ff2 * point.Data['radiation']['coherent'], rtol=1e-10)
+        np.testing.assert_array_equal(bunch.Data['radiation']['total'], point.Data['radiation']['total'])
+
+    def test_invalid(self):
+        for extra in ({'batchSize': 2}, {'components': 'cartesian'}, {'dtype': 'mixed'},
+                      {'Features': ['phaseRecurrence']}, {'nodesPerItem': 2}):
+            with self.assertRaises(ValueError):
+                radiator(coherent=True, **extra)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+
+"""Fused total + component spectra (Args['components'])."""
+
+
+import unittest
+
+import numpy as np
+
+from .helpers import helical_tracks, requires_opencl, spectrum
+
+
+def spectra(mode, components, ctx='cpu', **kwargs):
+    calc = spectrum(helical_tracks(Np=3, Nt=400), (24, 5, 3), mode, 'broad', ctx=ctx, components=components,
+                    **kwargs)
+    return calc.Data['radiation']
+
+
+@requires_opencl
+class TestComponents(unittest.TestCase):
+
+    def _check(self, mode, components, keys):
+        ref = spectra(mode, None)['total']
+        for kwargs in ({}, {'nSnaps': 3, 'it_range': (0, 500)}):
+            if kwargs:
+                ref = spectra(mode, None, **kwargs)['total']
+            res = spectra(mode, components, **kwargs)
+            host = spectra(mode, components, ctx='host', **kwargs)
+
+            self.assertEqual(sorted(res), sorted(('total',) + keys))
+            np.testing.assert_allclose(res['total'], ref, rtol=1e-12)
+            np.testing.assert_allclose(sum(res[key] for key in keys), res['total'], rtol=1e-10)
+            for key in keys:
+                np.testing.assert_allclose(host[key], res[key], rtol=1e-9, atol=1e-12 * ref.max())
+
+    def test_far_cartesian(self):
+        self._check('far', 'cartesian', ('x', 'y', 'z'))
+
+    def test_far_spheric(self):
+        self._check('far', 'spheric', ('r', 'theta', 'phi'))
+
+    def test_near_cartesian(self):
+        self._check('near', 'cartesian', ('x', 'y', 'z'))
+
+    def test_invalid(self):
+        from fourier_radiator import RadiationConfig
+
+        grid = [(0.01, 1.), (0, 0.1), (0, 1.), (8, 2, 2)]
+        for args in ({'components': 'polar'},
+                     {'components': 'spheric', 'mode': 'near'},
+                     {'components': 'cartesian', 'batchSize': 4}):
+            with self.assertRaises(ValueError):
+                RadiationConfig(dict(args, grid=grid))
+
+
+if __name__ == '__main__':
+    unittest.main()
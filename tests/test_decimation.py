@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+
+"""Multi-resolution trajectory decimation (decimationTolerance)."""
+
+
+import unittest
+
+import numpy as np
+
+from .helpers import helical_tracks, requires_opencl, spectrum
+
+
+def decimated(**args):
+    calc = spectrum(helical_tracks(Np=3, Nt=1200), grid=[(0.001, 1.5), (0, 0.2), (0, 2 * np.pi), (32, 4, 2)],
+                    Features=['logGrid'], nSnaps=3, it_range=(0, 1100), **args)
+    return calc.Data['radiation']['total']
+
+
+@requires_opencl
+class TestDecimation(unittest.TestCase):
+
+    def test_fine_level_is_exact(self):
+        # 容差小到任何抽取层都不可用时，结果与 total kernel 完全一致
+        np.testing.assert_allclose(decimated(decimationTolerance=1e-12), decimated(), rtol=1e-12)
+
+    def test_error_follows_tolerance(self):
+        ref = decimated()
+        errors = [np.abs(decimated(decimationTolerance=tol) - ref).max() / ref.max()
+                  for tol in (0.02, 0.2)]
+        self.assertLess(errors[0], 0.02)
+        self.assertLess(errors[0], errors[1])
+
+    def test_invalid(self):
+        from fourier_radiator import RadiationConfig
+
+        grid = [(0.01, 1.), (0, 0.1), (0, 1.), (8, 2, 2)]
+        for args in ({'decimationTolerance': 0.1, 'mode': 'near'},
+                     {'decimationTolerance': 4.},
+                     {'decimationTolerance': 0.1, 'components': 'cartesian'}):
+            with self.assertRaises(ValueError):
+                RadiationConfig(dict(args, grid=grid))
+
+
+if __name__ == '__main__':
+    unittest.main()
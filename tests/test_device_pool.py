@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+
+"""Multi-device pool: dynamic scheduling and summation of per-device spectra."""
+
+
+import time
+import unittest
+
+import numpy as np
+
+from fourier_radiator.device_pool import DevicePool
+
+from .helpers import helical_tracks, requires_opencl, spectrum
+
+
+class FakeWorker:
+    """按 seconds_per_step 休眠的假设备，记录领到的轨迹"""
+
+    def __init__(self, name, seconds_per_step):
+        self.name = name
+        self.seconds_per_step = seconds_per_step
+        self.tracks = []
+
+    def process(self, particleTracks, weights, nSnaps, it_range, progress=None):
+        for track in particleTracks:
+            time.sleep(len(track[0]) * self.seconds_per_step)
+            self.tracks.append(track[7])
+            progress(1)
+
+    def finish(self):
+        pass
+
+
+class TestScheduling(unittest.TestCase):
+
+    def test_throughput_balance(self):
+        tracks = [(np.zeros(100),) * 6 + (1.0, i) for i in range(60)]
+        fast, slow = FakeWorker('fast', 2e-6), FakeWorker('slow', 8e-6)
+        done = []
+
+        pool = DevicePool([fast, slow])
+        pool.process(tracks, np.ones(len(tracks)), 1, None, progress=done.append)
+
+        self.assertEqual(sorted(fast.tracks + slow.tracks), list(range(60)))
+        self.assertEqual(sum(done), 60)
+        self.assertGreater(len(fast.tracks), 2 * len(slow.tracks))
+        self.assertEqual([stat['tracks'] for stat in pool.stats], [len(fast.tracks), len(slow.tracks)])
+
+
+@requires_opencl
+class TestDevicePool(unittest.TestCase):
+
+    def test_matches_single_device(self):
+        import pyopencl as cl
+
+        device = [dev for plat in cl.get_platforms() for dev in plat.get_devices()][0]
+        tracks = helical_tracks(Np=6, Nt=600)
+
+        def pooled(ctx, **args):
+            calc = spectrum(tracks, (16, 4, 2), axes='broad', ctx=ctx, nSnaps=2, it_range=(0, 700), **args)
+            self.assertEqual(len(calc.workers), 1 if ctx == 'cpu' else 2)
+            return calc.Data['radiation']['total']
+
+        ref = pooled('cpu')
+        # 同一设备上的两个 context 组成设备池
+        np.testing.assert_allclose(pooled([device, device]), ref, rtol=1e-12)
+        np.testing.assert_allclose(pooled([device, device], batchSize=2), ref, rtol=1e-12)
+
+    def test_invalid(self):
+        from fourier_radiator import RadiationConfig
+
+        with self.assertRaises(ValueError):
+            RadiationConfig({'grid': [(0.01, 1.), (0, 0.1), (0, 1.), (8, 2, 2)],
+                             'ctx': 'all', 'Features': ['nufft']})
+
+
+if __name__ == '__main__':
+    unittest.main()
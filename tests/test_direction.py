@@ -0,0 +1,31 @@
+#!/usr/bin/env python
+
+"""Direction-major far-field kernel (Features=['directionMajor'])."""
+
+
+import unittest
+
+import numpy as np
+
+from .helpers import long_track, requires_opencl, spectrum
+
+
+@requires_opencl
+class TestDirectionMajor(unittest.TestCase):
+
+    def test_matches_total(self):
+        # 方向项在工作组内共享，每个频率的求和与 total 逐位相同；
+        # nOmega=13 时 WGS=4 留下不完整的频率块，WGS=256 时整个方向一个工作组
+        ref = spectrum(long_track(Nt=1500), nSnaps=2).Data['radiation']['total']
+        for wgs in (4, 256):
+            calc = spectrum(long_track(Nt=1500), nSnaps=2, Features=['directionMajor'], WGS=wgs)
+            np.testing.assert_array_equal(calc.Data['radiation']['total'], ref)
+
+    def test_invalid(self):
+        from fourier_radiator import RadiationConfig
+
+        grid = [(0.01, 1.), (0, 0.1), (0, 1.), (8, 2, 2)]
+        with self.assertRaises(ValueError):
+            RadiationConfig({'grid': grid, 'mode': 'near', 'Features': ['directionMajor']})
+        with self.assertRaises(ValueError):
+            RadiationConfig({'grid': grid, 'Features': ['directionMajor', 'localTiling']})
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+
+"""Result fetch (layout, pinned staging, preallocated out) and Args['reductions']."""
+
+
+import unittest
+
+import numpy as np
+
+from .helpers import long_track, radiator, requires_opencl, spectrum
+
+ALL = ('spectrum', 'angular', 'energy', 'peak')
+
+
+def pair(mode='far', calc=None, **kwargs):
+    return spectrum(long_track(Nt=1500) * 2, (13, 5, 4), mode, calc=calc, nSnaps=2, **kwargs)
+
+
+def assert_reduced(test, reduced, ref):
+    for name in ('spectrum', 'angular', 'energy'):
+        np.testing.assert_allclose(reduced[name], ref[name], rtol=1e-12)
+    test.assertEqual(reduced['peak_index'].tolist(), ref['peak_index'].tolist())
+    np.testing.assert_array_equal(reduced['peak'], ref['peak'])
+
+
+@requires_opencl
+class TestFetch(unittest.TestCase):
+
+    def test_layout(self):
+        ref = pair().Data['radiation']['total']
+        device = pair(fetchLayout='device', pinnedFetch=True).Data['radiation']['total']
+        np.testing.assert_array_equal(device.swapaxes(-1, -3), ref)
+
+        # 预分配的数组直接作为结果
+        out = {'total': np.empty(ref.shape)}
+        calc = pair(out=out, pinnedFetch=True)
+        self.assertIs(calc.Data['radiation']['total'], out['total'])
+        np.testing.assert_array_equal(out['total'], ref)
+        with self.assertRaises(ValueError):
+            pair(out={'total': np.empty(ref.shape, dtype=np.single)})
+
+    def test_reductions(self):
+        from fourier_radiator.reductions import host_reduce
+
+        for mode in ('far', 'near'):
+            calc = pair(mode)
+            ref = host_reduce(calc.Data['radiation']['total'], calc.Args, ALL, 'grid')
+            np.testing.assert_allclose(ref['energy'], np.trapezoid(ref['spectrum'], calc.Args['omega']))
+            for extra in ({}, {'fetchSpectrum': False}, {'gridTiles': 3}):
+                reduced = pair(mode, reductions=ALL, **extra).Data['reduced']['total']
+                assert_reduced(self, reduced, ref)
+
+        # accumulate：积分相加，峰值由相加后的谱求
+        calc = pair(reductions=ALL)
+        pair(reductions=ALL, calc=calc)
+        ref = host_reduce(calc.Data['radiation']['total'], calc.Args, ALL, 'grid')
+        assert_reduced(self, calc.Data['reduced']['total'], ref)
+
+    def test_invalid(self):
+        for extra in ({'fetchLayout': 'phi_first'}, {'reductions': ['power']}, {'fetchSpectrum': False},
+                      {'fetchSpectrum': False, 'reductions': ALL, 'coherent': True}):
+            with self.assertRaises(ValueError):
+                radiator((13, 5, 4), **extra)
+
+        calc = pair(reductions=('peak',), fetchSpectrum=False)
+        with self.assertRaises(ValueError):
+            pair(calc=calc)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+
+"""End-to-end accuracy of calculate_spectrum against analytic helical-undulator spectra."""
+
+
+import unittest
+
+import numpy as np
+
+from .benchmarks.reference import Helix, snap_durations
+from .helpers import radiator, requires_opencl
+
+
+def on_axis_error(mode, dtype, ctx, Np=2, Nt=2000, nSnaps=2, dt=0.05, L=1e6):
+    helix = Helix()
+    grid_2 = (0, 0.01) if mode == 'far' else (0, 1.)
+    calc = radiator(mode=mode, grid=[(0.8 * helix.omega_1, 1.2 * helix.omega_1), grid_2, (0, 2 * np.pi), (41, 2, 2)],
+                    dtype=dtype, ctx=ctx)
+    calc.calculate_spectrum(helix.tracks(Np, Nt, dt), timeStep=dt, L_screen=L, nSnaps=nSnaps, verbose=False)
+
+    omega = np.asarray(calc.Args['omega'], dtype=np.double)
+    error = 0.
+    for iSnap, T in enumerate(snap_durations(Nt, nSnaps, dt)):
+        ref = helix.far_on_axis(omega, T) if mode == 'far' else helix.near_on_axis(omega, T, L)
+        result = calc.Data['radiation']['total'][iSnap, :, 0, :]
+        error = max(error, np.abs(result - Np * ref[:, None]).max() / (Np * ref.max()))
+    return error
+
+
+class TestAnalyticSpectrum(unittest.TestCase):
+    """
+    误差来自离散化：有限差分加速度 ~dt^2/12，左矩形求和的端点项 ~dt/T
+    （近场的速度形式更明显），近场另有 1/R 变化 ~z/L_screen
+    """
+
+    def test_host_backend(self):
+        self.assertLess(on_axis_error('far', 'double', 'host'), 5e-4)
+
+    @requires_opencl
+    def test_far(self):
+        for dtype, tol in (('double', 5e-4), ('mixed', 5e-4), ('float', 5e-3)):
+            self.assertLess(on_axis_error('far', dtype, 'cpu'), tol, dtype)
+
+    @requires_opencl
+    def test_near(self):
+        for dtype in ('double', 'mixed'):
+            self.assertLess(on_axis_error('near', dtype, 'cpu', Nt=4000), 1.5e-3, dtype)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+
+"""Spectral-grid decomposition (RadiationConfig.restrict_grid / gridDecomposition)."""
+
+
+import unittest
+
+import numpy as np
+
+from fourier_radiator import OpenCLEnvironment, RadiationConfig, RadiationDataManager
+from fourier_radiator.numpy_backend import NumpyParticleProcessor
+
+from .helpers import helical_tracks
+
+
+def host_spectrum(config, tracks):
+    config.get_args()['timeStep'] = config.get_phase_dtype()(0.05)
+    data_mgr = RadiationDataManager(config, OpenCLEnvironment(0, 'host'))
+    data_mgr.prepare_radiation(sigma_particle=0., nSnaps=np.uint32(2))
+    processor = NumpyParticleProcessor(config)
+    data = data_mgr.get_data()
+    for track in tracks:
+        processor.process_track(processor.track_to_device(track), data, None, 2)
+    data_mgr.fetch_results()
+    return data['radiation']['total']
+
+
+class TestGridDecomposition(unittest.TestCase):
+
+    def setUp(self):
+        self.config = RadiationConfig({'grid': [(0.01, 1.5), (0, 0.2), (0, 2 * np.pi), (13, 5, 4)],
+                                       'dtype': 'double', 'Features': ['logGrid']})
+
+    def test_split(self):
+        self.assertEqual(self.config.split_grid('omega', 3), [(0, 4), (4, 9), (9, 13)])
+
+        sub = self.config.restrict_grid('theta', 1, 3)
+        self.assertEqual(sub.get_args()['gridNodeNums'], (13, 2, 4))
+        self.assertEqual(sub.get_args()['numGridNodes'], 13 * 2 * 4)
+        np.testing.assert_array_equal(sub.get_args()['theta'], self.config.get_args()['theta'][1:3])
+        # 原配置不受影响
+        self.assertEqual(self.config.get_args()['gridNodeNums'], (13, 5, 4))
+
+    def test_slices_assemble_full_spectrum(self):
+        tracks = helical_tracks(Np=2, Nt=200)
+        full = host_spectrum(self.config, tracks)
+
+        # 谱的布局为 (nSnaps, nOmega, nTheta, nPhi)
+        for axis, data_axis in (('omega', 1), ('theta', 2), ('phi', 3)):
+            parts = [host_spectrum(self.config.restrict_grid(axis, start, stop), tracks)
+                     for start, stop in self.config.split_grid(axis, 3)]
+            np.testing.assert_allclose(np.concatenate(parts, axis=data_axis), full, rtol=1e-12)
+
+    def test_invalid(self):
+        grid = [(0.01, 1.), (0, 0.1), (0, 1.), (8, 2, 2)]
+        for args in ({'gridDecomposition': 'radius'},
+                     {'gridDecomposition': 'theta', 'mode': 'near'},
+                     {'gridDecomposition': 'snaps'}):
+            with self.assertRaises(ValueError):
+                RadiationConfig(dict(args, grid=grid))
+
+
+if __name__ == '__main__':
+    unittest.main()
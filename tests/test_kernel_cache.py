@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+
+"""Kernel program cache: in-process and on-disk tiers, corrupt files and eviction."""
+
+
+import gc
+import glob
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from fourier_radiator import compiler
+from fourier_radiator.main import src_path
+
+from .helpers import long_track, radiator, requires_opencl, spectrum
+
+
+def status(calc):
+    return [worker.compiler.cache_status for worker in calc.workers]
+
+
+@requires_opencl
+class TestKernelCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        compiler._binary_cache.clear()
+        gc.collect()
+
+    def binaries(self):
+        return glob.glob(os.path.join(self.tmp.name, '*.bin'))
+
+    def test_hit_and_miss(self):
+        calc = radiator(kernelCacheDir=self.tmp.name)
+        self.assertEqual(status(calc), ['build'])
+        self.assertEqual(len(self.binaries()), 1)
+
+        # 同一个 context 上仍在使用的 Program 直接复用
+        again = compiler.KernelCompiler('far', 'double', calc.env.get_context(), src_path,
+                                        cache_dir=self.tmp.name)
+        self.assertEqual(again.cache_status, 'memory')
+        self.assertIs(again.program, calc.workers[0].compiler.program)
+
+        # 新的 context：进程内的二进制；清空后从磁盘读取
+        self.assertEqual(status(radiator(kernelCacheDir=self.tmp.name)), ['memory'])
+        compiler._binary_cache.clear()
+        self.assertEqual(status(radiator(kernelCacheDir=self.tmp.name)), ['disk'])
+        # 其他 kernel 参数（omegaBlock）是另一个缓存项
+        self.assertEqual(status(radiator(kernelCacheDir=self.tmp.name, omegaBlock=4)), ['build'])
+        self.assertEqual(len(self.binaries()), 2)
+
+    def test_program_does_not_outlive_instance(self):
+        calc = radiator(kernelCacheDir=self.tmp.name)
+        n = len(compiler._program_cache)
+        del calc
+        gc.collect()
+        self.assertEqual(len(compiler._program_cache), n - 1)
+
+    def test_corrupt_file(self):
+        ref = spectrum(long_track(Nt=1000), kernelCacheDir=self.tmp.name).Data['radiation']['total']
+        path, = self.binaries()
+        for data in (b'', b'\x01' + b'\x00' * 7 + b'garbage', os.urandom(4096)):
+            with open(path, 'wb') as f:
+                f.write(data)
+            compiler._binary_cache.clear()
+            calc = spectrum(long_track(Nt=1000), kernelCacheDir=self.tmp.name)
+            self.assertEqual(status(calc), ['build'])
+            np.testing.assert_array_equal(calc.Data['radiation']['total'], ref)
+            # 重新编译后覆盖了损坏的文件
+            compiler._binary_cache.clear()
+            self.assertEqual(status(radiator(kernelCacheDir=self.tmp.name)), ['disk'])
+
+    def test_eviction(self):
+        for omega_block in (8, 4, 2):
+            radiator(kernelCacheDir=self.tmp.name, omegaBlock=omega_block)
+        paths = self.binaries()
+        sizes = {path: os.path.getsize(path) for path in paths}
+        os.utime(paths[1], (1, 1))  # 最久未用
+
+        # 超出上限时删去最久未用的，直到不超过上限
+        compiler.prune_cache_dir(self.tmp.name, sum(sizes.values()) - 1)
+        self.assertEqual(sorted(self.binaries()), sorted(paths[:1] + paths[2:]))
+
+        # 刚写入的二进制即使本身超过上限也保留
+        radiator(kernelCacheDir=self.tmp.name, kernelCacheSize=0, omegaBlock=1)
+        self.assertEqual(len(self.binaries()), 1)
+        self.assertNotIn(self.binaries()[0], paths)
+
+    def test_invalid(self):
+        from fourier_radiator import RadiationConfig
+
+        with self.assertRaises(ValueError):
+            RadiationConfig({'grid': [(0.01, 1.), (0, 0.1), (0, 1.), (8, 2, 2)], 'kernelCacheSize': -1})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+
+"""Cost model and LPT partitioning of tracks between MPI ranks."""
+
+
+import tempfile
+import unittest
+
+import numpy as np
+
+from fourier_radiator import TrackStore
+from fourier_radiator.load_balance import partition_lpt, select_tracks, track_costs
+
+from .helpers import helical_tracks
+
+
+class TestLoadBalance(unittest.TestCase):
+
+    def test_track_costs(self):
+        tracks = helical_tracks(Np=4, Nt=400)  # 长度 400, 350, 300, 250，it_start 0, 2, 4, 6
+        np.testing.assert_array_equal(track_costs(tracks), [401, 351, 301, 251])
+        np.testing.assert_array_equal(track_costs(tracks, it_range=(0, 320), n_nodes=2),
+                                      2 * np.array([321, 319, 301, 251]))
+
+        with tempfile.TemporaryDirectory() as tmp:
+            store = TrackStore.write(tmp, tracks)
+            np.testing.assert_array_equal(track_costs(store[1:]), track_costs(tracks[1:]))
+            self.assertEqual(len(select_tracks(store, np.array([0, 3]))), 2)
+
+    def test_partition(self):
+        # LWFA 数据中轨迹长度相差几个数量级
+        rng = np.random.default_rng(1)
+        costs = np.exp(rng.uniform(0, 7, 500))
+        n_parts = 7
+
+        parts = partition_lpt(costs, n_parts)
+        np.testing.assert_array_equal(np.sort(np.concatenate(parts)), np.arange(costs.size))
+
+        loads = [costs[part].sum() for part in parts]
+        round_robin = [costs[rank::n_parts].sum() for rank in range(n_parts)]
+        # LPT 的最大负载不超过 4/3 最优，而最优不小于平均负载与最大单个任务
+        self.assertLessEqual(max(loads), 4 / 3 * max(costs.sum() / n_parts, costs.max()))
+        self.assertLess(max(loads) - min(loads), max(round_robin) - min(round_robin))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+
+"""Far-field kernel with trajectory tiles in local memory (Features=['localTiling'])."""
+
+
+import unittest
+
+import numpy as np
+
+from .helpers import helical_tracks, long_track, requires_opencl, spectrum
+
+
+@requires_opencl
+class TestLocalTiling(unittest.TestCase):
+
+    def test_matches_total(self):
+        # 轨迹按 WGS 步一块载入 local memory，1500 步不是 WGS 的整数倍（最后一块不完整）；
+        # 网格节点数 78 不是 WGS 的整数倍（最后一个工作组有空闲的 work-item）
+        ref = spectrum(long_track(Nt=1500), nSnaps=2).Data['radiation']['total']
+        for wgs in (16, 64):
+            calc = spectrum(long_track(Nt=1500), nSnaps=2, Features=['localTiling'], WGS=wgs)
+            np.testing.assert_allclose(calc.Data['radiation']['total'], ref, rtol=1e-12)
+
+    def test_it_range(self):
+        tracks = helical_tracks(Np=3, Nt=600)
+        kwargs = {'nSnaps': 3, 'it_range': (0, 650)}
+        ref = spectrum(tracks, (24, 5, 3), axes='broad', **kwargs).Data['radiation']['total']
+        calc = spectrum(tracks, (24, 5, 3), axes='broad', Features=['localTiling'], WGS=32, **kwargs)
+        np.testing.assert_allclose(calc.Data['radiation']['total'], ref, rtol=1e-12)
+
+    def test_components(self):
+        # total_comps_tiled 与 total_comps 的总谱和分量一致
+        tracks = helical_tracks(Np=3, Nt=600)
+        kwargs = {'nSnaps': 3, 'it_range': (0, 650)}
+        for components in ('cartesian', 'spheric'):
+            ref = spectrum(tracks, (24, 5, 3), axes='broad', components=components, **kwargs).Data['radiation']
+            calc = spectrum(tracks, (24, 5, 3), axes='broad', components=components,
+                            Features=['localTiling'], WGS=32, **kwargs).Data['radiation']
+            self.assertEqual(sorted(calc), sorted(ref))
+            for key in ref:
+                np.testing.assert_allclose(calc[key], ref[key], rtol=1e-12, atol=1e-14 * ref['total'].max())
+
+    def test_invalid(self):
+        from fourier_radiator import RadiationConfig
+
+        grid = [(0.01, 1.), (0, 0.1), (0, 1.), (8, 2, 2)]
+        for args in ({'mode': 'near'}, {'batchSize': 4}, {'components': 'cartesian', 'batchSize': 4}):
+            with self.assertRaises(ValueError):
+                RadiationConfig(dict(args, grid=grid, Features=['localTiling']))
+
+
+if __name__ == '__main__':
+    unittest.main()
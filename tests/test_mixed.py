@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+
+"""dtype='mixed': double-precision phase with single-precision accumulation."""
+
+
+import unittest
+
+import numpy as np
+
+from .helpers import long_track, requires_opencl, spectrum
+
+
+def total(mode, dtype, ctx='cpu'):
+    # 第一谐波附近，推迟时间 t - n.x 是两个大数之差
+    return spectrum(long_track(), (32, 3, 2), mode, dtype=dtype, ctx=ctx).Data['radiation']['total']
+
+
+@requires_opencl
+class TestMixedPrecision(unittest.TestCase):
+
+    def _compare(self, mode):
+        ref = total(mode, 'double')
+        err = {dtype: np.abs(total(mode, dtype) - ref).max() / ref.max()
+               for dtype in ('mixed', 'float')}
+        self.assertLess(err['mixed'], 1e-5)
+        self.assertLess(err['mixed'], 0.01 * err['float'])
+
+    def test_far(self):
+        self._compare('far')
+
+    def test_near(self):
+        self._compare('near')
+
+    def test_host_backend(self):
+        ref = total('far', 'double')
+        np.testing.assert_allclose(total('far', 'mixed', ctx='host'), ref, rtol=1e-6, atol=1e-12 * ref.max())
+
+    def test_invalid(self):
+        from fourier_radiator import RadiationConfig
+
+        with self.assertRaises(ValueError):
+            RadiationConfig({'grid': [(0.01, 1.), (0, 0.1), (0, 1.), (8, 2, 2)],
+                             'dtype': 'mixed', 'batchSize': 4})
+
+
+if __name__ == '__main__':
+    unittest.main()
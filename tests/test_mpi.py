@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+
+"""MPI paths under mpiexec -n 2 (skipped when mpi4py or mpiexec is missing)."""
+
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+
+from .helpers import helical_tracks, opencl_available
+from .mpi_cases import ALL, run
+
+try:
+    import mpi4py  # noqa: F401
+    mpi_available = shutil.which('mpiexec') is not None
+except ImportError:
+    mpi_available = False
+
+# 作业相关的变量：本进程 import fourier_radiator 时已经 MPI_Init（C 层 setenv，os.environ 中看不到，
+# 但默认会被子进程继承），mpiexec 看到它们会直接以 rc 1 退出；用户的设置（OMPI_ALLOW_RUN_AS_ROOT 等）保留
+MPI_JOB_VARS = ('PMIX_', 'ORTE_', 'OMPI_COMM_WORLD_', 'OMPI_MCA_ess', 'OMPI_MCA_orte_', 'OMPI_MCA_pmix',
+                'OMPI_APP_CTX_', 'OMPI_FILE_LOCATION', 'OMPI_UNIVERSE_SIZE', 'OMPI_FIRST_RANKS')
+
+
+def mpiexec_env():
+    """显式传给 mpiexec 的环境：os.environ 去掉作业变量；核数少于 2 时允许超额（Open MPI）"""
+    env = {key: value for key, value in os.environ.items() if not key.startswith(MPI_JOB_VARS)}
+    env.setdefault('OMPI_MCA_rmaps_base_oversubscribe', '1')
+    return env
+
+
+@unittest.skipUnless(mpi_available and opencl_available, "needs mpi4py, mpiexec and an OpenCL device")
+class TestMPI(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        path = os.path.join(cls.tmp.name, 'mpi.npz')
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        proc = subprocess.run(['mpiexec', '-n', '2', sys.executable, '-m', 'tests.mpi_cases', path],
+                              cwd=root, env=mpiexec_env(), capture_output=True, text=True, timeout=600)
+        if proc.returncode != 0:
+            raise AssertionError(f"mpiexec failed:\n{proc.stdout}\n{proc.stderr}")
+        cls.results = dict(np.load(path))
+
+        # 单进程的参考结果
+        tracks = helical_tracks(Np=6, Nt=500)
+        cls.ref = run(tracks, reductions=ALL)
+        cls.ref_components = run(tracks, components='cartesian', reductions=ALL)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp.cleanup()
+
+    def test_particle_split(self):
+        ref = self.ref.Data
+        for load_balance in ('cost', 'dynamic', 'round_robin'):
+            np.testing.assert_allclose(self.results[f'split_{load_balance}'], ref['radiation']['total'],
+                                       rtol=1e-12)
+            np.testing.assert_allclose(self.results[f'split_{load_balance}_energy'],
+                                       ref['reduced']['total']['energy'], rtol=1e-12)
+            self.assertAlmostEqual(float(self.results[f'split_{load_balance}_weight']), self.ref.total_weight)
+
+    def test_allreduce(self):
+        for key, arr in self.ref_components.Data['radiation'].items():
+            np.testing.assert_allclose(self.results[f'allreduce_{key}'], arr, rtol=1e-12)
+
+    def test_grid_decomposition_with_broadcast(self):
+        ref = self.ref_components.Data
+        for axis in ('omega', 'phi'):
+            for key, arr in ref['radiation'].items():
+                np.testing.assert_allclose(self.results[f'grid_{axis}_{key}'], arr, rtol=1e-12)
+            for name in ('spectrum', 'angular', 'energy', 'peak'):
+                np.testing.assert_allclose(self.results[f'grid_{axis}_{name}'], ref['reduced']['total'][name],
+                                           rtol=1e-12)
+
+    def test_work_queue(self):
+        np.testing.assert_array_equal(self.results['queue'], np.arange(37))
+
+
+if __name__ == '__main__':
+    unittest.main()
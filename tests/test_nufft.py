@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+
+"""Type-3 NUFFT (nufft.nufft3) and the NUFFT far-field engine (Features=['nufft'])."""
+
+
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from fourier_radiator import nufft
+
+from .helpers import helical_tracks, long_track, requires_opencl, spectrum
+
+
+def direct(x, c, s):
+    return np.exp(1j * np.outer(s, x)) @ c
+
+
+class TestNufft3(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        # 点集不以 0 为中心，X*S 远大于 1，x.size * s.size 超过 direct_limit：走网格化路径
+        self.x = np.sort(rng.uniform(-50., 450., 3000))
+        self.s = rng.uniform(-1., 4., 400)
+        self.c = rng.standard_normal((3000, 2)) + 1j * rng.standard_normal((3000, 2))
+        self.ref = direct(self.x, self.c, self.s)
+
+    def test_gridded_tolerance(self):
+        for eps in (1e-4, 1e-6, 1e-9, 1e-12):
+            with mock.patch.object(nufft, '_nufft3_gridded', wraps=nufft._nufft3_gridded) as gridded:
+                out = nufft.nufft3(self.x, self.c, self.s, eps=eps)
+            self.assertEqual(gridded.call_count, 1)
+            error = np.linalg.norm(out - self.ref) / np.linalg.norm(self.ref)
+            self.assertLess(error, eps, eps)
+
+    def test_shapes_and_direct_path(self):
+        out = nufft.nufft3(self.x, self.c[:, 0], self.s, eps=1e-12)
+        self.assertEqual(out.shape, self.s.shape)
+        np.testing.assert_allclose(out, self.ref[:, 0], rtol=0, atol=1e-10 * np.abs(self.ref).max())
+
+        # 点数少时直接求和
+        with mock.patch.object(nufft, '_nufft3_gridded') as gridded:
+            out = nufft.nufft3(self.x[:100], self.c[:100], self.s[:50])
+        gridded.assert_not_called()
+        np.testing.assert_allclose(out, direct(self.x[:100], self.c[:100], self.s[:50]), rtol=1e-12)
+
+        self.assertEqual(nufft.nufft3(self.x[:0], self.c[:0], self.s).shape, (400, 2))
+
+
+@requires_opencl
+class TestNufftBackend(unittest.TestCase):
+
+    def test_matches_total(self):
+        # 12000 步 × 13 个频率：每个方向都走网格化路径，误差随 nufftEps
+        ref = spectrum(long_track(), nSnaps=2).Data['radiation']['total']
+        for eps in (1e-12, 1e-6):
+            with mock.patch.object(nufft, '_nufft3_gridded', wraps=nufft._nufft3_gridded) as gridded:
+                calc = spectrum(long_track(), nSnaps=2, Features=['nufft'], nufftEps=eps)
+            self.assertGreater(gridded.call_count, 0)
+            result = calc.Data['radiation']['total']
+            self.assertEqual(result.shape, ref.shape)
+            self.assertLess(np.abs(result - ref).max() / ref.max(), 10 * eps, eps)
+
+    def test_snapshots(self):
+        tracks = helical_tracks(Np=3, Nt=600)
+        kwargs = {'nSnaps': 3, 'it_range': (0, 650)}
+        ref = spectrum(tracks, (24, 5, 3), axes='broad', **kwargs).Data['radiation']['total']
+        calc = spectrum(tracks, (24, 5, 3), axes='broad', Features=['nufft'], **kwargs)
+        np.testing.assert_allclose(calc.Data['radiation']['total'], ref, rtol=0, atol=1e-11 * ref.max())
+
+    def test_invalid(self):
+        from fourier_radiator import RadiationConfig
+
+        grid = [(0.01, 1.), (0, 0.1), (0, 1.), (8, 2, 2)]
+        for args in ({'mode': 'near'}, {'ctx': 'all'}, {'batchSize': 4}):
+            with self.assertRaises(ValueError):
+                RadiationConfig(dict(args, grid=grid, Features=['nufft']))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+
+"""NumPy host backend (ctx='host', or no OpenCL device available)."""
+
+
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from fourier_radiator import opencl_env
+from fourier_radiator.numpy_backend import NumpyParticleProcessor
+
+from .helpers import helical_tracks, requires_opencl, spectrum
+
+
+class TestNumpyBackend(unittest.TestCase):
+
+    def setUp(self):
+        self.tracks = helical_tracks(Np=3, Nt=500)
+
+    @requires_opencl
+    def test_matches_total(self):
+        for mode in ('far', 'near'):
+            for kwargs in ({'nSnaps': 2}, {'nSnaps': 3, 'it_range': (0, 560)}):
+                ref = spectrum(self.tracks, (16, 4, 2), mode, 'broad', **kwargs).Data['radiation']['total']
+                # 分块（cpuChunkMB）只改变求和的划分
+                for chunk_mb in (64, 0.01):
+                    calc = spectrum(self.tracks, (16, 4, 2), mode, 'broad', ctx='host', cpuChunkMB=chunk_mb,
+                                    **kwargs)
+                    self.assertIsInstance(calc.workers[0].processor, NumpyParticleProcessor)
+                    np.testing.assert_allclose(calc.Data['radiation']['total'], ref, rtol=1e-10,
+                                               atol=1e-13 * ref.max())
+
+    def test_without_opencl_device(self):
+        # 找不到任何 OpenCL 设备（或没有安装 pyopencl）时退回 NumPy 后端
+        ref = spectrum(self.tracks, (16, 4, 2), axes='broad', ctx='host', nSnaps=2).Data['radiation']['total']
+        patches = [mock.patch.object(opencl_env, 'opencl_installed', False)]
+        if opencl_env.opencl_installed:
+            patches.append(mock.patch.object(opencl_env.cl, 'get_platforms', return_value=[]))
+        for patch in patches:
+            with patch:
+                calc = spectrum(self.tracks, (16, 4, 2), axes='broad', ctx=None, nSnaps=2)
+            self.assertIsNone(calc.env.get_context())
+            self.assertIsInstance(calc.workers[0].processor, NumpyParticleProcessor)
+            np.testing.assert_array_equal(calc.Data['radiation']['total'], ref)
+
+
+if __name__ == '__main__':
+    unittest.main()
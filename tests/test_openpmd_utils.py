@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+
+"""Streaming trajectory extraction from openPMD series (utils.iter_tracks / track_particles)."""
+
+
+import sys
+import tempfile
+import types
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import numpy as np
+from scipy.constants import m_e, c
+
+N_FILES, N_ITER = 3, 2
+PRESENT = {10: range(6), 11: range(6), 12: (0, 1, 2, 4, 5), 13: (1, 2, 3), 14: range(2, 6), 15: range(6)}
+
+
+def record(pid, step, name):
+    """第 step 步粒子 pid 的记录值"""
+    base = {'x': 1., 'y': 2., 'z': 3., 'ux': 4., 'uy': 5., 'uz': 6.}[name]
+    value = base * pid + 0.1 * step
+    return value * m_e * c if name.startswith('u') else value
+
+
+class Component:
+    def __init__(self, data):
+        self.data = data
+
+    def load_chunk(self):
+        return self.data
+
+
+class Series:
+    """openPMD Series 的最小替身：文件名 step_<i>.h5，每个文件 N_ITER 个 iteration"""
+
+    def __init__(self, path, access):
+        i_file = int(Path(path).stem.split('_')[1])
+        self.iterations = {}
+        for it in (100 * i_file + 10 * j for j in range(N_ITER)):
+            step = N_ITER * i_file + (it % 100) // 10
+            pid = np.array([p for p in PRESENT if step in PRESENT[p]], dtype=np.uint64)
+            pid = pid[np.random.default_rng(step).permutation(pid.size)]  # 每步的粒子顺序不同
+            records = {'id': {'scalar': Component(pid)},
+                       'weighting': {'scalar': Component(pid.astype(np.double) / 10)},
+                       'position': {}, 'momentum': {}}
+            for name, (rec, comp) in {'x': ('position', 'x'), 'y': ('position', 'y'), 'z': ('position', 'z'),
+                                      'ux': ('momentum', 'x'), 'uy': ('momentum', 'y'),
+                                      'uz': ('momentum', 'z')}.items():
+                records[rec][comp] = Component(np.array([record(p, step, name) for p in pid.tolist()]))
+            self.iterations[it] = types.SimpleNamespace(particles={'electrons': records})
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+openpmd_api = types.SimpleNamespace(
+    Series=Series, Access_Type=types.SimpleNamespace(read_only='r'),
+    Mesh_Record_Component=types.SimpleNamespace(SCALAR='scalar'))
+
+
+class TestOpenPMDTracks(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        with mock.patch.dict(sys.modules, {'openpmd_api': openpmd_api}):
+            sys.modules.pop('fourier_radiator.utils', None)
+            from fourier_radiator import utils
+        cls.utils = utils
+        cls.patch = mock.patch.object(utils, 'io', openpmd_api)
+        cls.patch.start()
+        cls.tmp = tempfile.TemporaryDirectory()
+        for i in range(N_FILES):
+            Path(cls.tmp.name, f'step_{i}.h5').touch()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.patch.stop()
+        cls.tmp.cleanup()
+
+    def expected(self, pid, steps):
+        coords = tuple(np.array([record(pid, k, name) / (m_e * c if name.startswith('u') else 1)
+                                 for k in steps]) for name in ('x', 'y', 'z', 'ux', 'uy', 'uz'))
+        return coords + (pid / 10, steps[0])
+
+    def assertTracks(self, tracks, expected):
+        self.assertEqual(len(tracks), len(expected))
+        for track, ref in zip(tracks, expected):
+            for a, b in zip(track[:6], ref[:6]):
+                np.testing.assert_allclose(a, b, rtol=1e-15)
+            self.assertEqual(track[6:], ref[6:])
+
+    def test_iter_tracks(self):
+        # 12 在第 3 步消失：分成两段；13 从第 1 步开始；16 不存在
+        expected = [self.expected(10, range(6)), self.expected(11, range(6)),
+                    self.expected(12, range(0, 3)), self.expected(12, range(4, 6)),
+                    self.expected(13, range(1, 4)), self.expected(14, range(2, 6))]
+        for chunk_size in (4096, 2, 1):
+            tracks = list(self.utils.iter_tracks(self.tmp.name, [14, 12, 10, 11, 13, 16], verbose=False,
+                                                 chunk_size=chunk_size))
+            self.assertTracks(tracks, expected)
+
+    def test_streaming(self):
+        # 第一块的轨迹在读取第二块之前给出
+        chunks = []
+        collect = self.utils._collect_tracks
+
+        def counting(steps, selected, *args):
+            chunks.append(selected.tolist())
+            return collect(steps, selected, *args)
+
+        with mock.patch.object(self.utils, '_collect_tracks', counting):
+            tracks = self.utils.iter_tracks(self.tmp.name, [10, 11, 13], verbose=False, chunk_size=2)
+            next(tracks)
+            self.assertEqual(chunks, [[10, 11]])
+            self.assertEqual(len(list(tracks)), 2)
+            self.assertEqual(chunks, [[10, 11], [13]])
+
+    def test_gaps(self):
+        with self.assertRaises(ValueError):
+            list(self.utils.iter_tracks(self.tmp.name, [10, 12], verbose=False, gaps='raise'))
+        with self.assertRaises(ValueError):
+            self.utils.track_particles(self.tmp.name, [10, 12])
+
+        tracks = self.utils.track_particles(self.tmp.name, [13, 10], chunk_size=1)
+        self.assertEqual(sorted(tracks), [10, 13])
+        ref = self.expected(13, range(1, 4))
+        np.testing.assert_allclose(tracks[13]['ux'], ref[3], rtol=1e-15)
+        self.assertEqual((tracks[13]['w'], tracks[13]['idx_start']), ref[6:])
+
+
+if __name__ == '__main__':
+    unittest.main()
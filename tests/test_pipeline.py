@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+
+"""Asynchronous track upload (Args['asyncTransfer']) through a reused TrackPipeline."""
+
+
+import unittest
+
+import numpy as np
+
+from .helpers import helical_tracks, requires_opencl, spectrum
+
+
+@requires_opencl
+class TestPipeline(unittest.TestCase):
+
+    def test_matches_blocking(self):
+        # 轨迹由短到长：暂存槽多次扩容（unmap 旧缓冲）
+        tracks = helical_tracks(Np=5, Nt=700)[::-1]
+        for mode in ('far', 'near'):
+            for kwargs in ({'nSnaps': 2}, {'nSnaps': 3, 'it_range': (0, 760)}):
+                ref = spectrum(tracks, (16, 4, 2), mode, 'broad', **kwargs).Data['radiation']['total']
+                calc = spectrum(tracks, (16, 4, 2), mode, 'broad', asyncTransfer=True, pipelineDepth=3, **kwargs)
+                np.testing.assert_array_equal(calc.Data['radiation']['total'], ref)
+
+    def test_reuse_and_release(self):
+        tracks = helical_tracks(Np=4, Nt=600)
+        ref = spectrum(tracks, (16, 4, 2), axes='broad').Data['radiation']['total']
+
+        calc = spectrum(tracks, (16, 4, 2), axes='broad', asyncTransfer=True)
+        worker = calc.workers[0]
+        pipeline = worker.pipeline
+        spectrum(tracks, calc=calc, accumulate=False)
+        self.assertIs(worker.pipeline, pipeline)
+        np.testing.assert_array_equal(calc.Data['radiation']['total'], ref)
+
+        calc.release_buffers()
+        self.assertIsNone(worker.pipeline)
+        self.assertTrue(all(not slot.mapped and not slot.buffers for slot in pipeline.slots))
+        spectrum(tracks, calc=calc, accumulate=False)
+        np.testing.assert_array_equal(calc.Data['radiation']['total'], ref)
+
+    def test_device_pool(self):
+        # 设备池按块调用 process：每个 worker 只建一个流水线
+        import pyopencl as cl
+
+        device = [dev for plat in cl.get_platforms() for dev in plat.get_devices()][0]
+        tracks = helical_tracks(Np=8, Nt=500)
+        ref = spectrum(tracks, (16, 4, 2), axes='broad', nSnaps=2).Data['radiation']['total']
+        calc = spectrum(tracks, (16, 4, 2), axes='broad', ctx=[device, device], asyncTransfer=True, nSnaps=2)
+        pipelines = [worker.pipeline for worker in calc.workers]
+        np.testing.assert_allclose(calc.Data['radiation']['total'], ref, rtol=1e-12)
+        spectrum(tracks, calc=calc, accumulate=False, nSnaps=2)
+        self.assertEqual([worker.pipeline for worker in calc.workers], pipelines)
+        np.testing.assert_allclose(calc.Data['radiation']['total'], ref, rtol=1e-12)
+
+
+if __name__ == '__main__':
+    unittest.main()
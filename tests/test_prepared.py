@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+
+"""Per-track preprocessing on the device (Features=['preparedTrack'])."""
+
+
+import unittest
+
+import numpy as np
+
+from .benchmarks.reference import Helix, snap_durations
+from .helpers import requires_opencl, spectrum
+
+
+def helix_spectrum(dt, Nt, it_range=None, **extra):
+    helix = Helix()
+    calc = spectrum(helix.tracks(2, Nt, dt), grid=[(0.8 * helix.omega_1, 1.2 * helix.omega_1), (0, 0.01),
+                                                   (0, 2 * np.pi), (21, 2, 2)],
+                    timeStep=dt, nSnaps=2, it_range=it_range, **extra)
+
+    omega = np.asarray(calc.Args['omega'], dtype=np.double)
+    T = snap_durations(Nt, 2, dt)[-1]
+    ref = 2 * helix.far_on_axis(omega, T)
+    result = calc.Data['radiation']['total']
+    return result, np.abs(result[-1, :, 0, :] - ref[:, None]).max() / ref.max()
+
+
+@requires_opencl
+class TestPreparedTrack(unittest.TestCase):
+
+    def test_matches_total(self):
+        # 不细分、不平滑时逐位相同（包括 it_range 与快照）
+        for it_range in (None, (0, 700)):
+            ref, _ = helix_spectrum(0.2, 600, it_range)
+            result, _ = helix_spectrum(0.2, 600, it_range, Features=['preparedTrack'])
+            np.testing.assert_array_equal(result, ref)
+
+    def test_upsample(self):
+        # Hermite 细分接近直接用 4 倍细的轨迹
+        _, coarse = helix_spectrum(0.2, 1000, Features=['preparedTrack'])
+        _, upsampled = helix_spectrum(0.2, 1000, Features=['preparedTrack'], trackUpsample=4)
+        _, fine = helix_spectrum(0.05, 3997)
+        self.assertLess(upsampled, 0.2 * coarse)
+        self.assertLess(upsampled, 2 * fine)
+
+    def test_invalid(self):
+        from fourier_radiator import RadiationConfig
+
+        grid = [(0.01, 1.), (0, 0.1), (0, 1.), (8, 2, 2)]
+        with self.assertRaises(ValueError):
+            RadiationConfig({'grid': grid, 'trackUpsample': 2})
+        with self.assertRaises(ValueError):
+            RadiationConfig({'grid': grid, 'mode': 'near', 'Features': ['preparedTrack']})
@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+
+"""Args['profiling']: per-stage timings, derived figures and trace export."""
+
+
+import json
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from .helpers import long_track, requires_opencl, spectrum
+
+
+def run(profiling, ctx='cpu', **extra):
+    return spectrum(long_track(Nt=2000) * 3, (16, 3, 2), ctx=ctx, profiling=profiling, **extra)
+
+
+@requires_opencl
+class TestProfiling(unittest.TestCase):
+
+    def test_report(self):
+        calc = run(True)
+        profile = calc.profile
+        self.assertEqual(profile.stages['kernel']['count'], 3)
+        self.assertEqual(profile.node_steps, 3 * 16 * 3 * 2 * 2000)
+        self.assertGreater(profile.kernel_throughput, 0)
+        self.assertEqual(profile.stages['upload']['bytes'], 3 * 6 * 2000 * 8)
+        self.assertEqual(profile.stages['fetch']['bytes'], 16 * 3 * 2 * 8)
+        self.assertIn(profile.bound, ('transfer', 'compute', 'launch'))
+        self.assertAlmostEqual(sum(profile.fractions.values()), 1.)
+        json.dumps(profile.to_dict())
+
+        # 计时不改变结果
+        np.testing.assert_array_equal(calc.Data['radiation']['total'],
+                                      run(False).Data['radiation']['total'])
+
+    def test_trace(self):
+        profile = run(True, asyncTransfer=True).profile
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'trace.json')
+            profile.export_trace(path)
+            with open(path) as f:
+                events = json.load(f)['traceEvents']
+        spans = [e for e in events if e['ph'] == 'X']
+        self.assertEqual({e['cat'] for e in spans}, {'cast', 'upload', 'kernel', 'fetch'})
+        self.assertTrue(all(e['dur'] >= 0 for e in spans))
+
+    def test_host_backend(self):
+        profile = run(True, ctx='host').profile
+        self.assertEqual(profile.stages['kernel']['count'], 3)
+        self.assertEqual(profile.stages['upload']['count'], 0)
+
+    def test_disabled(self):
+        self.assertIsNone(run(False).profile)
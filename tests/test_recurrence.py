@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+
+"""Accuracy of the phase-recurrence kernels against the direct `total` kernel."""
+
+
+import unittest
+
+import numpy as np
+
+from .helpers import helical_tracks, requires_opencl, spectrum
+
+
+@requires_opencl
+class TestPhaseRecurrence(unittest.TestCase):
+    """Compare 'phaseRecurrence' with the per-omega sin/cos kernel."""
+
+    def _spectrum(self, mode, dtype, features, omegaBlock=8, **kwargs):
+        calc = spectrum(helical_tracks(), (61, 7, 3), mode, 'broad', dtype=dtype, Features=features,
+                        omegaBlock=omegaBlock, **kwargs)
+        return calc.Data['radiation']['total']
+
+    def _compare(self, mode, dtype, rtol, **kwargs):
+        ref = self._spectrum(mode, dtype, [], **kwargs)
+        for omegaBlock in (1, 8, 13, 64):
+            res = self._spectrum(mode, dtype, ['phaseRecurrence'], omegaBlock, **kwargs)
+            err = np.abs(res - ref).max() / np.abs(ref).max()
+            self.assertLess(err, rtol, f"{mode}/{dtype}/omegaBlock={omegaBlock}")
+
+    def test_far_double(self):
+        self._compare('far', 'double', 1e-12)
+
+    def test_far_float(self):
+        self._compare('far', 'float', 1e-5)
+
+    def test_far_snapshots(self):
+        self._compare('far', 'double', 1e-12, nSnaps=3, it_range=(0, 900))
+
+    def test_near_double(self):
+        self._compare('near', 'double', 1e-12)
+
+    def test_near_float(self):
+        self._compare('near', 'float', 1e-5)
+
+    def test_requires_linear_grid(self):
+        from fourier_radiator import RadiationConfig
+
+        with self.assertRaises(ValueError):
+            RadiationConfig({'grid': [(0.01, 1.), (0, 0.1), (0, 1.), (8, 2, 2)],
+                             'Features': ['logGrid', 'phaseRecurrence']})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+
+"""Out-of-core grid tiling (gridTiles / deviceMemoryFraction / tileOutput)."""
+
+
+import tempfile
+import unittest
+
+import numpy as np
+
+from .helpers import AXES, helical_tracks, radiator, requires_opencl, spectrum
+
+
+NODES = (40, 9, 6)
+
+
+def calculator(**args):
+    return radiator(NODES, axes='broad', **args)
+
+
+def spectra(calc, tracks):
+    return spectrum(tracks, calc=calc, accumulate=False, nSnaps=3, it_range=(0, 650)).Data['radiation']
+
+
+@requires_opencl
+class TestTiling(unittest.TestCase):
+
+    def setUp(self):
+        self.tracks = helical_tracks(Np=3, Nt=600)
+
+    def test_forced_tiles_on_disk(self):
+        ref = spectra(calculator(components='cartesian'), self.tracks)
+        with tempfile.TemporaryDirectory() as tmp:
+            res = spectra(calculator(components='cartesian', gridTiles=4, tileOutput=tmp), self.tracks)
+            for key in ref:
+                np.testing.assert_allclose(res[key], ref[key], rtol=1e-12)
+                np.testing.assert_array_equal(np.load(f'{tmp}/{key}.npy'), res[key])
+
+    def test_auto_tiles_from_device_memory(self):
+        from fourier_radiator.tiling import plan_tiles
+
+        calc = calculator()
+        # 显存预算只够放下约一半的谱（另加轨迹缓冲）
+        device = calc.env.get_context().devices[0]
+        spectrum_bytes = 3 * 8 * 40 * 9 * 6
+        track_bytes = 2 * 6 * 8 * 600
+        calc.config.get_args()['deviceMemoryFraction'] = (spectrum_bytes / 2 + track_bytes) / device.global_mem_size
+
+        axis, bounds = plan_tiles(calc.config, calc.env, 3, track_bytes)
+        self.assertEqual(axis, 'omega')
+        self.assertGreaterEqual(len(bounds), 4)  # 两块同时存在，每块不超过预算的一半
+
+        np.testing.assert_allclose(spectra(calc, self.tracks)['total'],
+                                   spectra(calculator(), self.tracks)['total'], rtol=1e-12)
+
+    def test_invalid(self):
+        from fourier_radiator import RadiationConfig
+
+        for args in ({'gridTiles': 0}, {'deviceMemoryFraction': 1.5}):
+            with self.assertRaises(ValueError):
+                RadiationConfig(dict(args, grid=AXES['broad']['far'] + [NODES]))
+
+
+if __name__ == '__main__':
+    unittest.main()
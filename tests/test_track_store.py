@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+
+"""Round trip of the memory-mapped TrackStore and its use in calculate_spectrum."""
+
+
+import tempfile
+import unittest
+
+import numpy as np
+
+from fourier_radiator import TrackStore
+
+from .helpers import helical_tracks, spectrum
+
+
+class TestTrackStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.tracks = helical_tracks(Np=5, Nt=300)
+        self.store = TrackStore.write(self.tmp.name, iter(self.tracks))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_round_trip(self):
+        store = TrackStore(self.tmp.name)
+        self.assertEqual(len(store), len(self.tracks))
+        for track, stored in zip(self.tracks, store):
+            for a, b in zip(track[:6], stored[:6]):
+                np.testing.assert_array_equal(a, b)
+                self.assertIsInstance(b, np.memmap)
+            self.assertEqual(track[6], stored[6])
+            self.assertEqual(track[7], stored[7])
+
+    def test_rank_slicing(self):
+        view = self.store[:4][1::2]
+        self.assertEqual(len(view), 2)
+        np.testing.assert_array_equal(view[1][0], self.tracks[3][0])
+        np.testing.assert_array_equal(view.weights, [self.tracks[1][6], self.tracks[3][6]])
+
+    def test_calculate_spectrum(self):
+        def total(tracks):
+            return spectrum(tracks, (16, 4, 2), axes='broad', ctx='host', Np_max=4).Data['radiation']['total']
+
+        np.testing.assert_allclose(total(self.store), total(self.tracks), rtol=1e-12)
+
+
+if __name__ == '__main__':
+    unittest.main()